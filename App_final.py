@@ -1,78 +1,171 @@
 
 import streamlit as st
-import sqlite3
-import random
 import os
+import time
 from dotenv import load_dotenv
-from openai import OpenAI
+import import_timer
+import app_config
+
+# exams.toml の [app]（採点の接続先・スレッド数・キャッシュの大きさ）を環境変数に反映する
+# （各モジュールは import したときに環境変数を読むので、import より前に行う）
+app_config.apply_app_settings()
+
+# 起動時の import 時間を計測してログに出す（python -X importtime と同じ形式。プロセスで最初の実行だけ）
+# openai と plotly は重いので、ここでは読み込まず、採点やメーターで初めて必要になったときに読み込む
+with import_timer.measure_startup():
+    import grading
+    import grading_cache
+    import prescorer
+    import assets
+    import results_store
+    import adaptive
+    import llm_client
+    import grading_queue
+    import grading_worker
+    import grading_prompts
+    import session_packs
+    import question_bank
+    import session_store
+    import graders
 
 # --- 設定 ---
-# データベースパスの統一
-DB_PATH = os.path.join(os.path.dirname(__file__), "quiz_ver2.db")
-
-# OpenAI APIキーの読み込み
-client = OpenAI(api_key=st.secrets["OPENAI_API_KEY"])
-
-# 選択式クイズのデータをSQLiteから取得する関数
-def get_quiz_data():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT question, option1, option2, option3, answerIndex FROM quiz")
-    data = cursor.fetchall()
-    conn.close()
-    return [
-        {"question": row[0], "options": [row[1], row[2], row[3]], "answerIndex": row[4]} for row in data
-    ]
-
-# 自由記述式クイズのデータをSQLiteから取得する関数
-def fetch_openai_question():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT question_text, model_answer FROM questions")
-    rows = cursor.fetchall()
-    conn.close()
-    if rows:
-        row = random.choice(rows)
-        return {"question_text": row[0], "model_answer": row[1]}
-    return None
-
-# OpenAI APIに自由記述の採点を依頼する関数
-def get_score_and_feedback(question, model_answer, user_answer):
-    prompt = f"""
-    あなたは世界で有数のリフォームの専門家であり、先生です。
-    「{question}」という質問に対する模範解答は、「{model_answer}」ですが、
-    あなたの生徒が「{user_answer}」と回答しました。
-    模範解答との類似性を採点基準としてこの回答に点数（100点満点）と具体的な改善点をポイント別に整理してアドバイスをください。
-    出力形式: 
-    点数: xx点
-    アドバイス: xxx
-    """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
+# 試験（DB・問題数・配点・API キーの読み込み元）は exams.toml から URL の ?exam=<名前> で選ぶ
+# 1つのプロセスで複数の試験を出しても、問題バンク・採点プール・接続プールは共有される
+try:
+    EXAM = app_config.exam(st.query_params.get("exam"))
+except ValueError as e:
+    st.error(str(e))
+    st.stop()
+DB_PATH = EXAM["db_path"]
+
+# 採点結果をポーリングする間隔（秒）
+GRADING_POLL_INTERVAL = 0.5
+# 「後で採点」に回した回答の結果を確認する間隔（秒）
+GRADE_LATER_POLL_INTERVAL = 2.0
+
+# OpenAIクライアント（初めて採点するときに openai を読み込んで作り、プロセス内で共有する）
+# 接続先は GRADING_BACKEND で切り替える（stub なら同梱のローカルスタブ、詳しくは llm_client.py）
+# API キーは試験の secrets の設定に従って st.secrets または .env（環境変数）から読む
+@st.cache_resource
+def get_client(secrets="streamlit"):
+    if secrets == "dotenv":
+        load_dotenv()
+        return llm_client.create_client(lambda: os.environ["OPENAI_API_KEY"])
+    return llm_client.create_client(lambda: st.secrets["OPENAI_API_KEY"])
+
+def exam_client():
+    return get_client(EXAM["secrets"])
+
+# 出題セット（選択式＋自由記述1問）の作り置きを始める（バックグラウンドのスレッドが DB から作る）
+session_packs.start(DB_PATH, EXAM["quiz_count"])
+
+# 採点プロンプトのバージョン（プロンプトを変えたら上げて、古い採点キャッシュを使わないようにする）
+PROMPT_VERSION = grading_prompts.PROMPT_VERSION
+
+# 試験モード: 自由記述は即時に採点せず、採点キューに積んで採点ワーカーがまとめて採点する
+# （EXAM_MODE=1 で常に、または URL に ?mode=exam を付けたときに有効）
+EXAM_MODE = os.getenv("EXAM_MODE", "") == "1"
+# 採点キューを処理するワーカー: inprocess = このアプリの中のスレッド / external = 別プロセス（grading_worker.py）
+GRADING_WORKER = os.getenv("GRADING_WORKER", "inprocess")
+
+def exam_mode():
+    return EXAM_MODE or st.query_params.get("mode") == "exam"
+
+# 採点キューのワーカーを（まだ動いていなければ）このプロセス内で起動する
+def ensure_grading_worker():
+    if GRADING_WORKER == "inprocess":
+        grading_worker.start_thread(DB_PATH, exam_client)
+
+# 試験の採点器（exams.toml の grader）: openai = LLM / local = CPU だけのローカル採点（詳しくは graders.py）
+# LLM はストリーミングで呼び出し、届いた文章の断片を順に返す（点数の行が先頭に来る）
+# 期限・再試行・レート制限・サーキットブレーカーは llm_client.stream_chat が受け持つ
+def get_grader(name=None):
+    return graders.get(name or EXAM["grader"], DB_PATH, exam_client)
+
+# ローカルの採点器でその場で採点する（待ち時間も費用もかからない）
+def grade_locally(question_data, user_answer):
+    return "".join(get_grader("local").grade(
+        question_data["id"], question_data["question_text"], question_data["model_answer"], user_answer
+    ))
+
+# LLM で採点してキャッシュに保存する関数（ワーカースレッドで実行される）
+def grade_and_cache(question_data, user_answer):
+    chunks = []
+    for chunk in get_grader().grade(
+        question_data["id"],
+        question_data["question_text"],
+        question_data["model_answer"],
+        user_answer,
+    ):
+        chunks.append(chunk)
+        yield chunk
+    feedback = "".join(chunks)
+    grading_cache.put(
+        question_data["id"], question_data["model_answer"], PROMPT_VERSION,
+        user_answer, grading.parse_score(feedback), feedback
+    )
+    return feedback
+
+# 自由記述の採点（100点満点）を試験の配点に換算する
+def free_score(score):
+    return round(score * EXAM["free_points"] / 100)
+
+# 採点結果をセッションに反映し、受講結果として記録する関数（試験の配点に換算）
+def finish_grading(feedback, user_answer):
+    score = grading.parse_score(feedback)
+    st.session_state.openai_score = free_score(score) if score is not None else 0
+    st.session_state.feedback = feedback
+    st.session_state.openai_done = True
+    st.session_state.grading_job = None
+    st.session_state.pending_grade = None
+    checkpoint("openai_score", "feedback", "openai_done", "grading_job", "pending_grade")
+    results_store.record_answer(
+        DB_PATH, st.session_state.attempt_id, st.session_state.branch, "free",
+        st.session_state.free_question_id, answer_text=user_answer, score=score
+    )
+    results_store.finish_attempt(
+        DB_PATH, st.session_state.attempt_id, quiz_score(), st.session_state.openai_score,
+        EXAM["max_score"], EXAM["pass_score"]
     )
-    return response.choices[0].message.content
 
-# --- セッションステートの初期化（状態管理） ---
-if 'current_question' not in st.session_state:
-    st.session_state.current_question = 0
-if 'score_quiz' not in st.session_state:
-    st.session_state.score_quiz = 0
-if 'quiz_order' not in st.session_state:
-    quiz_data = get_quiz_data()
-    st.session_state.quiz_order = random.sample(quiz_data, min(8, len(quiz_data)))
-if 'answered' not in st.session_state:
-    st.session_state.answered = False
-if 'openai_done' not in st.session_state:
-    st.session_state.openai_done = False
-if 'openai_score' not in st.session_state:
-    st.session_state.openai_score = 0
-if 'show_result' not in st.session_state:
-    st.session_state.show_result = False
-if 'feedback' not in st.session_state:
-    st.session_state.feedback = None
-if 'question_data' not in st.session_state:
-    st.session_state.question_data = fetch_openai_question()
+# 受講の途中経過のうち、変わった値だけを保存する（再読み込みや再起動のあとに再開できるように）
+def checkpoint(*keys):
+    session_store.save(DB_PATH, st.session_state.resume_token, {key: st.session_state[key] for key in keys})
+
+# 選択式クイズの得点（正解した問題のビットを数えて、1問あたりの配点を掛ける）
+def quiz_score():
+    return bin(st.session_state.correct_bits).count("1") * EXAM["quiz_points"]
+
+# 総合得点のメーター（ゲージ）を作る関数
+def score_gauge(total_score):
+    go = import_timer.lazy_import("plotly.graph_objects")
+    return go.Figure(go.Indicator(
+        mode = "gauge+number+delta",
+        value = total_score,  # 合計得点
+        number = {"suffix": "点", "font": {"size": 60}},  # メーター下に「点」付きで表示
+        domain = {'x': [0, 1], 'y': [0, 1]},
+        gauge = {
+            'axis': {'range': [0, EXAM["max_score"]]},  # 軸の範囲（0から満点）
+            'bar': {'color': "#EF4123"},  # バーの色
+            'bgcolor': "white",  # 背景色
+            'borderwidth': 2,  # 枠の幅
+            'bordercolor': "#FFB6C1",
+            'steps': [
+                {'range': [0, EXAM["near_score"]], 'color': "white"},   # 「惜しい」未満は白
+                {'range': [EXAM["near_score"], EXAM["pass_score"]], 'color': "white"},  # 「惜しい」〜合格点は白
+                {'range': [EXAM["pass_score"], EXAM["max_score"]], 'color': "#FFB6C1"}  # 合格点以上は薄い赤
+            ]
+        }
+    ))
+
+# 採点の文章をストリーミング表示しながら、点数の行が届いた時点でメーターを先に描く
+def stream_feedback(job, gauge_slot):
+    gauge_drawn = False
+    for chunk in grading.follow(job):
+        if not gauge_drawn and job.score is not None:
+            gauge_slot.plotly_chart(score_gauge(quiz_score() + free_score(job.score)))
+            gauge_drawn = True
+        yield chunk
 
 # --- ユーザーインターフェースの表示開始 ---
 
@@ -152,26 +245,78 @@ st.markdown("""
 col1, col2 = st.columns([8, 1])
 
 with col1:
-    st.markdown('<div class="big-title">TGK<br>Teacherアプリ</div>', unsafe_allow_html=True)
+    st.markdown(f'<div class="big-title">{EXAM["title"]}</div>', unsafe_allow_html=True)
 
 with col2:
-    st.image("logo.png",  use_container_width=True)
+    assets.show_image(st, "logo", alt="logo")
 
 # FVを挿入するセクション
 cols = st.columns([1, 2, 1])
 with cols[1]:
-    st.image("FV.png", width=600)
+    assets.show_image(st, "FV", alt="TGK Teacher", width=600)
     
-# 初期化
+# 初期化（トップページでは DB に触れない。受講の状態はボタンが押されてから作る）
+# URL に再開用のトークン（?resume=...）があれば、保存しておいた途中経過から再開する
 if "started" not in st.session_state:
     st.session_state.started = False
+    token = st.query_params.get("resume")
+    saved = session_store.load(DB_PATH, token) if token else None
+    if saved is not None:
+        st.session_state.update(saved, started=True, resume_token=token)
+        # 採点に出した回答は入力欄に戻す
+        st.session_state.free_answer = saved["grading_answer"] or ""
+    elif token:
+        st.query_params.pop("resume", None)
+
+# --- セッションステートの初期化（状態管理） ---
+# 問題そのものはセッションに持たず ID だけを持つ（中身は表示するときに question_bank から引く）
+# 選択式の正誤は i 問目が正解なら i ビット目を立てた整数 correct_bits で持つ
+def init_session(pack):
+    st.session_state.current_question = 0
+    st.session_state.correct_bits = 0
+    st.session_state.answered = False
+    st.session_state.openai_done = False
+    st.session_state.openai_score = 0
+    st.session_state.show_result = False
+    st.session_state.feedback = None
+    st.session_state.grading_job = None
+    st.session_state.pending_grade = None
+    st.session_state.grading_answer = None
+    st.session_state.quiz_ids = pack["quiz"]
+    st.session_state.free_question_id = pack["free"]
 
 # コールバック関数：ボタンが押されたときに呼ばれる
+# 受講の記録もここで開始する（書き込みはバックグラウンドで行われる）
 def start_training():
     st.session_state.started = True
+    st.session_state.branch = st.session_state.branch_input.strip()
+    st.session_state.trainee = st.session_state.trainee_input.strip()
+    st.session_state.attempt_id = results_store.start_attempt(
+        DB_PATH, st.session_state.branch, st.session_state.trainee
+    )
+    if st.session_state.trainee:
+        # 名前のある受講者には、習熟度と問題の難易度に合わせてその場で選ぶ（習得済みの問題は出さない）
+        # 作り置きは受講者によらないので使わない
+        free = question_bank.random_free_question(DB_PATH)
+        pack = {
+            "quiz": tuple(q["id"] for q in adaptive.select_quiz(
+                DB_PATH, st.session_state.branch, st.session_state.trainee, EXAM["quiz_count"]
+            )),
+            "free": free["id"] if free is not None else None,
+        }
+    else:
+        # 作り置きの出題セットを1つ取り出す
+        pack = session_packs.pop(DB_PATH, EXAM["quiz_count"])
+    init_session(pack)
+    # 途中経過の保存を始め、再開用のトークンを URL に載せる（再読み込みしても URL に残る）
+    st.session_state.resume_token = session_store.create(DB_PATH, st.session_state)
+    st.query_params["resume"] = st.session_state.resume_token
 
 # 「トレーニングを始める」ボタンを表示し、押すとクイズ開始
 if not st.session_state.started:
+    # 受講結果を営業所・受講者ごとに記録するための入力欄
+    st.text_input("営業所", key="branch_input")
+    st.text_input("お名前", key="trainee_input")
     st.markdown('<div class="start-button-wrapper">', unsafe_allow_html=True)
     st.button("トレーニングを始める", key="start_button", on_click=start_training)
     st.markdown('</div>', unsafe_allow_html=True)
@@ -179,15 +324,34 @@ if not st.session_state.started:
 
 
 
-# --- 選択式クイズ（前半4問） ---
-if st.session_state.current_question <len(st.session_state.quiz_order):
-    q = st.session_state.quiz_order[st.session_state.current_question]
-    st.subheader(f"選択問題 {st.session_state.current_question + 1}/{len(st.session_state.quiz_order)}")
+# 選択式クイズと自由記述クイズはそれぞれフラグメントにして、
+# 「回答」「次の問題」「採点」を押したときはページ全体ではなくその部分だけを再実行する。
+# （CSS・ロゴ・FV 画像などの描画をクリックのたびに繰り返さない）
+
+# --- 選択式クイズ（前半。問題数は試験の設定による） ---
+# 「次の問題」ボタンのコールバック
+def next_question():
+    st.session_state.current_question += 1
+    st.session_state.answered = False
+    checkpoint("current_question", "answered")
+
+@st.fragment
+def multiple_choice_quiz():
+    # 最後の問題を終えたら、自由記述に進むためにページ全体を再実行する
+    if st.session_state.current_question >= len(st.session_state.quiz_ids):
+        st.rerun()
+    q = question_bank.get_quiz(DB_PATH, st.session_state.quiz_ids[st.session_state.current_question])
+    if q is None:
+        # 出題後に削除された問題は飛ばす
+        st.session_state.current_question += 1
+        checkpoint("current_question")
+        st.rerun()
+    st.subheader(f"選択問題 {st.session_state.current_question + 1}/{len(st.session_state.quiz_ids)}")
     
     # 進捗バーと進捗状況表示
-    progress = (st.session_state.current_question + 1) / len(st.session_state.quiz_order)
+    progress = (st.session_state.current_question + 1) / len(st.session_state.quiz_ids)
     st.progress(progress)  # 進捗バーを表示 
-    remaining_questions = len(st.session_state.quiz_order) - st.session_state.current_question
+    remaining_questions = len(st.session_state.quiz_ids) - st.session_state.current_question
     st.write(f"残り {remaining_questions} 問！")
     
     st.write(q["question"])
@@ -196,102 +360,201 @@ if st.session_state.current_question <len(st.session_state.quiz_order):
     if st.button("回答", key=f"submit{st.session_state.current_question}") and not st.session_state.answered:
         correct = q["options"][q["answerIndex"]]
         if selected == correct:
-            st.success("正解！ +10点")
-            st.session_state.score_quiz += 10
+            st.success(f"正解！ +{EXAM['quiz_points']}点")
+            st.session_state.correct_bits |= 1 << st.session_state.current_question
         else:
             st.error(f"不正解！ 正解は: {correct}")
         st.session_state.answered = True
+        checkpoint("correct_bits", "answered")
+        # 解答を記録する（キューに積むだけなので「回答」の応答は遅くならない）
+        results_store.record_answer(
+            DB_PATH, st.session_state.attempt_id, st.session_state.branch, "choice", q["id"],
+            selected_index=q["options"].index(selected), correct=selected == correct
+        )
 
     if st.session_state.answered:
-        st.button("次の問題", on_click=lambda: st.session_state.update({
-            "current_question": st.session_state.current_question + 1,
-            "answered": False
-        }))
+        st.button("次の問題", on_click=next_question)
 
 # --- 自由記述式クイズ ---
-elif not st.session_state.openai_done:
+@st.fragment
+def free_text_quiz():
     st.subheader("自由記述問題")
-    question_data = st.session_state.question_data
+    question_data = question_bank.get_free(DB_PATH, st.session_state.free_question_id)
+    if question_data is None:
+        # 出題後に削除された（または問題が無かった）ときは別の問題を出す
+        question_data = question_bank.random_free_question(DB_PATH)
+        if question_data is None:
+            st.error("自由記述問題が登録されていません。")
+            st.stop()
+        st.session_state.free_question_id = question_data["id"]
+        checkpoint("free_question_id")
     st.write("以下の質問に答えてください：")
     st.markdown(f"**{question_data['question_text']}**")
-    user_input = st.text_area("あなたの回答を記入してください")
-
-    if st.button("採点"):
-        with st.spinner("OpenAIで採点中..."):
-            feedback = get_score_and_feedback(
-                question_data["question_text"],
-                question_data["model_answer"],
-                user_input
+    # 長すぎる回答は採点に時間と費用がかかるので、入力できる文字数を制限する
+    user_input = st.text_area(
+        "あなたの回答を記入してください", max_chars=grading_prompts.MAX_ANSWER_CHARS or None, key="free_answer"
+    )
+
+    # 採点中に再読み込み・再起動された場合: 同じプロセスで採点が続いていればそのジョブを待つ。
+    # ジョブが見つからなければ（別のプロセスだった、または結果を受け取る前に破棄された）、
+    # 採点が済んでいればキャッシュから結果を使い、済んでいなければ「後で採点」に回す（二重に採点しない）
+    if st.session_state.grading_job is not None and grading.get_job(st.session_state.grading_job) is None:
+        st.session_state.grading_job = None
+    if (st.session_state.grading_answer is not None and st.session_state.grading_job is None
+            and st.session_state.pending_grade is None):
+        cached = grading_cache.get(
+            question_data["id"], question_data["model_answer"], PROMPT_VERSION, st.session_state.grading_answer
+        )
+        if cached is not None:
+            finish_grading(cached["feedback"], st.session_state.grading_answer)
+            st.rerun()
+        st.session_state.pending_grade = grading_queue.enqueue(
+            DB_PATH, st.session_state.attempt_id, st.session_state.branch, question_data,
+            st.session_state.grading_answer
+        )
+        checkpoint("pending_grade")
+
+    # 採点は共有ワーカープールに投げ、このスクリプトは結果が出るまでポーリングする
+    if st.session_state.pending_grade is not None:
+        # 採点キューに積んだ回答（試験モード、またはすぐに採点できなかった回答）が採点されるのを待つ
+        ensure_grading_worker()
+        item = grading_queue.get(DB_PATH, st.session_state.pending_grade)
+        if item is None or item["status"] == "error":
+            st.error("採点に失敗しました。もう一度お試しください。")
+            st.session_state.pending_grade = None
+            st.session_state.grading_answer = None
+            checkpoint("pending_grade", "grading_answer")
+        elif item["status"] == "done":
+            finish_grading(item["feedback"], item["answer_text"])
+            st.rerun()
+        else:
+            position = grading_queue.position(DB_PATH, item["id"])
+            if exam_mode():
+                st.info(f"回答を受け付けました。採点が終わるとここに結果が表示されます（採点待ち: あと {position} 件）")
+            else:
+                st.info(f"ただいま採点が混み合っています。回答は保存済みで、順番に採点されます（あと {position} 件）")
+            time.sleep(GRADE_LATER_POLL_INTERVAL)
+            st.rerun(scope="fragment")
+    elif st.session_state.grading_job is None:
+        if st.button("採点"):
+            # 空欄や模範解答とほぼ同じ回答などはローカルで即座に採点する
+            local_feedback = prescorer.get_prescorer(DB_PATH).prescore(user_input, question_data["model_answer"])
+            # 同じ問題への同じ回答はキャッシュから即座に返す
+            cached = None
+            if local_feedback is None:
+                cached = grading_cache.get(
+                    question_data["id"], question_data["model_answer"], PROMPT_VERSION, user_input
+                )
+            if local_feedback is not None:
+                finish_grading(local_feedback, user_input)
+            elif cached is not None:
+                finish_grading(cached["feedback"], user_input)
+            elif not get_grader().remote:
+                # ローカルの採点器はその場で採点する（試験モードでもキューには積まない）
+                finish_grading(grade_locally(question_data, user_input), user_input)
+            elif exam_mode():
+                # 試験モードではその場で採点せず、採点キューに積んでまとめて採点する
+                st.session_state.pending_grade = grading_queue.enqueue(
+                    DB_PATH, st.session_state.attempt_id, st.session_state.branch, question_data, user_input, "exam"
+                )
+                st.session_state.grading_answer = user_input
+                checkpoint("pending_grade", "grading_answer")
+                ensure_grading_worker()
+                st.rerun(scope="fragment")
+            else:
+                st.session_state.grading_job = grading.submit(grade_and_cache, question_data, user_input)
+                st.session_state.grading_answer = user_input
+                checkpoint("grading_job", "grading_answer")
+                st.rerun(scope="fragment")
+            # 採点が確定したら結果ページを表示するためにページ全体を再実行する
+            st.rerun()
+    else:
+        job = grading.get_job(st.session_state.grading_job)
+        unavailable = job is not None and isinstance(job.error, llm_client.GradingUnavailable)
+        if unavailable and EXAM["grader_fallback"] == "local":
+            # LLM で採点できない（ネットワークが無い・採点サービスが止まっている）ので、ローカルで採点する
+            grading.discard(job.id)
+            finish_grading(grade_locally(question_data, user_input), user_input)
+            st.rerun()
+        elif unavailable:
+            # 再試行しても採点できなかった（または採点サービスが止まっている）ので「後で採点」に回す
+            grading.discard(job.id)
+            st.session_state.grading_job = None
+            st.session_state.pending_grade = grading_queue.enqueue(
+                DB_PATH, st.session_state.attempt_id, st.session_state.branch, question_data, user_input
             )
-            import re
-            score_match = re.search(r"点数[:：]?\s*(\d+)", feedback)
-            if score_match:
-                score = min(int(score_match.group(1)), 100)
-                converted_score = round(score * 0.2)
-                st.session_state.openai_score = converted_score
+            checkpoint("grading_job", "pending_grade")
+            ensure_grading_worker()
+            st.rerun(scope="fragment")
+        elif job is None or job.status == "error":
+            # 採点に失敗した場合はもう一度「採点」を押せるように戻す
+            st.error("採点に失敗しました。もう一度お試しください。")
+            grading.discard(st.session_state.grading_job)
+            st.session_state.grading_job = None
+            st.session_state.grading_answer = None
+            checkpoint("grading_job", "grading_answer")
+        elif job.status == "queued":
+            position = grading.queue_position(job.id)
+            if position:
+                st.info(f"採点待ち… あと {position} 件")
             else:
-                st.session_state.openai_score = 0
-            st.session_state.feedback = feedback
-            st.session_state.openai_done = True
-
-import streamlit as st
-import plotly.graph_objects as go
+                st.info("OpenAIで採点中...")
+            time.sleep(GRADING_POLL_INTERVAL)
+            st.rerun(scope="fragment")
+        else:
+            # 採点が始まったら文章を届いた順に表示する
+            st.markdown("### 採点結果")
+            gauge_slot = st.empty()
+            st.write_stream(stream_feedback(job, gauge_slot))
+            if job.status == "error":
+                st.rerun(scope="fragment")
+            feedback = job.result
+            grading.discard(job.id)
+            finish_grading(feedback, user_input)
+            st.rerun()
+
+if st.session_state.current_question < len(st.session_state.quiz_ids):
+    multiple_choice_quiz()
+elif not st.session_state.openai_done:
+    free_text_quiz()
 
 # --- 採点結果 & 総合評価ボタン ---
 if st.session_state.openai_done:
     st.markdown("### 採点結果")
     st.write(st.session_state.feedback)
-    total_score = st.session_state.score_quiz + st.session_state.openai_score
+    total_score = quiz_score() + st.session_state.openai_score
     st.header("🎉 結果発表 🎉")
-    st.write(f"選択式クイズ: {st.session_state.score_quiz} / 80点")
-    st.write(f"自由記述クイズ: {st.session_state.openai_score} / 20点")
-    st.subheader(f"総合得点: {total_score} / 100点")
-
-    # --- メーター（ゲージ）表示 ---
-    fig = go.Figure(go.Indicator(
-        mode = "gauge+number+delta",
-        value = total_score,  # 合計得点
-        number = {"suffix": "点", "font": {"size": 60}},  # メーター下に「点」付きで表示
-        domain = {'x': [0, 1], 'y': [0, 1]},
-        gauge = {
-            'axis': {'range': [0, 100]},  # 軸の範囲（0から100）
-            'bar': {'color': "#EF4123"},  # バーの色
-            'bgcolor': "white",  # 背景色
-            'borderwidth': 2,  # 枠の幅
-            'bordercolor': "#FFB6C1",
-            'steps': [
-                {'range': [0, 60], 'color': "white"},   # 60点未満は白
-                {'range': [60, 80], 'color': "white"},  # 60〜80点は白
-                {'range': [80, 100], 'color': "#FFB6C1"}  # 80点以上は薄い赤
-            ]
-        }
-    ))
+    st.write(f"選択式クイズ: {quiz_score()} / {EXAM['quiz_max']}点")
+    st.write(f"自由記述クイズ: {st.session_state.openai_score} / {EXAM['free_points']}点")
+    st.subheader(f"総合得点: {total_score} / {EXAM['max_score']}点")
 
     # メーターをStreamlitに表示
-    st.plotly_chart(fig)
+    st.plotly_chart(score_gauge(total_score))
 
-    # 合格点80点のラインを強調
-    st.markdown("### 合格点ライン: 80点")
+    # 合格点のラインを強調
+    st.markdown(f"### 合格点ライン: {EXAM['pass_score']}点")
     st.markdown("合格点ラインを超えると、合格となります。")
 
     # 結果に応じたメッセージを表示
-    if total_score >= 80:
+    if total_score >= EXAM["pass_score"]:
         st.success("✅ 合格！おめでとうございます！")
-    elif total_score >= 60:
+    elif total_score >= EXAM["near_score"]:
         st.warning("⚠️ 惜しい！もう少し！")
     else:
         st.error("📚 もっと勉強しよう！")
 
     # 得点に応じたコメント
-    if total_score >= 80:
+    if total_score >= EXAM["pass_score"]:
         st.markdown('<div style="color: green; font-size: 1.5em; text-align: center;">🎉 合格！おめでとうございます！</div>', unsafe_allow_html=True)
-    elif total_score >= 60:
+    elif total_score >= EXAM["near_score"]:
         st.markdown('<div style="color: orange; font-size: 1.5em; text-align: center;">⚠️ 惜しい！もう少し！</div>', unsafe_allow_html=True)
     else:
         st.markdown('<div style="color: red; font-size: 1.5em; text-align: center;">📚 もっと勉強しよう！</div>', unsafe_allow_html=True)
 
     # 「TOPページに戻る」ボタン
     if st.button("TOPページに戻る"):
+        session_store.delete(DB_PATH, st.session_state.resume_token)
+        st.query_params.pop("resume", None)
         for key in st.session_state.keys():
             del st.session_state[key]
         st.rerun()
@@ -0,0 +1,189 @@
+
+# 適応的な出題: 問題ごとの難易度と受講者ごとの習熟度（Elo 方式）に合わせて選択式問題を選ぶ
+# 統計は解答ログから毎回集計し直すのではなく、解答を書き込むたびに集計テーブルを更新する
+# （results_store の書き込みスレッドから update_stats が呼ばれる）。
+# 出題は難易度のインデックスを使って目標の難易度の前後だけを読むので、問題数 N に対して O(k log N)。
+import math
+import random
+import sqlite3
+
+import db
+import question_bank
+
+# 正答率がこのくらいになる難易度の問題を選ぶ（易しすぎず難しすぎない）
+TARGET_CORRECT_RATE = 0.7
+# 連続でこの回数正解した問題は習得済みとして出題しない
+MASTERY_STREAK = 2
+# Elo の更新幅（解答数が増えるほど小さくする）
+K_USER = 0.4
+K_ITEM = 0.4
+# 出題の一部はランダムに選び、まだ解かれていない問題の統計も集める
+EXPLORE_RATE = 0.25
+# 目標の難易度からこの幅（rating の差）以内の問題から無作為に選ぶ（毎回同じ問題にならないように）
+RATING_WINDOW = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS item_stats (
+    question_id INTEGER PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    rating REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_item_stats_rating ON item_stats(rating);
+CREATE TABLE IF NOT EXISTS user_ability (
+    tenant TEXT NOT NULL,
+    trainee TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rating REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant, trainee)
+);
+CREATE TABLE IF NOT EXISTS user_mastery (
+    tenant TEXT NOT NULL,
+    trainee TEXT NOT NULL,
+    question_id INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    streak INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant, trainee, question_id)
+);
+"""
+
+
+def _expected(ability, difficulty):
+    return 1 / (1 + math.exp(difficulty - ability))
+
+
+def _row(conn, sql, params, default):
+    row = conn.execute(sql, params).fetchone()
+    return row if row is not None else default
+
+
+# 選択式の解答1件ぶん、難易度・能力・習熟度を更新する（書き込みトランザクションの中で呼ぶ）
+def update_stats(conn, tenant, trainee, question_id, correct):
+    correct = 1 if correct else 0
+    item_attempts, difficulty = _row(
+        conn, "SELECT attempts, rating FROM item_stats WHERE question_id = ?", (question_id,), (0, 0.0)
+    )
+    named = bool(trainee)
+    user_attempts, ability = (0, 0.0)
+    if named:
+        user_attempts, ability = _row(
+            conn, "SELECT attempts, rating FROM user_ability WHERE tenant = ? AND trainee = ?",
+            (tenant, trainee), (0, 0.0)
+        )
+    surprise = correct - _expected(ability, difficulty)
+    difficulty -= K_ITEM / (1 + item_attempts / 20) * surprise
+    conn.execute(
+        "INSERT INTO item_stats (question_id, attempts, correct, rating) VALUES (?, 1, ?, ?)"
+        " ON CONFLICT(question_id) DO UPDATE SET"
+        " attempts = attempts + 1, correct = correct + excluded.correct, rating = excluded.rating",
+        (question_id, correct, difficulty),
+    )
+    if not named:
+        return
+    ability += K_USER / (1 + user_attempts / 50) * surprise
+    conn.execute(
+        "INSERT INTO user_ability (tenant, trainee, attempts, rating) VALUES (?, ?, 1, ?)"
+        " ON CONFLICT(tenant, trainee) DO UPDATE SET attempts = attempts + 1, rating = excluded.rating",
+        (tenant, trainee, ability),
+    )
+    conn.execute(
+        "INSERT INTO user_mastery (tenant, trainee, question_id, attempts, correct, streak) VALUES (?, ?, ?, 1, ?, ?)"
+        " ON CONFLICT(tenant, trainee, question_id) DO UPDATE SET"
+        " attempts = attempts + 1, correct = correct + excluded.correct,"
+        " streak = CASE WHEN excluded.correct THEN streak + 1 ELSE 0 END",
+        (tenant, trainee, question_id, correct, correct),
+    )
+
+
+# 受講者の能力に合った選択式問題を k 問選ぶ（統計がまだ無ければランダム）
+# 名前のある受講者には、習得済みの問題を出さない（ランダムに選ぶ分も含む。ほかに出せる問題が無いときだけ出す）
+def select_quiz(db_path, tenant, trainee, k):
+    tenant = tenant or ""
+    n_explore = max(1, round(k * EXPLORE_RATE))
+    try:
+        ids = _select_ids(db_path, tenant, trainee, k - n_explore)
+    except sqlite3.OperationalError:
+        # 統計テーブルがまだ作られていない（まだ誰も解答していない）
+        ids = []
+    chosen = question_bank.get_quiz_by_ids(db_path, ids)
+    # 残りはランダムに選ぶ（未出題の問題を含めるため）
+    seen = {q["id"] for q in chosen}
+    # 名前のある受講者は、習得済みを除いても足りるよう多めに引く
+    extra = k * 2 if trainee else 0
+    sampled = [q for q in question_bank.sample_quiz(db_path, k + len(seen) + extra) if q["id"] not in seen]
+    mastered = _mastered(db_path, tenant, trainee, [q["id"] for q in sampled])
+    fill = [q for q in sampled if q["id"] not in mastered]
+    if mastered and len(chosen) + len(fill) < k:
+        # 引いた問題のほとんどが習得済みだった: 習得済みでない問題を DB から直接探す
+        ids = _unmastered_ids(db_path, tenant, trainee, seen | {q["id"] for q in fill}, k - len(chosen) - len(fill))
+        fill += question_bank.get_quiz_by_ids(db_path, ids)
+    # それでも足りなければ習得済みの問題で埋める
+    fill += [q for q in sampled if q["id"] in mastered]
+    for q in fill:
+        if len(chosen) >= k:
+            break
+        if q["id"] not in seen:
+            chosen.append(q)
+            seen.add(q["id"])
+    random.shuffle(chosen)
+    return chosen
+
+
+# ids のうち、受講者が習得済みの問題の ID（名前の無い受講者は習熟度を記録しないので空）
+def _mastered(db_path, tenant, trainee, ids):
+    if not trainee or not ids:
+        return set()
+    placeholders = ",".join("?" * len(ids))
+    try:
+        with db.read(db_path) as conn:
+            return {
+                row[0] for row in conn.execute(
+                    f"SELECT question_id FROM user_mastery WHERE tenant = ? AND trainee = ? AND streak >= ?"
+                    f" AND question_id IN ({placeholders})",
+                    [tenant, trainee, MASTERY_STREAK] + list(ids),
+                )
+            }
+    except sqlite3.OperationalError:
+        return set()
+
+
+# 習得済みでも exclude でもない問題の ID をランダムに最大 k 個（テーブル全体を読むので、足りないときだけ使う）
+def _unmastered_ids(db_path, tenant, trainee, exclude, k):
+    with db.read(db_path) as conn:
+        rows = conn.execute(
+            "SELECT id FROM quiz WHERE id NOT IN (SELECT question_id FROM user_mastery"
+            " WHERE tenant = ? AND trainee = ? AND streak >= ?)",
+            (tenant, trainee, MASTERY_STREAK),
+        ).fetchall()
+    ids = [row[0] for row in rows if row[0] not in exclude]
+    return random.sample(ids, min(k, len(ids)))
+
+
+def _select_ids(db_path, tenant, trainee, k):
+    if k <= 0:
+        return []
+    with db.read(db_path) as conn:
+        ability = 0.0
+        if trainee:
+            ability = _row(
+                conn, "SELECT rating FROM user_ability WHERE tenant = ? AND trainee = ?", (tenant, trainee), (0.0,)
+            )[0]
+        # 正答率が TARGET_CORRECT_RATE になる難易度
+        target = ability - math.log(TARGET_CORRECT_RATE / (1 - TARGET_CORRECT_RATE))
+        # 習得済みを除いても k 問残るよう多めに、目標の難易度の上下から候補を取る
+        limit = k * 3
+        candidates = conn.execute(
+            "SELECT question_id, rating FROM (SELECT question_id, rating FROM item_stats WHERE rating >= ? ORDER BY rating LIMIT ?)"
+            " UNION ALL "
+            "SELECT question_id, rating FROM (SELECT question_id, rating FROM item_stats WHERE rating < ? ORDER BY rating DESC LIMIT ?)",
+            (target, limit, target, limit),
+        ).fetchall()
+    mastered = _mastered(db_path, tenant, trainee, [c[0] for c in candidates])
+    candidates = [c for c in candidates if c[0] not in mastered]
+    candidates.sort(key=lambda c: abs(c[1] - target))
+    # 幅の中の問題が少なければ、目標に近い順に 2k 問までを候補にする
+    window = [c for c in candidates if abs(c[1] - target) <= RATING_WINDOW]
+    if len(window) < k * 2:
+        window = candidates[:k * 2]
+    return [c[0] for c in random.sample(window, min(k, len(window)))]
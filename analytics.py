@@ -0,0 +1,254 @@
+
+# 受講分析の集計: 解答ログ（answers / attempts）を問題ごと・日ごとの集計テーブルにまとめる
+# 集計テーブルは results_store の書き込みスレッドが解答・受講の終了を書き込むたびに、同じトランザクションで
+# 足し込む（adaptive.update_stats と同じ）。分析画面は集計テーブルだけを読むので、解答ログが何百万件に
+# なっても表示の速さは変わらない。集計テーブルを作る前からある解答ログは、作ったときに一度だけ集計する。
+import time
+
+import db
+
+# 配点は試験ごとに違う（exams.toml）ので、総合得点は満点に対する得点率（0〜100%）で集計し、
+# 合否は受講の終了時に試験の合格点で判定した attempts.passed を数える。
+# max_score / passed の列が無かった頃の受講は、旧 App_final.py の配点（100点満点・80点で合格）とみなす
+LEGACY_MAX_SCORE = 100
+LEGACY_PASS_SCORE = 80
+# 得点の分布は SCORE_BUCKET 点（%）刻みで数える（0〜4 → b0、5〜9 → b1 … 100 → b20）
+SCORE_BUCKET = 5
+BUCKETS = [f"b{i}" for i in range(100 // SCORE_BUCKET + 1)]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS rollup_question (
+    tenant TEXT NOT NULL,
+    question_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    pick1 INTEGER NOT NULL DEFAULT 0,
+    pick2 INTEGER NOT NULL DEFAULT 0,
+    pick3 INTEGER NOT NULL DEFAULT 0,
+    scored INTEGER NOT NULL DEFAULT 0,
+    score_sum INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant, question_id, kind)
+) WITHOUT ROWID;
+-- score_sum は総合得点の得点率（%）の合計
+CREATE TABLE IF NOT EXISTS rollup_daily (
+    tenant TEXT NOT NULL,
+    day TEXT NOT NULL,
+    answers INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    passed INTEGER NOT NULL DEFAULT 0,
+    score_sum INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (tenant, day)
+) WITHOUT ROWID;
+-- 得点の分布は1日・1営業所ごとに1行（刻みごとの件数を列に持つ）。
+-- 全営業所の合計も期間で絞り込めるよう、kind と day を先頭にする
+CREATE TABLE IF NOT EXISTS rollup_score (
+    kind TEXT NOT NULL,
+    day TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    {", ".join(f"{b} INTEGER NOT NULL DEFAULT 0" for b in BUCKETS)},
+    PRIMARY KEY (kind, day, tenant)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_UPSERT_QUESTION = (
+    "INSERT INTO rollup_question (tenant, question_id, kind, answers, correct, pick1, pick2, pick3, scored, score_sum)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT(tenant, question_id, kind) DO UPDATE SET"
+    " answers = answers + excluded.answers, correct = correct + excluded.correct,"
+    " pick1 = pick1 + excluded.pick1, pick2 = pick2 + excluded.pick2, pick3 = pick3 + excluded.pick3,"
+    " scored = scored + excluded.scored, score_sum = score_sum + excluded.score_sum"
+)
+_UPSERT_DAILY = (
+    "INSERT INTO rollup_daily (tenant, day, answers, correct, attempts, passed, score_sum) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    " ON CONFLICT(tenant, day) DO UPDATE SET"
+    " answers = answers + excluded.answers, correct = correct + excluded.correct,"
+    " attempts = attempts + excluded.attempts, passed = passed + excluded.passed,"
+    " score_sum = score_sum + excluded.score_sum"
+)
+
+
+def _bucket(score):
+    return BUCKETS[max(0, min(score, 100)) // SCORE_BUCKET]
+
+
+# 得点1件を分布に足す
+def _add_score(conn, kind, day, tenant, score):
+    bucket = _bucket(score)
+    conn.execute(
+        f"INSERT INTO rollup_score (kind, day, tenant, {bucket}) VALUES (?, ?, ?, 1)"
+        f" ON CONFLICT(kind, day, tenant) DO UPDATE SET {bucket} = {bucket} + 1",
+        (kind, day, tenant),
+    )
+
+
+# 日の区切りはアプリを動かしているマシンの地方時（SQLite の date(..., 'localtime') と同じ）
+def _day(timestamp):
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+# 解答1件ぶんを集計テーブルに足し込む（書き込みトランザクションの中で呼ぶ）
+# params は results_store の "answer" と同じ順番
+def update_answer(conn, params):
+    _, tenant, kind, question_id, selected_index, correct, _, score, answered_at = params
+    picks = [1 if selected_index == i else 0 for i in range(3)]
+    correct = 1 if correct else 0
+    scored = 1 if score is not None else 0
+    conn.execute(_UPSERT_QUESTION, (tenant, question_id, kind, 1, correct, *picks, scored, score or 0))
+    conn.execute(_UPSERT_DAILY, (tenant, _day(answered_at), 1, correct, 0, 0, 0))
+    if score is not None:
+        _add_score(conn, kind, _day(answered_at), tenant, score)
+
+
+# 総合得点を満点に対する得点率（0〜100 の整数）にする
+def percent(total_score, max_score):
+    return round((total_score or 0) * 100 / (max_score or LEGACY_MAX_SCORE))
+
+
+# 受講の終了1件ぶんを足し込む（attempts を更新する前に呼ぶ。終了済みの受講は数えない）
+# params は results_store の "finish" と同じ順番
+def update_finish(conn, params):
+    finished_at, _, _, total_score, max_score, passed, attempt_id = params
+    row = conn.execute("SELECT tenant, finished_at FROM attempts WHERE id = ?", (attempt_id,)).fetchone()
+    if row is None or row[1] is not None:
+        return
+    tenant = row[0]
+    score = percent(total_score, max_score)
+    conn.execute(_UPSERT_DAILY, (tenant, _day(finished_at), 0, 0, 1, passed, score))
+    _add_score(conn, "total", _day(finished_at), tenant, score)
+
+
+# 得点率を求める SQL の式（backfill 用。percent と同じ）
+_PERCENT_SQL = f"CAST(ROUND(COALESCE(total_score, 0) * 100.0 / COALESCE(max_score, {LEGACY_MAX_SCORE})) AS INTEGER)"
+
+
+# 刻みごとの件数を数える SELECT の列: SUM(MAX(0, MIN(score, 100)) / 5 = 0), SUM(... = 1), ...
+def _bucket_counts(column):
+    return ", ".join(f"SUM(MAX(0, MIN({column}, 100)) / {SCORE_BUCKET} = {i})" for i in range(len(BUCKETS)))
+
+
+# 集計テーブルを作る前からある解答ログを一度だけ集計する（書き込みスレッドの接続で呼ぶ）
+def backfill(conn):
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM rollup_state WHERE name = 'backfilled'").fetchone():
+            return
+        conn.execute(
+            "INSERT INTO rollup_question (tenant, question_id, kind, answers, correct, pick1, pick2, pick3, scored, score_sum)"
+            " SELECT tenant, question_id, kind, COUNT(*), COALESCE(SUM(correct), 0),"
+            " COALESCE(SUM(selected_index = 0), 0), COALESCE(SUM(selected_index = 1), 0),"
+            " COALESCE(SUM(selected_index = 2), 0),"
+            " COUNT(score), COALESCE(SUM(score), 0)"
+            " FROM answers GROUP BY tenant, question_id, kind"
+        )
+        conn.execute(
+            "INSERT INTO rollup_daily (tenant, day, answers, correct)"
+            " SELECT tenant, date(answered_at, 'unixepoch', 'localtime'), COUNT(*), COALESCE(SUM(correct), 0)"
+            " FROM answers GROUP BY 1, 2"
+        )
+        conn.execute(
+            "INSERT INTO rollup_daily (tenant, day, attempts, passed, score_sum)"
+            " SELECT tenant, date(finished_at, 'unixepoch', 'localtime'), COUNT(*),"
+            f" COALESCE(SUM(COALESCE(passed, total_score >= ?)), 0), COALESCE(SUM({_PERCENT_SQL}), 0)"
+            " FROM attempts WHERE finished_at IS NOT NULL GROUP BY 1, 2"
+            " ON CONFLICT(tenant, day) DO UPDATE SET"
+            " attempts = excluded.attempts, passed = excluded.passed, score_sum = excluded.score_sum",
+            (LEGACY_PASS_SCORE,),
+        )
+        conn.execute(
+            f"INSERT INTO rollup_score (kind, day, tenant, {', '.join(BUCKETS)})"
+            f" SELECT kind, date(answered_at, 'unixepoch', 'localtime'), tenant, {_bucket_counts('score')}"
+            " FROM answers WHERE score IS NOT NULL GROUP BY 1, 2, 3"
+        )
+        conn.execute(
+            f"INSERT INTO rollup_score (kind, day, tenant, {', '.join(BUCKETS)})"
+            f" SELECT 'total', date(finished_at, 'unixepoch', 'localtime'), tenant, {_bucket_counts(_PERCENT_SQL)}"
+            " FROM attempts WHERE finished_at IS NOT NULL AND total_score IS NOT NULL GROUP BY 2, 3"
+        )
+        conn.execute("INSERT INTO rollup_state (name, value) VALUES ('backfilled', ?)", (str(time.time()),))
+
+
+# --- 分析画面用の読み込み（pandas の DataFrame。tenant が None なら全営業所の合計） ---
+
+def _read(db_path, sql, params):
+    import pandas as pd
+
+    with db.read(db_path) as conn:
+        try:
+            return pd.read_sql_query(sql, conn, params=params)
+        except pd.errors.DatabaseError:
+            # まだ一度も受講されていない（集計テーブルが無い）
+            return pd.DataFrame()
+
+
+def _tenant_filter(tenant):
+    return ("tenant = ?", [tenant]) if tenant is not None else ("1", [])
+
+
+def tenants(db_path):
+    frame = _read(db_path, "SELECT DISTINCT tenant FROM rollup_daily ORDER BY tenant", [])
+    return list(frame["tenant"]) if not frame.empty else []
+
+
+# 日ごとの解答数・正解数・受講数・合格数・得点率（%）の合計
+def daily(db_path, tenant, since_day):
+    where, params = _tenant_filter(tenant)
+    return _read(
+        db_path,
+        "SELECT day, SUM(answers) AS answers, SUM(correct) AS correct, SUM(attempts) AS attempts,"
+        f" SUM(passed) AS passed, SUM(score_sum) AS score_sum FROM rollup_daily WHERE {where} AND day >= ?"
+        " GROUP BY day ORDER BY day",
+        params + [since_day],
+    )
+
+
+# 得点ごとの件数（kind: "total" = 総合得点の得点率（%） / "free" = 自由記述の点数。bucket は SCORE_BUCKET 刻みの下限）
+def scores(db_path, tenant, since_day, kind):
+    import pandas as pd
+
+    where, params = _tenant_filter(tenant)
+    frame = _read(
+        db_path,
+        f"SELECT {', '.join(f'SUM({b}) AS {b}' for b in BUCKETS)} FROM rollup_score"
+        f" WHERE kind = ? AND day >= ? AND {where}",
+        [kind, since_day] + params,
+    )
+    if frame.empty or frame.iloc[0].isna().all():
+        return pd.DataFrame()
+    return pd.DataFrame({
+        "bucket": [i * SCORE_BUCKET for i in range(len(BUCKETS))],
+        "count": frame.iloc[0].fillna(0).astype(int).to_numpy(),
+    })
+
+
+# 選択式問題ごとの解答数・正解数・選択肢ごとに選ばれた回数（問題文・選択肢・正解を付ける）
+def choice_questions(db_path, tenant):
+    where, params = _tenant_filter(tenant)
+    return _read(
+        db_path,
+        "SELECT r.question_id, q.question, q.option1, q.option2, q.option3, q.answerIndex,"
+        " r.answers, r.correct, r.pick1, r.pick2, r.pick3 FROM ("
+        " SELECT question_id, SUM(answers) AS answers, SUM(correct) AS correct,"
+        " SUM(pick1) AS pick1, SUM(pick2) AS pick2, SUM(pick3) AS pick3"
+        f" FROM rollup_question WHERE {where} AND kind = 'choice' GROUP BY question_id"
+        ") r LEFT JOIN quiz q ON q.id = r.question_id",
+        params,
+    )
+
+
+# 自由記述の問題ごとの解答数と平均点
+def free_questions(db_path, tenant):
+    where, params = _tenant_filter(tenant)
+    return _read(
+        db_path,
+        "SELECT r.question_id, q.question_text, r.answers, r.scored, r.score_sum FROM ("
+        " SELECT question_id, SUM(answers) AS answers, SUM(scored) AS scored, SUM(score_sum) AS score_sum"
+        f" FROM rollup_question WHERE {where} AND kind = 'free' GROUP BY question_id"
+        ") r LEFT JOIN questions q ON q.id = r.question_id",
+        params,
+    )
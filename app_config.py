@@ -0,0 +1,173 @@
+
+# 試験の設定: 1つのアプリ（App_final.py）と1つのプロセスで、設定の違う複数の試験を出す
+# exams.toml に、試験ごとの設定（DB・問題数・配点・API キーの読み込み元）と、
+# プロセス全体で共有する設定（[app]: 採点の接続先・スレッド数・キャッシュの大きさ）を書く。
+# 試験は URL の ?exam=<名前> で選ぶ（省略時は環境変数 EXAM_PROFILE、それも無ければ final）。
+# 問題バンク・採点プール・接続プールは試験をまたいで共有されるので、試験ごとに温め直さない。
+#
+#   streamlit run App_final.py                          # http://localhost:8501/?exam=basic で4問×20点の試験
+#   EXAM_CONFIG=/etc/tgk/exams.toml EXAM_PROFILE=local_final streamlit run App_final.py
+import hmac
+import logging
+import os
+import threading
+import tomllib
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.getenv("EXAM_CONFIG", os.path.join(BASE_DIR, "exams.toml"))
+# ?exam= が無いときの試験
+DEFAULT_EXAM = os.getenv("EXAM_PROFILE", "final")
+# このアプリのモジュールのログを出す最低レベル（ライブラリのログは WARNING 以上だけを出す）
+LOG_LEVEL = os.getenv("APP_LOG_LEVEL", "INFO").upper()
+
+# [app] のキー → そのキーを読むモジュールの環境変数（環境変数が設定されていればそちらを優先する）
+APP_SETTINGS = {
+    "grading_backend": "GRADING_BACKEND",
+    "grading_model": "GRADING_MODEL",
+    "grading_max_workers": "GRADING_MAX_WORKERS",
+    "grading_cache_path": "GRADING_CACHE_PATH",
+    "grading_cache_max_entries": "GRADING_CACHE_MAX_ENTRIES",
+    "question_bank_max_rows": "QUESTION_BANK_MAX_ROWS",
+    "session_pack_buffer": "SESSION_PACK_BUFFER",
+    "db_pool_size": "DB_POOL_SIZE",
+    "db_cache_size": "DB_CACHE_SIZE",
+    "local_grader_dim": "LOCAL_GRADER_DIM",
+    "local_grader_dir": "LOCAL_GRADER_DIR",
+}
+# 試験ごとの設定の既定値（exams.toml の [exams.<名前>] で上書きする）
+EXAM_DEFAULTS = {
+    "title": "TGK<br>Teacherアプリ",
+    "db_path": "quiz_ver2.db",
+    # 選択式の問題数と1問の配点
+    "quiz_count": 8,
+    "quiz_points": 10,
+    # 自由記述の配点（100点満点の採点をこの点数に換算する）
+    "free_points": 20,
+    # 合格点と「惜しい」の下限
+    "pass_score": 80,
+    "near_score": 60,
+    # API キーの読み込み元: streamlit = st.secrets / dotenv = .env または環境変数 OPENAI_API_KEY
+    "secrets": "streamlit",
+    # 採点器: openai = LLM / local = CPU だけのローカル採点（graders.py）
+    "grader": "openai",
+    # LLM で採点できないときの扱い: "" = 後で採点（採点キュー） / local = ローカルで採点する
+    "grader_fallback": "",
+}
+SECRETS_SOURCES = ("streamlit", "dotenv")
+# 管理ページ（pages/）のパスワードを読む st.secrets のキー（無ければ同じ名前の環境変数）
+ADMIN_PASSWORD_KEY = "ADMIN_PASSWORD"
+GRADERS = ("openai", "local")
+
+_lock = threading.Lock()
+_cache = {}
+_logging_configured = False
+
+
+# 設定ファイルを読む（更新されていれば読み直す。ファイルが無ければ既定の試験1つだけ）
+def load(path=CONFIG_PATH):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {"app": {}, "exams": {DEFAULT_EXAM: {}}}
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    config = {"app": config.get("app", {}), "exams": config.get("exams", {}) or {DEFAULT_EXAM: {}}}
+    with _lock:
+        _cache[path] = (mtime, config)
+    return config
+
+
+# ログを標準エラーに出す（プロセスで1回だけ）。streamlit run はアプリのログの出力先を設定しないので、
+# そのままでは WARNING 未満（起動時の import 時間や採点ジョブの所要時間）が表示されない。
+# このアプリのモジュールは LOG_LEVEL 以上、ライブラリ（openai・httpx など）は WARNING 以上を出す
+def configure_logging():
+    global _logging_configured
+    with _lock:
+        if _logging_configured:
+            return
+        _logging_configured = True
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    handler.addFilter(lambda record: record.levelno >= logging.WARNING or record.pathname.startswith(BASE_DIR))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(min(logging.getLevelName(LOG_LEVEL), logging.WARNING))
+
+
+# [app] の設定を環境変数に反映する。各モジュールは import したときに環境変数を読むので、
+# アプリや管理ページの先頭で、ほかのモジュールを import する前に呼ぶ（ログの出力先もここで設定する）
+def apply_app_settings(path=CONFIG_PATH):
+    configure_logging()
+    for key, value in load(path)["app"].items():
+        if key not in APP_SETTINGS:
+            raise ValueError(f"{path}: [app] の {key!r} は設定できません（{', '.join(APP_SETTINGS)}）")
+        os.environ.setdefault(APP_SETTINGS[key], str(value))
+
+
+def names(path=CONFIG_PATH):
+    return list(load(path)["exams"])
+
+
+# 試験の設定を返す（name が None なら既定の試験）。無い試験や不正な設定は ValueError
+def exam(name=None, path=CONFIG_PATH):
+    name = name or DEFAULT_EXAM
+    exams = load(path)["exams"]
+    if name not in exams:
+        raise ValueError(f"試験 {name!r} は設定されていません（{', '.join(exams)}）")
+    unknown = set(exams[name]) - set(EXAM_DEFAULTS)
+    if unknown:
+        raise ValueError(f"試験 {name!r} に不明な設定があります: {', '.join(sorted(unknown))}")
+    settings = dict(EXAM_DEFAULTS, **exams[name], name=name)
+    if settings["secrets"] not in SECRETS_SOURCES:
+        raise ValueError(f"試験 {name!r} の secrets は {' / '.join(SECRETS_SOURCES)} のいずれかです")
+    if settings["grader"] not in GRADERS or settings["grader_fallback"] not in ("", "local"):
+        raise ValueError(f"試験 {name!r} の grader は {' / '.join(GRADERS)}、grader_fallback は local か空です")
+    # DB の相対パスは設定ファイルの場所から解決する
+    settings["db_path"] = os.path.join(os.path.dirname(os.path.abspath(path)), os.path.expanduser(settings["db_path"]))
+    if not os.path.exists(settings["db_path"]):
+        raise ValueError(f"試験 {name!r} の DB が見つかりません: {settings['db_path']}")
+    settings["quiz_max"] = settings["quiz_count"] * settings["quiz_points"]
+    settings["max_score"] = settings["quiz_max"] + settings["free_points"]
+    return settings
+
+
+# 管理用のページで試験を選ぶ（試験が1つだけなら選択欄は出さない）
+def select_exam(st):
+    choices = names()
+    name = choices[0]
+    if len(choices) > 1:
+        index = choices.index(DEFAULT_EXAM) if DEFAULT_EXAM in choices else 0
+        name = st.sidebar.selectbox("試験", choices, index=index)
+    try:
+        return exam(name)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+
+
+# 管理ページの先頭で呼ぶ: 管理者のパスワードを入力するまで、ページの残りを実行しない
+# （受講者もサイドバーから pages/ を開けるため）。パスワードが設定されていなければ誰も開けない
+def require_admin(st):
+    if st.session_state.get("admin"):
+        return
+    try:
+        password = st.secrets.get(ADMIN_PASSWORD_KEY)
+    except FileNotFoundError:
+        password = None
+    password = password or os.getenv(ADMIN_PASSWORD_KEY)
+    if not password:
+        st.error(f"管理ページのパスワードが設定されていません（st.secrets または環境変数の {ADMIN_PASSWORD_KEY}）。")
+        st.stop()
+    entered = st.text_input("管理者のパスワード", type="password")
+    if not entered:
+        st.stop()
+    if not hmac.compare_digest(entered.encode(), str(password).encode()):
+        st.error("パスワードが違います。")
+        st.stop()
+    # 同じブラウザのセッションでは、ほかの管理ページも入力し直さずに開ける
+    st.session_state["admin"] = True
+    st.rerun()
@@ -0,0 +1,57 @@
+
+# 画像アセットの配信
+# 最適化済みの画像（optimize_images.py で作成）を Streamlit の静的ファイル配信（/app/static/）から
+# <picture> で読み込ませる。WebP に対応していないブラウザには PNG を返す。
+# 静的ファイル配信（Streamlit 1.65 は Starlette の FileResponse）は Cache-Control を付けず、ETag と Last-Modified だけを返す
+# （If-None-Match を送っても 304 にはならず、毎回本体を返す）。ブラウザは Last-Modified からの推定でしばらくキャッシュするが、
+# 期間は保証されない。URL には ?v=<内容のハッシュ> を付けて、画像を差し替えたら必ず新しい URL になるようにする
+# （古い画像がキャッシュから表示されない）。再実行のたびに st.image で画像を送り直すことはなくなる。
+import functools
+import hashlib
+import os
+
+BASE_DIR = os.path.dirname(__file__)
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+
+# 書き出す横幅（px）: 表示幅の2倍（高解像度の端末向け）
+# logo.png は 8:1 の列の右側（約80px）、FV.png は 1:2:1 の中央列（約350px）に表示される
+IMAGE_WIDTHS = {"logo": 160, "FV": 704}
+
+
+# 画像のバイト列（プロセス内で一度だけ読み込む）
+@functools.lru_cache(maxsize=None)
+def image_bytes(filename):
+    with open(os.path.join(STATIC_DIR, filename), "rb") as f:
+        return f.read()
+
+
+@functools.lru_cache(maxsize=None)
+def _version(filename):
+    return hashlib.sha256(image_bytes(filename)).hexdigest()[:12]
+
+
+# 最適化済みの画像があれば <picture> のHTMLを返す（無ければ None）
+@functools.lru_cache(maxsize=None)
+def picture_html(name, alt="", width=None):
+    webp, png = f"{name}.webp", f"{name}.png"
+    if not (os.path.exists(os.path.join(STATIC_DIR, webp)) and os.path.exists(os.path.join(STATIC_DIR, png))):
+        return None
+    style = f"width: 100%; max-width: {width}px;" if width else "width: 100%;"
+    return (
+        '<picture style="display: block; text-align: center;">'
+        f'<source type="image/webp" srcset="app/static/{webp}?v={_version(webp)}">'
+        f'<img src="app/static/{png}?v={_version(png)}" alt="{alt}" style="{style}">'
+        "</picture>"
+    )
+
+
+# 画像を表示する（最適化済みの画像が無ければ元の PNG をそのまま表示する）
+def show_image(st, name, alt="", width=None):
+    html = picture_html(name, alt, width)
+    if html is None:
+        if width:
+            st.image(os.path.join(BASE_DIR, f"{name}.png"), width=width)
+        else:
+            st.image(os.path.join(BASE_DIR, f"{name}.png"), use_container_width=True)
+        return
+    st.markdown(html, unsafe_allow_html=True)
@@ -0,0 +1,68 @@
+
+# データアクセスのベンチマーク: 毎回 sqlite3.connect する従来の方法と、接続プール（db.py）の1クエリあたりの時間を比べる
+#   python bench_db.py [DBパス] [回数]
+# DB パスを省略すると、リポジトリの quiz_ver2.db の一時コピーで計測する
+# （接続プールは DB を WAL に切り替えるので、リポジトリの DB をそのまま使わない）
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import db
+
+QUERIES = {
+    # 従来の get_quiz_data と同じ全件取得
+    "quiz 全件": ("SELECT question, option1, option2, option3, answerIndex FROM quiz", ()),
+    # 主キーで1件だけ取得（接続のオーバーヘッドが目立つケース）
+    "quiz 1件": ("SELECT question, option1, option2, option3, answerIndex FROM quiz WHERE id = ?", (1,)),
+}
+
+
+def per_call_connect(db_path, sql, params):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+
+
+def pooled(db_path, sql, params):
+    with db.read(db_path) as conn:
+        return conn.execute(sql, params).fetchall()
+
+
+def bench(fn, db_path, sql, params, n):
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn(db_path, sql, params)
+        times.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(times), statistics.quantiles(times, n=100)[94]
+
+
+def run(db_path, n):
+    print(f"{db_path}（{n} 回）")
+    print(f"{'クエリ':<10} {'方式':<12} {'中央値[us]':>12} {'p95[us]':>10}")
+    for name, (sql, params) in QUERIES.items():
+        pooled(db_path, sql, params)  # プールの接続を作っておく
+        for label, fn in (("毎回接続", per_call_connect), ("接続プール", pooled)):
+            median, p95 = bench(fn, db_path, sql, params, n)
+            print(f"{name:<10} {label:<12} {median:>12.1f} {p95:>10.1f}")
+
+
+def main():
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    if len(sys.argv) > 1:
+        run(sys.argv[1], n)
+        return
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, "quiz_ver2.db")
+        shutil.copyfile(os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_ver2.db"), db_path)
+        run(db_path, n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+
+# 受講1回分の負荷テスト: Streamlit の AppTest で App_final.py を N 人ぶん並列に操作し、
+# 手順ごとのレイテンシ（p50/p95/p99）・セッションあたりのメモリ・DB の所要時間を計測する。
+# セッションのメモリは、受講開始の直後（quiz）と結果ページ（end）で、pickle したときのバイト数と、
+# セッションステートが単独で持っているメモリ（問題バンクと共有しているものは除く）を測る。
+# OpenAI の代わりに同梱のスタブ（openai_stub.py）を立てるので、ネットワークも API キーも不要。
+# スタブの待ち時間の分布や 429・タイムアウトの発生率も指定できる。
+# 結果は JSON で保存し、--compare で以前の結果と比べられる。
+#
+#   python bench_session.py --users 20
+#   python bench_session.py --users 20 --compare bench_results/前回.json
+#   python bench_session.py --users 20 --latency lognormal:1.5,0.6 --rate-429 0.1
+#
+# 計測する手順:
+#   start  : 「トレーニングを始める」
+#   answer : 「回答」（8回）
+#   next   : 「次の問題」（8回）
+#   grade  : 「採点」を押してから結果ページが表示されるまで
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import openai_stub
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STEPS = ("start", "answer", "next", "resume", "grade")
+# 結果に載せる集計（各モジュールの stats()）
+STAT_SOURCES = ("grading_cache", "session_packs", "session_store", "grading_queue", "grading_worker")
+
+
+# セッションステートのおおよそのサイズ（pickle したときのバイト数）
+def session_bytes(at):
+    state = {}
+    for key in at.session_state:
+        try:
+            state[key] = pickle.dumps(at.session_state[key])
+        except Exception:
+            continue
+    return sum(len(v) for v in state.values())
+
+
+# セッションステートが単独で持っているメモリ（バイト）。問題バンクの行や文字列を参照しているだけなら数えない
+def session_memory(at):
+    import question_bank
+
+    seen = set()
+    for bank in list(question_bank._banks.values()):
+        for rows in (bank.quiz_rows, bank.free_rows):
+            for row in rows or ():
+                seen.add(id(row))
+                seen.update(id(value) for value in row)
+
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum(size(k) + size(v) for k, v in obj.items())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            total += sum(size(v) for v in obj)
+        return total
+
+    return sum(size(at.session_state[key]) for key in at.session_state)
+
+
+def session_size(at):
+    return {"pickled": session_bytes(at), "memory": session_memory(at)}
+
+
+def _button(at, label):
+    return next(b for b in at.button if b.label == label)
+
+
+# 「採点」を押して結果ページが表示されるまで
+# AppTest はフラグメント単位の再実行（st.rerun(scope="fragment")）に対応しておらず例外になるので、
+# そのときはブラウザがフラグメントを再実行するのと同じように、スクリプトをもう一度実行する
+def grade(at, max_reruns=600):
+    _button(at, "採点").click().run()
+    for _ in range(max_reruns):
+        if at.session_state["openai_done"]:
+            return
+        if at.exception and "scope=\"fragment\"" not in at.exception[0].message:
+            return
+        if at.error:
+            raise RuntimeError(f"grade: {at.error[0].value}")
+        at.run()
+    raise RuntimeError("grade: 結果ページが表示されませんでした")
+
+
+# 1人分の受講を最初から最後まで操作し、手順ごとの時間を timings に追加する
+def play_session(app_dir, name, timings, sizes=None):
+    from streamlit.testing.v1 import AppTest
+
+    def step(label, action):
+        start = time.perf_counter()
+        action()
+        timings[label].append((time.perf_counter() - start) * 1000)
+        if at.exception:
+            raise RuntimeError(f"{label}: {at.exception[0].message}")
+
+    def open_app(query_params=None):
+        app = AppTest.from_file(os.path.join(app_dir, "App_final.py"), default_timeout=120)
+        app.query_params.update(query_params or {})
+        return app
+
+    at = open_app()
+    at.run()
+    at.text_input(key="branch_input").input("bench")
+    at.text_input(key="trainee_input").input(name)
+    step("start", lambda: at.button(key="start_button").click().run())
+    if sizes is not None:
+        sizes["quiz"] = session_size(at)
+    quiz_count = len(at.session_state["quiz_ids"])
+    for i in range(quiz_count):
+        if i == quiz_count // 2:
+            # 選択式の途中で再読み込みしたのと同じように、URL の再開用トークンだけを持って新しいセッションを開く
+            progress = (at.session_state["current_question"], at.session_state["correct_bits"])
+            at = open_app({"resume": at.query_params["resume"]})
+            step("resume", at.run)
+            if (at.session_state["current_question"], at.session_state["correct_bits"]) != progress:
+                raise RuntimeError("resume: 途中経過が元に戻りませんでした")
+        step("answer", lambda: at.button(key=f"submit{i}").click().run())
+        step("next", lambda: _button(at, "次の問題").click().run())
+    # 採点キャッシュに当たらないよう、受講者ごとに回答を変える
+    at.text_area[0].input(f"給湯器の型番と設置場所を伺います。（{name}）")
+    step("grade", lambda: grade(at))
+    if sizes is not None:
+        sizes["end"] = session_size(at)
+    return session_bytes(at)
+
+
+# ワーカープロセス1つ分: 受講者1人として受講する
+# AppTest は Runtime や st.secrets をプロセス全体で差し替えながら動くので、同じプロセスの
+# 複数スレッドからは同時に使えない。受講者ごとに別プロセスで動かし、DB だけを共有する。
+# warmup のときは、openai や plotly の初回 import などを済ませるために1回受講してから計測する。
+def run_session(app_dir, user, warmup):
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    import db
+    import grading_cache
+    import grading_queue
+    import grading_worker
+    import llm_client
+    import results_store
+    import session_packs
+    import session_store
+
+    # AppTest のフラグメント再実行の例外（grade を参照）のトレースバックを出さない
+    # （AppTest の外から Streamlit を呼ぶ採点スレッドの警告も出さない）
+    logging.getLogger("streamlit.error_util").disabled = True
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").disabled = True
+    timings = {name: [] for name in STEPS}
+    result = {"user": user, "steps_ms": timings, "session_bytes": None, "session_size": {}, "error": None}
+    try:
+        if warmup:
+            play_session(app_dir, f"warmup{user}", {name: [] for name in STEPS})
+            results_store.flush()
+        pool_before = sum(s["busy_seconds"] for s in db.stats().values())
+        writer_before = sum(s["write_seconds"] for s in results_store.stats().values())
+        result["session_bytes"] = play_session(app_dir, f"user{user}", timings, result["session_size"])
+    except Exception as e:
+        result["error"] = f"user{user}: {e!r}"
+        pool_before = writer_before = 0.0
+    results_store.flush()
+    result["pool_seconds"] = sum(s["busy_seconds"] for s in db.stats().values()) - pool_before
+    result["writer_seconds"] = sum(s["write_seconds"] for s in results_store.stats().values()) - writer_before
+    result["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result["llm"] = llm_client.metrics()
+    # キャッシュ・作り置き・途中経過の保存・採点キューの集計（ウォームアップの受講も含む）
+    result["stats"] = {
+        "grading_cache": grading_cache.stats(),
+        "session_packs": _total(session_packs.stats().values()),
+        "session_store": session_store.stats(),
+        "grading_queue": grading_queue.stats(),
+        "grading_worker": grading_worker.stats(),
+    }
+    return result
+
+
+# 集計の数値を足し合わせる（直近の値や率は足しても意味が無いので除く）
+def _total(counters):
+    total = {}
+    for counter in counters:
+        for key, value in counter.items():
+            if isinstance(value, (int, float)) and not key.startswith("last_") and key != "hit_rate":
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+    return {"count": len(values), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99),
+            "mean": statistics.fmean(values), "max": values[-1]}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(users, workdir, warmup=True, exam=False, **stub_options):
+    # DB や採点キャッシュを汚さないよう、アプリ一式を作業ディレクトリにコピーして動かす
+    app_dir = os.path.join(workdir, "app")
+    shutil.copytree(BASE_DIR, app_dir, ignore=shutil.ignore_patterns(".git", "__pycache__", "bench_results"))
+    server = openai_stub.start(**stub_options)
+    # 以下の環境変数はワーカープロセスにも引き継がれる
+    os.environ["GRADING_BACKEND"] = "stub"
+    os.environ["OPENAI_STUB_URL"] = server.url
+    os.environ["GRADING_CACHE_PATH"] = os.path.join(workdir, "grading_cache.db")
+    # ローカル事前採点で確定させず、必ずスタブの LLM を呼ぶ
+    os.environ["PRESCORE_LOW"] = "-1"
+    os.environ["PRESCORE_HIGH"] = "2"
+    # 試験モード: 自由記述は採点キューに積まれ、各プロセスの採点ワーカーがまとめて採点する
+    os.environ["EXAM_MODE"] = "1" if exam else ""
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=users, mp_context=context) as executor:
+        sessions = list(executor.map(run_session, [app_dir] * users, range(users), [warmup] * users))
+    wall = time.perf_counter() - start
+    stub_stats = server.stats()
+    server.shutdown()
+
+    timings = {name: [] for name in STEPS}
+    for session in sessions:
+        for name, values in session["steps_ms"].items():
+            timings[name].extend(values)
+    completed = [s for s in sessions if not s["error"]]
+    stats = {name: _total(s["stats"][name] for s in sessions if "stats" in s) for name in STAT_SOURCES}
+    lookups = stats["grading_cache"].get("hits", 0) + stats["grading_cache"].get("misses", 0)
+    stats["grading_cache"]["hit_rate"] = stats["grading_cache"].get("hits", 0) / lookups if lookups else 0.0
+    pool_seconds = sum(s["pool_seconds"] for s in sessions)
+    writer_seconds = sum(s["writer_seconds"] for s in sessions)
+    return {
+        "revision": git_revision(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "users": users,
+        "stub": stub_stats,
+        "warmup": warmup,
+        "exam": exam,
+        "cpu_count": os.cpu_count(),
+        "wall_s": wall,
+        "completed": len(completed),
+        "errors": [s["error"] for s in sessions if s["error"]],
+        "steps_ms": {name: percentiles(values) for name, values in timings.items()},
+        "session_bytes": percentiles([s["session_bytes"] for s in completed]),
+        "session_size": {
+            point: {
+                measure: percentiles([s["session_size"][point][measure] for s in completed])
+                for measure in ("pickled", "memory")
+            }
+            for point in ("quiz", "end") if completed and point in completed[0]["session_size"]
+        },
+        "process_max_rss_kb": percentiles([s["max_rss_kb"] for s in sessions]),
+        # 再試行・レート制限の待ち・ブレーカーの回数（全プロセスの合計）
+        "llm": {
+            key: sum(s["llm"][key] for s in sessions)
+            for key in sessions[0]["llm"] if isinstance(sessions[0]["llm"][key], (int, float))
+        },
+        # キャッシュ・作り置き・途中経過の保存・採点キューの集計（全プロセスの合計）
+        "stats": stats,
+        "db": {
+            "read_write_pool_s": pool_seconds,
+            "results_writer_s": writer_seconds,
+            "per_session_ms": (pool_seconds + writer_seconds) * 1000 / max(1, len(completed)),
+        },
+    }
+
+
+def print_report(result, baseline=None):
+    print(f"revision {result['revision']}: {result['completed']}/{result['users']} 人完了, {result['wall_s']:.1f} 秒")
+    print(f"{'step':<8}{'p50':>10}{'p95':>10}{'p99':>10}   (ms)")
+    for name, stats in result["steps_ms"].items():
+        if not stats:
+            continue
+        line = f"{name:<8}{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}"
+        old = baseline and baseline["steps_ms"].get(name)
+        if old:
+            line += f"   p95 {stats['p95'] - old['p95']:+.1f} ms ({(stats['p95'] / old['p95'] - 1) * 100:+.0f}%)"
+        print(line)
+    for point, size in result.get("session_size", {}).items():
+        line = f"session state ({point}): pickled p50 {size['pickled']['p50']:.0f} bytes / memory p50 {size['memory']['p50']:.0f} bytes"
+        old = baseline and baseline.get("session_size", {}).get(point)
+        if old:
+            line += f"   (was {old['pickled']['p50']:.0f} / {old['memory']['p50']:.0f})"
+        print(line)
+    print(f"DB: {result['db']['per_session_ms']:.1f} ms / session")
+    if "stats" in result:
+        cache, packs, queue = (result["stats"][name] for name in ("grading_cache", "session_packs", "grading_queue"))
+        print(f"grading cache: hits {cache.get('hits', 0)} / misses {cache.get('misses', 0)}"
+              f" (hit rate {cache['hit_rate']:.0%})"
+              f" / session packs: served {packs.get('served', 0)} / misses {packs.get('misses', 0)}"
+              f" / queue: graded {queue.get('graded', 0)} / deferred {queue.get('deferred', 0)}"
+              f" / failed {queue.get('failed', 0)}")
+    stub = result["stub"]
+    llm = result["llm"]
+    print(f"grader: retries {llm['retries']} / throttled {llm['throttle_seconds']:.1f} s"
+          f" / short-circuited {llm['short_circuited']} / breaker opened {llm['breaker_opened']}")
+    print(f"stub: {stub['requests']} requests / 429 {stub['rate_limited']} / timeout {stub['timeouts']}"
+          f" / 500 {stub['server_errors']} / max in flight {stub['max_in_flight']}")
+    for error in result["errors"]:
+        print("ERROR", error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="App_final.py の受講フローを並列に実行して計測する")
+    parser.add_argument("--users", type=int, default=10, help="同時に受講する人数")
+    parser.add_argument("--latency", default="fixed:0.5", help="スタブの待ち時間の分布（openai_stub.py を参照）")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="スタブが 429 を返す確率")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="スタブが応答しない確率")
+    parser.add_argument("--rate-500", type=float, default=0.0, help="スタブが 500 を返す確率")
+    parser.add_argument("--seed", type=int, help="スタブの乱数の種")
+    parser.add_argument("--exam", action="store_true", help="試験モード（採点キューでまとめて採点）で受講する")
+    parser.add_argument("--no-warmup", action="store_true", help="初回 import などを含めた冷えた状態で計測する")
+    parser.add_argument("--out", help="結果の JSON（省略時は bench_results/<日時>_<revision>.json）")
+    parser.add_argument("--compare", help="比較する以前の結果 JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        result = run(
+            args.users, workdir, not args.no_warmup, args.exam, latency=args.latency, rate_429=args.rate_429,
+            rate_timeout=args.rate_timeout, rate_500=args.rate_500, seed=args.seed,
+        )
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+    out = args.out or os.path.join(
+        BASE_DIR, "bench_results", f"{time.strftime('%Y%m%d-%H%M%S')}_{result['revision']}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"saved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+
+# 共有データアクセス層: SQLite の接続プール
+# 接続を毎回開いて閉じる代わりに、DBファイルごとにプールした接続を使い回す。
+# 接続は check_same_thread=False で作るので、プールから借りたスレッドであればどのスレッドでも使える
+# （同時に使えるのは借りた1スレッドだけ）。SQL 文は接続ごとにプリペアド・ステートメントとして
+# キャッシュされる（cached_statements）ので、同じ SQL を繰り返すと解析を省略できる。
+#
+#   with db.read(DB_PATH) as conn:      # 読み取り専用（query_only）
+#       rows = conn.execute("SELECT ...").fetchall()
+#   with db.write(DB_PATH) as conn:     # 書き込み用
+#       conn.execute("INSERT ...")
+#       conn.commit()
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# DBファイルごと・読み書きそれぞれのプールで保持する最大接続数
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# メモリマップで読む最大サイズ（バイト）
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+# 接続ごとのページキャッシュ（負の値は KiB 単位）
+CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-16000"))
+# 接続ごとにキャッシュするプリペアド・ステートメントの数
+CACHED_STATEMENTS = 256
+
+_pools = {}
+_lock = threading.Lock()
+
+
+# チューニング済みの接続を1本作る（プールを使わない長寿命の接続にも使う）
+def connect(db_path, readonly=False):
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, cached_statements=CACHED_STATEMENTS)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError:
+        # 他の接続が書き込み中などで切り替えられなくても、読み書きはそのまま行える
+        pass
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={CACHE_SIZE}")
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# スレッドセーフな接続プール（空きが無く上限に達していたら返却を待つ）
+class ConnectionPool:
+    def __init__(self, db_path, readonly, size=POOL_SIZE):
+        self.db_path = db_path
+        self.readonly = readonly
+        self.size = size
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+        self.stats = {"checkouts": 0, "waits": 0, "connects": 0, "busy_seconds": 0.0}
+
+    def _acquire(self):
+        with self._cond:
+            self.stats["checkouts"] += 1
+            if not self._idle and self._created >= self.size:
+                self.stats["waits"] += 1
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+            self.stats["connects"] += 1
+        try:
+            return connect(self.db_path, self.readonly)
+        except BaseException:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn):
+        # コミットされずに返された変更は取り消す
+        if conn.in_transaction:
+            conn.rollback()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        start = time.perf_counter()
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+            # 接続を借りてから返すまでの時間（待ち時間を含む DB の所要時間）
+            with self._cond:
+                self.stats["busy_seconds"] += time.perf_counter() - start
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
+
+
+def get_pool(db_path, readonly=True):
+    key = (db_path, readonly)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = ConnectionPool(db_path, readonly)
+            _pools[key] = pool
+        return pool
+
+
+# 読み取り専用の接続を借りる
+def read(db_path):
+    return get_pool(db_path, readonly=True).connection()
+
+
+# 書き込み用の接続を借りる（変更したら commit すること）
+def write(db_path):
+    return get_pool(db_path, readonly=False).connection()
+
+
+# プールの利用状況（借りた回数・待った回数・新しく接続した回数・接続を使っていた合計時間）
+def stats():
+    with _lock:
+        pools = dict(_pools)
+    return {
+        f"{path} ({'read' if readonly else 'write'})": dict(pool.stats, idle=len(pool._idle))
+        for (path, readonly), pool in pools.items()
+    }
@@ -0,0 +1,53 @@
+
+# 採点器: 自由記述の回答に「点数: xx点 / アドバイス:」の文章を付ける
+# どの採点器も grade() で文章の断片を順に返す（LLM はストリーミング、ローカルは1回で全文）。
+#   openai : LLM（llm_client。接続先は GRADING_BACKEND で OpenAI / スタブ）。待ち時間と費用がかかるので、
+#            採点はワーカープールや採点キューで行い、結果は採点キャッシュに残す
+#   local  : CPU だけで採点する（local_grader.py）。ネットワーク不要で1件 1ms 未満なので、その場で採点する
+# 試験ごとに exams.toml の grader で選ぶ。grader_fallback = "local" にすると、LLM で採点できないとき
+# （GradingUnavailable）は「後で採点」に回さずにローカルで採点する。
+import grading_metrics
+import grading_prompts
+
+# 採点器の名前（app_config.GRADERS と同じ）
+GRADERS = ("openai", "local")
+
+
+class OpenAIGrader:
+    name = "openai"
+    # 採点に時間がかかる（ワーカープール・採点キューを使う）
+    remote = True
+
+    def __init__(self, db_path, get_client):
+        self.db_path = db_path
+        self.get_client = get_client
+
+    # トークン数や所要時間は grading_metrics に記録する（採点ダッシュボードで確認できる）
+    def grade(self, question_id, question_text, model_answer, answer):
+        prompt = grading_prompts.single_prompt(question_text, model_answer, answer)
+        yield from grading_metrics.tracked_chat(
+            self.db_path, [question_id], self.get_client(), prompt,
+            truncated=grading_prompts.is_truncated(model_answer, answer),
+        )
+
+
+class LocalGrader:
+    name = "local"
+    remote = False
+
+    def __init__(self, db_path):
+        import local_grader
+
+        self.model = local_grader.get_model(db_path)
+
+    def grade(self, question_id, question_text, model_answer, answer):
+        yield self.model.feedback(question_id, model_answer, answer)
+
+
+# 採点器を作る（get_client は LLM のクライアントを返す関数。ローカルでは使わない）
+def get(name, db_path, get_client):
+    if name == "openai":
+        return OpenAIGrader(db_path, get_client)
+    if name == "local":
+        return LocalGrader(db_path)
+    raise ValueError(f"採点器は {' / '.join(GRADERS)} のいずれかを指定してください: {name!r}")
@@ -0,0 +1,158 @@
+
+# 自由記述の採点をバックグラウンドで実行する共有ワーカープール
+# Streamlit のスクリプトスレッドで OpenAI の応答を待たないように、
+# 採点はプロセス全体で共有するスレッドプールに投げ、画面は結果をポーリングする。
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 同時に実行する採点数の上限（APIのレート制限に合わせて調整する）
+MAX_WORKERS = int(os.getenv("GRADING_MAX_WORKERS", "8"))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="grader")
+_jobs = {}
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_counters = {"submitted": 0, "completed": 0, "failed": 0, "queued": 0, "in_flight": 0}
+
+
+# 採点結果の文章から「点数: xx点」を読み取る（0〜100、見つからなければ None）
+# partial=True はストリーミング途中の文章用で、数字の後ろに文字が続いてから確定させる
+# （「点数: 8」まで届いた時点で 8点と読まないため）
+def parse_score(feedback, partial=False):
+    pattern = r"点数[:：]?\s*(\d+)(?=\D)" if partial else r"点数[:：]?\s*(\d+)"
+    score_match = re.search(pattern, feedback or "")
+    if score_match:
+        return min(int(score_match.group(1)), 100)
+    return None
+
+
+# 1件分の採点ジョブ（status: queued → running → done / error）
+# 採点関数が文字列の代わりにイテレータを返した場合は、届いた断片を chunks に積み、
+# 点数の行が届いた時点で score を確定させる。
+class GradingJob:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.chunks = []
+        self.score = None
+        self.changed = threading.Condition(_lock)
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "error")
+
+    @property
+    def text(self):
+        return "".join(self.chunks)
+
+
+# ワーカースレッドで実行される本体
+def _run(job, fn, args, kwargs):
+    with _lock:
+        _counters["queued"] -= 1
+        _counters["in_flight"] += 1
+        job.status = "running"
+        job.started_at = time.monotonic()
+    try:
+        result = fn(*args, **kwargs)
+        if not isinstance(result, str):
+            for chunk in result:
+                with _lock:
+                    job.chunks.append(chunk)
+                    if job.score is None:
+                        job.score = parse_score(job.text, partial=True)
+                    job.changed.notify_all()
+            result = job.text
+    except Exception as e:
+        logger.exception("grading job %s failed", job.id)
+        with _lock:
+            job.error = e
+            job.status = "error"
+            _counters["failed"] += 1
+    else:
+        with _lock:
+            job.result = result
+            if not job.chunks:
+                job.chunks.append(result)
+            job.score = parse_score(result)
+            job.status = "done"
+            _counters["completed"] += 1
+    finally:
+        with _lock:
+            _counters["in_flight"] -= 1
+            job.finished_at = time.monotonic()
+            job.changed.notify_all()
+        logger.info(
+            "grading job %s %s in %.2fs (waited %.2fs); %s",
+            job.id, job.status, job.finished_at - job.started_at,
+            job.started_at - job.submitted_at, metrics(),
+        )
+
+
+# 採点関数をプールに投入してジョブIDを返す（session_state にはIDだけを保存する）
+def submit(fn, *args, **kwargs):
+    with _lock:
+        job = GradingJob(next(_ids))
+        _jobs[job.id] = job
+        _counters["submitted"] += 1
+        _counters["queued"] += 1
+    _executor.submit(_run, job, fn, args, kwargs)
+    return job.id
+
+
+# ジョブを取得する（存在しなければ None）
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+# 採点結果の断片を届いた順に返すジェネレータ（st.write_stream にそのまま渡せる）
+def follow(job):
+    sent = 0
+    while True:
+        with _lock:
+            while len(job.chunks) == sent and not job.done:
+                job.changed.wait(1.0)
+            new = job.chunks[sent:]
+            sent = len(job.chunks)
+            finished = job.done
+        yield from new
+        if finished:
+            return
+
+
+# 結果を受け取ったジョブを破棄する
+def discard(job_id):
+    with _lock:
+        _jobs.pop(job_id, None)
+
+
+# 待機中のジョブのうち、自分より前に並んでいる件数
+def queue_position(job_id):
+    with _lock:
+        return sum(1 for job in _jobs.values() if job.status == "queued" and job.id < job_id)
+
+
+# プールのサイズ決めに使う指標（待ち行列の長さと実行中の件数など）
+def metrics():
+    with _lock:
+        return {
+            "max_workers": MAX_WORKERS,
+            "queue_depth": _counters["queued"],
+            "in_flight": _counters["in_flight"],
+            "submitted": _counters["submitted"],
+            "completed": _counters["completed"],
+            "failed": _counters["failed"],
+        }
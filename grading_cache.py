@@ -0,0 +1,133 @@
+
+# 採点結果キャッシュ: 同じ問題への同じ（正規化後）回答は OpenAI を呼ばずに結果を返す
+# キー: 問題ID・模範解答のハッシュ・プロンプトのバージョン・正規化した回答のハッシュ
+# 古いエントリは TTL で失効し、件数が上限を超えたら最後に使われた順（LRU）で削除する。
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import db
+
+CACHE_PATH = os.getenv("GRADING_CACHE_PATH", os.path.join(os.path.dirname(__file__), "grading_cache.db"))
+# 有効期限（秒）: 既定は30日
+TTL_SECONDS = int(os.getenv("GRADING_CACHE_TTL", str(30 * 24 * 3600)))
+# 保持する最大件数
+MAX_ENTRIES = int(os.getenv("GRADING_CACHE_MAX_ENTRIES", "10000"))
+
+_lock = threading.Lock()
+_initialized = set()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+# キャッシュ用のテーブルを用意する（プロセス内で最初の1回だけ）
+def _ensure_schema(conn, path):
+    if path not in _initialized:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS grading_cache (
+                question_id INTEGER NOT NULL,
+                model_answer_hash TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                answer_hash TEXT NOT NULL,
+                answer_text TEXT,
+                score INTEGER,
+                feedback TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (question_id, model_answer_hash, prompt_version, answer_hash)
+            )
+        """)
+        # 較正用に正規化した回答本文も残す（古いキャッシュファイルには列を追加する）
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(grading_cache)")}
+        if "answer_text" not in columns:
+            conn.execute("ALTER TABLE grading_cache ADD COLUMN answer_text TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_grading_cache_last_used ON grading_cache(last_used)")
+        conn.commit()
+        _initialized.add(path)
+
+
+def _hash(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+# 回答の表記ゆれを吸収する（全角/半角・大文字/小文字・空白・句読点）
+def normalize_answer(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = re.sub(r"\s+", "", text)
+    return text.strip("。、.,!?！？")
+
+
+def _key(question_id, model_answer, prompt_version, user_answer):
+    return (question_id, _hash(model_answer), prompt_version, _hash(normalize_answer(user_answer)))
+
+
+# キャッシュを引く。ヒットすれば {"score", "feedback"}、なければ None
+def get(question_id, model_answer, prompt_version, user_answer, path=CACHE_PATH):
+    key = _key(question_id, model_answer, prompt_version, user_answer)
+    now = time.time()
+    with db.write(path) as conn:
+        _ensure_schema(conn, path)
+        row = conn.execute(
+            "SELECT score, feedback FROM grading_cache"
+            " WHERE question_id = ? AND model_answer_hash = ? AND prompt_version = ? AND answer_hash = ?"
+            " AND created_at >= ?",
+            key + (now - TTL_SECONDS,),
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                "UPDATE grading_cache SET last_used = ?, hits = hits + 1"
+                " WHERE question_id = ? AND model_answer_hash = ? AND prompt_version = ? AND answer_hash = ?",
+                (now,) + key,
+            )
+            conn.commit()
+    with _lock:
+        _stats["hits" if row is not None else "misses"] += 1
+    if row is None:
+        return None
+    return {"score": row[0], "feedback": row[1]}
+
+
+# 採点結果を保存し、期限切れと上限超過分を削除する
+def put(question_id, model_answer, prompt_version, user_answer, score, feedback, path=CACHE_PATH):
+    key = _key(question_id, model_answer, prompt_version, user_answer)
+    now = time.time()
+    with db.write(path) as conn:
+        _ensure_schema(conn, path)
+        conn.execute(
+            "INSERT OR REPLACE INTO grading_cache"
+            " (question_id, model_answer_hash, prompt_version, answer_hash, answer_text, score, feedback, created_at, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            key + (normalize_answer(user_answer), score, feedback, now, now),
+        )
+        expired = conn.execute("DELETE FROM grading_cache WHERE created_at < ?", (now - TTL_SECONDS,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM grading_cache WHERE rowid IN ("
+            " SELECT rowid FROM grading_cache ORDER BY last_used"
+            " LIMIT max(0, (SELECT count(*) FROM grading_cache) - ?))",
+            (MAX_ENTRIES,),
+        ).rowcount
+        conn.commit()
+    with _lock:
+        _stats["stores"] += 1
+        _stats["evictions"] += expired + overflow
+
+
+# LLM が採点した履歴 (question_id, 正規化した回答, 点数) を返す（ローカル採点の較正用）
+def history(path=CACHE_PATH):
+    with db.write(path) as conn:
+        _ensure_schema(conn, path)
+        return conn.execute(
+            "SELECT question_id, answer_text, score FROM grading_cache WHERE answer_text IS NOT NULL"
+        ).fetchall()
+
+
+# ヒット/ミスの集計（このプロセスが起動してからの値）
+def stats():
+    with _lock:
+        result = dict(_stats)
+    lookups = result["hits"] + result["misses"]
+    result["hit_rate"] = result["hits"] / lookups if lookups else 0.0
+    return result
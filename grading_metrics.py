@@ -0,0 +1,126 @@
+
+# 採点リクエストの計測: 1リクエストごとに、プロンプト／応答のトークン数・所要時間・
+# 最初の断片が届くまでの時間（TTFT）・試行回数・結果を grading_metrics テーブルに記録する
+# まとめ採点（複数の回答を1リクエストで採点）のときは、回答ごとに1行ずつ、トークン数を件数で割って記録する。
+# 集計と表示は pages/ の採点ダッシュボードで行う。
+import logging
+import os
+import threading
+import time
+import uuid
+
+import db
+import llm_client
+
+logger = logging.getLogger(__name__)
+
+# 1M トークンあたりの料金（USD）。ダッシュボードで費用を見積もるのに使う（gpt-4o-mini の料金）
+PRICE_INPUT_PER_M = float(os.getenv("GRADING_PRICE_INPUT", "0.15"))
+PRICE_OUTPUT_PER_M = float(os.getenv("GRADING_PRICE_OUTPUT", "0.60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grading_metrics (
+    id INTEGER PRIMARY KEY,
+    request_id TEXT NOT NULL,
+    question_id INTEGER,
+    kind TEXT NOT NULL,
+    items INTEGER NOT NULL DEFAULT 1,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens REAL,
+    completion_tokens REAL,
+    prompt_chars INTEGER,
+    truncated INTEGER NOT NULL DEFAULT 0,
+    wall_ms REAL NOT NULL,
+    ttft_ms REAL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_grading_metrics_created ON grading_metrics(created_at);
+CREATE INDEX IF NOT EXISTS idx_grading_metrics_question ON grading_metrics(question_id, created_at);
+"""
+
+_lock = threading.Lock()
+_initialized = set()
+
+
+def _ensure_schema(conn, db_path):
+    with _lock:
+        if db_path in _initialized:
+            return
+    conn.executescript(SCHEMA)
+    with _lock:
+        _initialized.add(db_path)
+
+
+def cost_usd(prompt_tokens, completion_tokens):
+    return ((prompt_tokens or 0) * PRICE_INPUT_PER_M + (completion_tokens or 0) * PRICE_OUTPUT_PER_M) / 1_000_000
+
+
+# 1リクエスト分を記録する（question_ids はそのリクエストで採点した問題の ID のリスト）
+def record(db_path, question_ids, kind, info, status, wall, prompt_chars, truncated=False):
+    usage = info.get("usage") or {}
+    items = max(1, len(question_ids))
+    prompt_tokens = usage.get("prompt_tokens")
+    completion_tokens = usage.get("completion_tokens")
+    request_id = uuid.uuid4().hex
+    now = time.time()
+    rows = [
+        (
+            request_id, question_id, kind, items, info.get("model") or llm_client.MODEL, status,
+            info.get("attempts", 0),
+            prompt_tokens / items if prompt_tokens is not None else None,
+            completion_tokens / items if completion_tokens is not None else None,
+            prompt_chars // items, int(truncated), wall * 1000,
+            info["ttft"] * 1000 if info.get("ttft") is not None else None, now,
+        )
+        for question_id in (question_ids or [None])
+    ]
+    with db.write(db_path) as conn:
+        _ensure_schema(conn, db_path)
+        conn.executemany(
+            "INSERT INTO grading_metrics (request_id, question_id, kind, items, model, status, attempts,"
+            " prompt_tokens, completion_tokens, prompt_chars, truncated, wall_ms, ttft_ms, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+
+
+# llm_client.stream_chat を呼び、終わったら（失敗しても）計測結果を記録する
+# status: ok / unavailable（再試行しても採点できなかった）/ error / aborted（途中で読むのをやめた）
+def tracked_chat(db_path, question_ids, client, prompt, kind="single", truncated=False, **kwargs):
+    info = {}
+    status = "error"
+    start = time.monotonic()
+    try:
+        yield from llm_client.stream_chat(client, [{"role": "user", "content": prompt}], info=info, **kwargs)
+        status = "ok"
+    except GeneratorExit:
+        status = "aborted"
+        raise
+    except llm_client.GradingUnavailable:
+        status = "unavailable"
+        raise
+    finally:
+        # 記録に失敗しても採点の結果（や本来の例外）を優先する
+        try:
+            record(db_path, question_ids, kind, info, status, time.monotonic() - start, len(prompt), truncated)
+        except Exception:
+            logger.exception("failed to record grading metrics for %s in %s", question_ids, db_path)
+
+
+# ダッシュボード用に期間内の行を読む（pandas の DataFrame）
+def load(db_path, since):
+    import pandas as pd
+
+    with db.read(db_path) as conn:
+        try:
+            return pd.read_sql_query(
+                "SELECT m.*, q.question_text FROM grading_metrics m"
+                " LEFT JOIN questions q ON q.id = m.question_id WHERE m.created_at >= ?",
+                conn, params=(since,),
+            )
+        except pd.errors.DatabaseError:
+            # まだ一度も採点していない（テーブルが無い）
+            return pd.DataFrame()
@@ -0,0 +1,91 @@
+
+# 採点プロンプト: 画面からの1件ずつの採点と、採点ワーカーのまとめ採点（複数の回答を1回のリクエストで採点）
+# 長い文章を貼り付けられてもプロンプト（トークン数＝費用と待ち時間）が膨らまないよう、
+# 回答と模範解答は上限の文字数で切り詰めてから埋め込む。
+import json
+import os
+import re
+
+# 採点プロンプトのバージョン（プロンプトを変えたら上げて、古い採点キャッシュを使わないようにする）
+PROMPT_VERSION = "v1"
+# プロンプトに入れる回答・模範解答の最大文字数（0 なら切り詰めない）
+MAX_ANSWER_CHARS = int(os.getenv("GRADING_MAX_ANSWER_CHARS", "800"))
+MAX_MODEL_ANSWER_CHARS = int(os.getenv("GRADING_MAX_MODEL_ANSWER_CHARS", "1500"))
+TRUNCATION_MARK = "…（以下省略）"
+
+
+def truncate(text, limit):
+    text = text or ""
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return text[:limit] + TRUNCATION_MARK
+
+
+# 回答か模範解答が切り詰められるか
+def is_truncated(model_answer, user_answer):
+    return (
+        0 < MAX_ANSWER_CHARS < len(user_answer or "")
+        or 0 < MAX_MODEL_ANSWER_CHARS < len(model_answer or "")
+    )
+
+
+# 1件ずつの採点（ストリーミングで「点数: xx点」の行が先頭に来る）
+def single_prompt(question, model_answer, user_answer):
+    model_answer = truncate(model_answer, MAX_MODEL_ANSWER_CHARS)
+    user_answer = truncate(user_answer, MAX_ANSWER_CHARS)
+    return f"""
+    あなたは世界で有数のリフォームの専門家であり、先生です。
+    「{question}」という質問に対する模範解答は、「{model_answer}」ですが、
+    あなたの生徒が「{user_answer}」と回答しました。
+    模範解答との類似性を採点基準としてこの回答に点数（100点満点）と具体的な改善点をポイント別に整理してアドバイスをください。
+    出力形式: 
+    点数: xx点
+    アドバイス: xxx
+    """
+
+
+# まとめ採点: items は {"id", "question_text", "model_answer", "answer_text"} のリスト
+def batch_prompt(items):
+    payload = json.dumps(
+        [
+            {"id": item["id"], "question": item["question_text"],
+             "model_answer": truncate(item["model_answer"], MAX_MODEL_ANSWER_CHARS),
+             "answer": truncate(item["answer_text"], MAX_ANSWER_CHARS)}
+            for item in items
+        ],
+        ensure_ascii=False,
+        indent=1,
+    )
+    return f"""
+    あなたは世界で有数のリフォームの専門家であり、先生です。
+    <answers> の中に、質問・模範解答・生徒の回答の組が JSON の配列で入っています。
+    それぞれの回答について、模範解答との類似性を採点基準として点数（100点満点）をつけ、具体的な改善点をポイント別に整理してアドバイスしてください。
+    出力は次の形式の JSON 配列だけにしてください（説明文やコードブロックは不要です）:
+    [{{"id": 1, "score": 80, "advice": "xxx"}}]
+    <answers>
+    {payload}
+    </answers>
+    """
+
+
+# まとめ採点の応答を {id: (score, advice)} にする（読めなかった回答は含めない）
+def parse_batch(text):
+    match = re.search(r"\[.*\]", text or "", re.S)
+    if match is None:
+        return {}
+    try:
+        rows = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    results = {}
+    for row in rows if isinstance(rows, list) else []:
+        try:
+            results[int(row["id"])] = (max(0, min(100, int(row["score"]))), str(row.get("advice", "")))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return results
+
+
+# まとめ採点の結果を、1件ずつの採点と同じ形式の文章にする
+def feedback_text(score, advice):
+    return f"点数: {score}点\nアドバイス: {advice}"
@@ -0,0 +1,173 @@
+
+# 採点キュー: 自由記述の回答を DB に積み、採点ワーカー（grading_worker.py）が順に採点して結果を書き戻す
+# 次の2つの場合に使う:
+#   - 後で採点: OpenAI が落ちている・レート制限が続いているなど（llm_client.GradingUnavailable）で
+#     すぐに採点できなかった回答
+#   - 試験モード: 一斉に提出される回答を即時に採点せず、まとめて採点する
+# 画面は ID だけを覚えておき、採点が済んだら結果を表示する（アプリを再起動しても失われない）。
+# ワーカーは取り出した回答に「採点中」の印（claimed_at）を付けるので、複数のワーカーが動いていても
+# 同じ回答を二重に採点しない。印が古いまま残った回答（ワーカーが落ちた）は再び取り出される。
+import os
+import threading
+import time
+
+import db
+
+# 1件の回答の採点に失敗してよい回数（超えたら error にする）
+# 採点サービスが使えなかった回（GradingUnavailable・ブレーカーが開いている間）は数えないので、障害が長引いても待ち続ける
+MAX_TRIES = int(os.getenv("GRADING_QUEUE_MAX_TRIES", "5"))
+# 採点中のまま、この秒数を過ぎた回答は取り出し直す
+CLAIM_TIMEOUT = float(os.getenv("GRADING_QUEUE_CLAIM_TIMEOUT", "300"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grading_queue (
+    id INTEGER PRIMARY KEY,
+    attempt_id TEXT,
+    tenant TEXT NOT NULL,
+    question_id INTEGER NOT NULL,
+    question_text TEXT NOT NULL,
+    model_answer TEXT NOT NULL,
+    answer_text TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    tries INTEGER NOT NULL DEFAULT 0,
+    score INTEGER,
+    feedback TEXT,
+    error TEXT,
+    enqueued_at REAL NOT NULL,
+    graded_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_grading_queue_status ON grading_queue(status, id);
+"""
+
+_lock = threading.Lock()
+_initialized = set()
+_stats = {"enqueued": 0, "claimed": 0, "graded": 0, "failed": 0, "deferred": 0}
+
+
+def _count(key, amount=1):
+    with _lock:
+        _stats[key] += amount
+
+
+def _ensure_schema(db_path):
+    with _lock:
+        if db_path in _initialized:
+            return
+    with db.write(db_path) as conn:
+        conn.executescript(SCHEMA)
+        # 以前のキュー（後で採点だけのもの）には列を追加する
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(grading_queue)")}
+        if "mode" not in columns:
+            conn.execute("ALTER TABLE grading_queue ADD COLUMN mode TEXT NOT NULL DEFAULT 'later'")
+        if "claimed_at" not in columns:
+            conn.execute("ALTER TABLE grading_queue ADD COLUMN claimed_at REAL")
+        conn.commit()
+    with _lock:
+        _initialized.add(db_path)
+
+
+# 回答をキューに積んで ID を返す（mode: "later" = 後で採点 / "exam" = 試験モード）
+def enqueue(db_path, attempt_id, tenant, question_data, answer_text, mode="later"):
+    _ensure_schema(db_path)
+    with db.write(db_path) as conn:
+        cursor = conn.execute(
+            "INSERT INTO grading_queue"
+            " (attempt_id, tenant, question_id, question_text, model_answer, answer_text, mode, enqueued_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (attempt_id, tenant or "", question_data["id"], question_data["question_text"],
+             question_data["model_answer"], answer_text, mode, time.time()),
+        )
+        conn.commit()
+    _count("enqueued")
+    return cursor.lastrowid
+
+
+# キューの1件（status: pending → running → done / error）
+def get(db_path, item_id):
+    _ensure_schema(db_path)
+    with db.read(db_path) as conn:
+        row = conn.execute(
+            "SELECT status, score, feedback, error, tries, answer_text FROM grading_queue WHERE id = ?", (item_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {
+        "id": item_id, "status": row[0], "score": row[1], "feedback": row[2], "error": row[3], "tries": row[4],
+        "answer_text": row[5],
+    }
+
+
+# 自分より前に採点を待っている件数
+def position(db_path, item_id):
+    _ensure_schema(db_path)
+    with db.read(db_path) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM grading_queue WHERE status IN ('pending', 'running') AND id < ?", (item_id,)
+        ).fetchone()[0]
+
+
+# 採点を待っている件数と、そのうち最も古いものが積まれた時刻
+def backlog(db_path):
+    _ensure_schema(db_path)
+    with db.read(db_path) as conn:
+        count, oldest = conn.execute(
+            "SELECT COUNT(*), MIN(enqueued_at) FROM grading_queue WHERE status = 'pending'"
+            " OR (status = 'running' AND claimed_at < ?)",
+            (time.time() - CLAIM_TIMEOUT,),
+        ).fetchone()
+    return count, oldest
+
+
+# 古い順に最大 limit 件を取り出して「採点中」にする
+def claim(db_path, limit):
+    _ensure_schema(db_path)
+    now = time.time()
+    with db.write(db_path) as conn:
+        rows = conn.execute(
+            "UPDATE grading_queue SET status = 'running', claimed_at = ? WHERE id IN ("
+            " SELECT id FROM grading_queue WHERE status = 'pending' OR (status = 'running' AND claimed_at < ?)"
+            " ORDER BY id LIMIT ?)"
+            " RETURNING id, question_id, question_text, model_answer, answer_text, tries",
+            (now, now - CLAIM_TIMEOUT, limit),
+        ).fetchall()
+        conn.commit()
+    _count("claimed", len(rows))
+    return sorted(
+        (
+            {"id": row[0], "question_id": row[1], "question_text": row[2], "model_answer": row[3],
+             "answer_text": row[4], "tries": row[5]}
+            for row in rows
+        ),
+        key=lambda item: item["id"],
+    )
+
+
+# 採点結果を書き戻す
+def complete(db_path, item, score, feedback):
+    with db.write(db_path) as conn:
+        conn.execute(
+            "UPDATE grading_queue SET status = 'done', tries = ?, score = ?, feedback = ?, error = NULL, graded_at = ?"
+            " WHERE id = ?",
+            (item["tries"] + 1, score, feedback, time.time(), item["id"]),
+        )
+        conn.commit()
+    _count("graded")
+
+
+# 今は採点できなかったので待ちに戻す。counted=True（その回答の採点に失敗した）なら回数を数え、上限に達したら error にする
+# counted=False（採点サービスが使えなかった）なら回数を数えずに待ちに戻す
+def defer(db_path, item, error, counted=True):
+    tries = item["tries"] + 1 if counted else item["tries"]
+    status = "pending" if tries < MAX_TRIES else "error"
+    with db.write(db_path) as conn:
+        conn.execute(
+            "UPDATE grading_queue SET status = ?, tries = ?, error = ?, claimed_at = NULL WHERE id = ?",
+            (status, tries, str(error), item["id"]),
+        )
+        conn.commit()
+    _count("deferred" if status == "pending" else "failed")
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
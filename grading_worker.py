@@ -0,0 +1,166 @@
+
+# 採点ワーカー: 採点キュー（grading_queue）の回答をまとめて採点し、結果を書き戻す
+# 試験のように短時間に回答が集中しても、1件ずつ OpenAI を呼ぶ代わりに最大 BATCH_SIZE 件を
+# 1回のリクエストで採点するので、リクエスト数（と繰り返し送るプロンプトの分のトークン）が減り、
+# 負荷の山もならされる。回答が BATCH_SIZE 件たまるか、最も古い回答が BATCH_MAX_WAIT 秒待ったら採点する。
+# まとめた応答から読み取れなかった回答だけは、1件ずつの採点でやり直す。
+#
+# アプリのプロセス内のスレッドとしても（start_thread）、別プロセスとしても動かせる:
+#   python grading_worker.py --db quiz_ver2.db
+#   （API キーは環境変数 OPENAI_API_KEY または .env から読む。GRADING_BACKEND=stub でスタブに接続）
+import argparse
+import logging
+import os
+import threading
+import time
+
+import grading
+import grading_cache
+import grading_metrics
+import grading_prompts
+import grading_queue
+import llm_client
+
+logger = logging.getLogger(__name__)
+
+# 1回のリクエストで採点する最大件数
+BATCH_SIZE = int(os.getenv("GRADING_BATCH_SIZE", "8"))
+# 回答が BATCH_SIZE 件たまらなくても、最も古い回答がこの秒数待ったら採点する
+BATCH_MAX_WAIT = float(os.getenv("GRADING_BATCH_MAX_WAIT", "3"))
+# キューを確認する間隔（秒）
+POLL_INTERVAL = float(os.getenv("GRADING_WORKER_POLL_INTERVAL", "0.5"))
+# まとめ採点の応答トークン数の見積もり（1件あたり）
+COMPLETION_TOKENS_PER_ITEM = 300
+
+_lock = threading.Lock()
+_threads = {}
+_stats = {"batches": 0, "batched_items": 0, "single_items": 0, "requests": 0}
+
+
+def _count(key, amount=1):
+    with _lock:
+        _stats[key] += amount
+
+
+def _store(db_path, item, feedback):
+    score = grading.parse_score(feedback)
+    grading_queue.complete(db_path, item, score, feedback)
+    grading_cache.put(
+        item["question_id"], item["model_answer"], grading_prompts.PROMPT_VERSION,
+        item["answer_text"], score, feedback,
+    )
+
+
+# 1件ずつ採点する（まとめた応答から読めなかった回答、または1件だけのとき）
+def grade_single(db_path, client, item):
+    prompt = grading_prompts.single_prompt(item["question_text"], item["model_answer"], item["answer_text"])
+    _count("requests")
+    feedback = "".join(grading_metrics.tracked_chat(
+        db_path, [item["question_id"]], client, prompt,
+        truncated=grading_prompts.is_truncated(item["model_answer"], item["answer_text"]),
+    ))
+    _count("single_items")
+    _store(db_path, item, feedback)
+
+
+# 取り出した回答をまとめて採点する
+def grade_batch(db_path, client, items):
+    pending = list(items)
+    try:
+        if len(pending) > 1:
+            prompt = grading_prompts.batch_prompt(pending)
+            _count("requests")
+            text = "".join(grading_metrics.tracked_chat(
+                db_path, [item["question_id"] for item in pending], client, prompt, kind="batch",
+                truncated=any(grading_prompts.is_truncated(i["model_answer"], i["answer_text"]) for i in pending),
+                completion_tokens=COMPLETION_TOKENS_PER_ITEM * len(pending),
+                deadline=llm_client.CALL_DEADLINE * 2,
+            ))
+            results = grading_prompts.parse_batch(text)
+            for item in list(pending):
+                if item["id"] in results:
+                    _store(db_path, item, grading_prompts.feedback_text(*results[item["id"]]))
+                    pending.remove(item)
+                    _count("batched_items")
+            _count("batches")
+            if pending:
+                logger.warning("batch grading returned %d/%d results", len(items) - len(pending), len(items))
+        while pending:
+            grade_single(db_path, client, pending[0])
+            pending.pop(0)
+    except llm_client.GradingUnavailable as e:
+        # 採点サービスが使えないだけなので、採点できなかった回答は回数を数えずに待ちに戻す（採点済みのものはそのまま）
+        for item in pending:
+            grading_queue.defer(db_path, item, e, counted=False)
+        return False
+    except Exception as e:
+        # 回答ごとの失敗（リクエストの内容が原因のエラーなど）は回数を数え、上限に達したら error にする
+        logger.exception("grading batch failed")
+        for item in pending:
+            grading_queue.defer(db_path, item, e)
+    return True
+
+
+# まとめて採点する頃合いなら1回分を採点する（採点したら True）
+def run_once(db_path, client, batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT):
+    if not llm_client.breaker.ready():
+        return False
+    count, oldest = grading_queue.backlog(db_path)
+    if count == 0 or (count < batch_size and time.time() - oldest < max_wait):
+        return False
+    items = grading_queue.claim(db_path, batch_size)
+    if not items:
+        return False
+    return grade_batch(db_path, client, items)
+
+
+def run_forever(db_path, get_client, batch_size=BATCH_SIZE, max_wait=BATCH_MAX_WAIT):
+    client = None
+    while True:
+        try:
+            if client is None:
+                client = get_client()
+            graded = run_once(db_path, client, batch_size, max_wait)
+        except Exception:
+            logger.exception("grading worker error")
+            graded = False
+        if not graded:
+            time.sleep(POLL_INTERVAL)
+
+
+# アプリのプロセス内でワーカーを動かす（DB ごとに1本だけ）
+def start_thread(db_path, get_client):
+    with _lock:
+        thread = _threads.get(db_path)
+        if thread is not None and thread.is_alive():
+            return thread
+        thread = threading.Thread(target=run_forever, args=(db_path, get_client), name="grading-worker", daemon=True)
+        _threads[db_path] = thread
+    thread.start()
+    return thread
+
+
+def stats():
+    with _lock:
+        return dict(_stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="採点キューの回答をまとめて採点する")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_ver2.db"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="1回のリクエストで採点する最大件数")
+    parser.add_argument("--max-wait", type=float, default=BATCH_MAX_WAIT, help="回答がたまるのを待つ最大秒数")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logger.info("grading worker started: db=%s batch_size=%d max_wait=%.1fs", args.db, args.batch_size, args.max_wait)
+    run_forever(
+        args.db, lambda: llm_client.create_client(lambda: os.environ["OPENAI_API_KEY"]),
+        args.batch_size, args.max_wait,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+
+# 問題の一括取り込み: CSV / JSONL / Excel から quiz（選択式）と questions（自由記述）に問題を追加する
+# ファイルはチャンクごとに読み込むので、10万行のファイルでもメモリ使用量は一定。
+# 全チャンクを1つのトランザクションで executemany し、途中で失敗したら何も書き込まない。
+#
+# 使い方:
+#   python import_questions.py quiz.csv                       # 列名から取り込み先のテーブルを判定
+#   python import_questions.py free.jsonl --table questions --db quiz.db
+#   python import_questions.py bank.xlsx --dry-run            # 検証だけ行う
+#
+# 列名:
+#   quiz      : question, option1, option2, option3, answerIndex（0〜2）
+#   questions : question_text, model_answer
+# 同じ内容の問題（正規化した本文のハッシュが同じもの）は DB にあってもファイル内で重複していても1件だけ入る。
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+import unicodedata
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(__file__), "quiz_ver2.db")
+CHUNK_SIZE = 5000
+
+COLUMNS = {
+    "quiz": ("question", "option1", "option2", "option3", "answerIndex"),
+    "questions": ("question_text", "model_answer"),
+}
+
+
+# 取り込めない行（行番号と理由を表示してスキップする）
+class InvalidRow(ValueError):
+    pass
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return unicodedata.normalize("NFKC", str(value)).strip()
+
+
+def content_hash(values):
+    return hashlib.sha256("\x1f".join(_text(v) for v in values).encode("utf-8")).hexdigest()
+
+
+# 1行を検証して INSERT 用のタプルにする
+def validate(table, record):
+    values = []
+    for column in COLUMNS[table]:
+        value = record.get(column)
+        if column == "answerIndex":
+            # Excel や JSONL では 1.0 のような小数で入ることがあるので、整数の値だけを受け付ける（1.7 や inf は不正）
+            try:
+                number = float(_text(value))
+            except ValueError:
+                raise InvalidRow(f"answerIndex が数値ではありません: {value!r}")
+            if not number.is_integer():
+                raise InvalidRow(f"answerIndex は整数で指定してください: {value!r}")
+            value = int(number)
+            if value not in (0, 1, 2):
+                raise InvalidRow(f"answerIndex は 0〜2 で指定してください: {value}")
+        else:
+            value = str(value).strip() if value is not None else ""
+            if not value:
+                raise InvalidRow(f"{column} が空です")
+        values.append(value)
+    if table == "quiz" and len({_text(v) for v in values[1:4]}) < 3:
+        raise InvalidRow("選択肢が重複しています")
+    return tuple(values) + (content_hash(values),)
+
+
+# ファイル形式に応じてレコード（dict）のチャンクを順に返す
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        yield from _read_excel_chunks(path, chunk_size)
+        return
+    import pandas as pd
+
+    if ext == ".csv":
+        reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size, encoding="utf-8-sig")
+    elif ext in (".jsonl", ".ndjson"):
+        reader = pd.read_json(path, lines=True, dtype=False, chunksize=chunk_size)
+    else:
+        raise ValueError(f"対応していないファイル形式です: {path}")
+    with reader:
+        for frame in reader:
+            # JSONL で欠けたキーや null は NaN になるので None（空）に戻して、validate で空として扱う
+            yield frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+# pandas.read_excel はチャンク読み込みができないので、openpyxl の read_only モードで1行ずつ読む
+def _read_excel_chunks(path, chunk_size):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h).strip() if h is not None else "" for h in next(rows, ())]
+        chunk = []
+        for row in rows:
+            chunk.append(dict(zip(header, row)))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+
+# 列名から取り込み先のテーブルを判定する
+def detect_table(record):
+    for table, columns in COLUMNS.items():
+        if all(column in record for column in columns):
+            return table
+    raise ValueError(f"列名から取り込み先を判定できません: {sorted(record)}")
+
+
+# 重複判定用の content_hash 列と一意インデックスを用意する（既存の行にもハッシュを付ける）
+def ensure_hash_column(conn, table):
+    columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if "content_hash" not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN content_hash TEXT")
+    select = ", ".join(COLUMNS[table])
+    missing = conn.execute(f"SELECT id, {select} FROM {table} WHERE content_hash IS NULL").fetchall()
+    seen = {row[0] for row in conn.execute(f"SELECT content_hash FROM {table} WHERE content_hash IS NOT NULL")}
+    for row in missing:
+        digest = content_hash(row[1:])
+        # 既存の重複はどちらも残し、後の行はハッシュを付けない（一意インデックスに違反しないように）
+        if digest in seen:
+            continue
+        seen.add(digest)
+        conn.execute(f"UPDATE {table} SET content_hash = ? WHERE id = ?", (digest, row[0]))
+    conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_content_hash ON {table}(content_hash)")
+
+
+def import_file(path, db_path=DEFAULT_DB_PATH, table=None, chunk_size=CHUNK_SIZE, dry_run=False, out=sys.stdout):
+    start = time.perf_counter()
+    counts = {"read": 0, "inserted": 0, "duplicates": 0, "invalid": 0}
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        prepared = False
+        for chunk in read_chunks(path, chunk_size):
+            if not chunk:
+                continue
+            if not prepared:
+                table = table or detect_table(chunk[0])
+                ensure_hash_column(conn, table)
+                prepared = True
+            rows = []
+            for number, record in enumerate(chunk, counts["read"] + 1):
+                try:
+                    rows.append(validate(table, record))
+                except InvalidRow as e:
+                    counts["invalid"] += 1
+                    print(f"{path}: {number}件目: {e}", file=out)
+            counts["read"] += len(chunk)
+            if rows:
+                columns = COLUMNS[table] + ("content_hash",)
+                # rowcount は無視された行と、トリガー（全文検索の索引の更新）による変更を含まない
+                inserted = conn.executemany(
+                    f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    rows,
+                ).rowcount
+                counts["inserted"] += inserted
+                counts["duplicates"] += len(rows) - inserted
+        conn.execute("ROLLBACK" if dry_run else "COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    elapsed = time.perf_counter() - start
+    rate = counts["read"] / elapsed if elapsed else 0.0
+    print(
+        f"{path} → {table}: 読込 {counts['read']} 行 / 追加 {counts['inserted']} 行 / "
+        f"重複 {counts['duplicates']} 行 / 不正 {counts['invalid']} 行 "
+        f"（{elapsed:.2f} 秒, {rate:,.0f} 行/秒）" + ("  ※dry-run のため書き込みなし" if dry_run else ""),
+        file=out,
+    )
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CSV / JSONL / Excel から問題を一括で取り込む")
+    parser.add_argument("files", nargs="+", help="取り込むファイル（.csv / .jsonl / .xlsx）")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="取り込み先の SQLite ファイル")
+    parser.add_argument("--table", choices=sorted(COLUMNS), help="取り込み先のテーブル（省略時は列名から判定）")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="一度に読み込む行数")
+    parser.add_argument("--dry-run", action="store_true", help="検証だけ行い、DB には書き込まない")
+    args = parser.parse_args(argv)
+    for path in args.files:
+        import_file(path, args.db, args.table, args.chunk_size, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
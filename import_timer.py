@@ -0,0 +1,102 @@
+
+# import にかかった時間の計測（python -X importtime と同じ形式で出力する）
+# measure() の中で初めて読み込まれたモジュールについて、自分自身の時間（self）と
+# 配下のモジュールを含めた時間（cumulative）を記録し、起動時にログへ出す。
+import builtins
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_original_import = builtins.__import__
+_lock = threading.Lock()
+_records = []
+_state = threading.local()
+_reported = False
+_started = False
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    stack = getattr(_state, "stack", None)
+    # 計測中のスレッド以外・相対 import・読み込み済みのモジュールはそのまま通す
+    if stack is None or level or name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    depth = len(stack)
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = time.perf_counter() - start
+        children = stack.pop()
+        if stack:
+            stack[-1] += cumulative
+        with _lock:
+            _records.append((depth, name, cumulative - children, cumulative))
+
+
+# このブロックの中で行われた import を計測する
+@contextmanager
+def measure():
+    if getattr(_state, "stack", None) is not None:
+        yield
+        return
+    _state.stack = []
+    builtins.__import__ = _timed_import
+    try:
+        yield
+    finally:
+        builtins.__import__ = _original_import
+        _state.stack = None
+
+
+# アプリの起動時（プロセスで最初の実行）だけ import を計測し、終わったら表をログに出す
+# builtins.__import__ はプロセス全体で差し替わるので、他のセッションが動いている2回目以降の実行では何もしない
+@contextmanager
+def measure_startup():
+    global _started
+    with _lock:
+        first, _started = not _started, True
+    if not first:
+        yield
+        return
+    with measure():
+        yield
+    log_startup_report()
+
+
+# 必要になったときにモジュールを読み込む（初回の読み込み時間を記録する）
+def lazy_import(name):
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    with measure():
+        # importlib.import_module は builtins.__import__ を通らないので、計測用の __import__ を直接呼ぶ
+        builtins.__import__(name)
+    logger.info("lazy import %s: %.1f ms", name, (time.perf_counter() - start) * 1000)
+    return sys.modules[name]
+
+
+# -X importtime と同じ形式の表（読み込まれた順、子モジュールは字下げ）
+def report():
+    with _lock:
+        records = list(_records)
+    lines = ["import time: self [us] | cumulative | imported package"]
+    # 子モジュールは親より先に記録されるので、-X importtime と同じく記録順に並べる
+    for depth, name, self_time, cumulative in records:
+        lines.append(f"import time: {self_time * 1e6:9.0f} | {cumulative * 1e6:10.0f} | {'  ' * depth}{name}")
+    return "\n".join(lines)
+
+
+# 起動時に一度だけ import 時間をログに出す（ログの設定によらず表示されるよう WARNING で出す）
+def log_startup_report():
+    global _reported
+    with _lock:
+        if _reported:
+            return
+        _reported = True
+    logger.warning("startup imports:\n%s", report())
@@ -0,0 +1,332 @@
+
+# 採点に使う OpenAI クライアントを設定に応じて作り、呼び出しを保護する
+# GRADING_BACKEND（環境変数）で接続先を選ぶ:
+#   openai : OpenAI API（既定）
+#   stub   : 同梱のローカルスタブ（openai_stub.py）。課金もネットワークも不要なので負荷試験に使う。
+#            OPENAI_STUB_URL があればそのスタブに、無ければこのプロセス内で起動したスタブに接続する
+#
+# stream_chat() は採点1回ぶんの呼び出しを次のように保護する（状態はプロセス全体＝全セッションで共有）:
+#   - 期限: 1回の採点にかける時間の上限（再試行や待ち時間も含む）
+#   - 再試行: 429・タイムアウト・接続エラー・5xx は指数バックオフ（ジッター付き）で再試行する
+#     （401・403 は再試行しないが、API キーや権限の問題でサービスを使えないので失敗として扱う）
+#   - レート制限: 組織の RPM / TPM に合わせたトークンバケットで送信ペースを抑える
+#   - サーキットブレーカー: 失敗が続いたら一定時間呼び出しを止め、すぐに GradingUnavailable を返す
+#     （成功・失敗は再試行を含めた1回の採点ごとに1回だけ記録する）
+#     （呼び出し側は「後で採点」のキュー grading_queue に回す）
+import logging
+import os
+import random
+import threading
+import time
+
+import import_timer
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv("GRADING_BACKEND", "openai")
+BACKENDS = ("openai", "stub")
+# 採点に使うモデル
+MODEL = os.getenv("GRADING_MODEL", "gpt-4o-mini")
+
+# 1回の採点にかける時間の上限（秒）
+CALL_DEADLINE = float(os.getenv("GRADING_DEADLINE", "60"))
+# 最初の1文字が届くまで／断片と断片の間に待つ時間の上限（秒）
+READ_TIMEOUT = float(os.getenv("GRADING_READ_TIMEOUT", "20"))
+# 再試行の回数と、バックオフの基準・上限（秒）
+MAX_RETRIES = int(os.getenv("GRADING_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.getenv("GRADING_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("GRADING_BACKOFF_MAX", "8"))
+# 組織のレート制限（1分あたりのリクエスト数・トークン数）
+RPM_LIMIT = int(os.getenv("OPENAI_RPM", "500"))
+TPM_LIMIT = int(os.getenv("OPENAI_TPM", "200000"))
+# 応答のトークン数の見積もり（実際の使用量が分かったら差分を戻す）
+COMPLETION_TOKENS_ESTIMATE = int(os.getenv("GRADING_COMPLETION_TOKENS", "400"))
+# この回数続けて失敗したらブレーカーを開き、COOLDOWN 秒は呼び出さない
+BREAKER_FAILURES = int(os.getenv("GRADING_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("GRADING_BREAKER_COOLDOWN", "30"))
+
+
+# 今は採点できない（再試行しても失敗した／ブレーカーが開いている／期限切れ）
+class GradingUnavailable(Exception):
+    pass
+
+
+class CircuitOpen(GradingUnavailable):
+    pass
+
+
+class DeadlineExceeded(GradingUnavailable):
+    pass
+
+
+_lock = threading.Lock()
+_counters = {
+    "calls": 0, "succeeded": 0, "failed": 0, "retries": 0, "rate_limited": 0, "timeouts": 0,
+    "auth_errors": 0, "throttled": 0, "throttle_seconds": 0.0, "short_circuited": 0, "breaker_opened": 0,
+}
+
+
+def _count(key, amount=1):
+    with _lock:
+        _counters[key] += amount
+
+
+# トークンバケット: 1分あたり limit 個のペースで補充され、最大 limit 個まで貯まる
+# 足りない分は前借りして（残量がマイナスになる）、補充されるまで呼び出し側が待つので、到着順に送信される
+class TokenBucket:
+    def __init__(self, limit_per_minute):
+        self.capacity = float(limit_per_minute)
+        self.rate = limit_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # amount 個を予約し、使えるようになるまでの待ち時間（秒）を返す
+    # max_wait より長く待つ必要があるなら予約せず None を返す
+    def reserve(self, amount, max_wait):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, (amount - self.tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self.tokens -= amount
+            return wait
+
+    # 使わなかった分を戻す（見積もりより実際の使用量が少なかったときなど）
+    def refund(self, amount):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+# サーキットブレーカー（closed → 失敗が続くと open → 冷却後 half_open で1件だけ試す）
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    # 呼び出してよいか（half_open のときは1件だけ通す）
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self._trial = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    # 呼び出さずに、今なら通るかだけを見る
+    def ready(self):
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return self.state == "closed" or not self._trial
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("grading circuit breaker closed")
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failures:
+                if self.state != "open":
+                    logger.warning("grading circuit breaker opened after %d failures", self.consecutive_failures)
+                    _count("breaker_opened")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+request_bucket = TokenBucket(RPM_LIMIT)
+token_bucket = TokenBucket(TPM_LIMIT)
+breaker = CircuitBreaker()
+
+
+# get_api_key は OpenAI API を使うときだけ呼ぶ（スタブなら API キーは不要）
+# 再試行は stream_chat で行うので、クライアント自身の再試行は無効にする
+def create_client(get_api_key):
+    if BACKEND not in BACKENDS:
+        raise ValueError(f"GRADING_BACKEND は {' / '.join(BACKENDS)} のいずれかを指定してください: {BACKEND!r}")
+    openai = import_timer.lazy_import("openai")
+    if BACKEND == "stub":
+        base_url = os.getenv("OPENAI_STUB_URL")
+        if not base_url:
+            import openai_stub
+
+            base_url = openai_stub.default_server().url
+        return openai.OpenAI(api_key="sk-stub", base_url=base_url, max_retries=0)
+    return openai.OpenAI(api_key=get_api_key(), max_retries=0)
+
+
+# 日本語はおおよそ1文字1トークンとして見積もる
+def estimate_tokens(messages):
+    return sum(len(str(m.get("content", ""))) for m in messages)
+
+
+# 指数バックオフ（フルジッター）。429 に Retry-After があればそれ以上待つ
+def backoff_delay(attempt, retry_after=None):
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+# 失敗の種類（auth と None は再試行しない。None はリクエストの内容が原因のエラー）
+def _classify(error):
+    openai = import_timer.lazy_import("openai")
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+        return "auth_errors"
+    if isinstance(error, openai.RateLimitError):
+        return "rate_limited"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeouts"
+    if isinstance(error, (openai.APIConnectionError, openai.InternalServerError)):
+        return "retryable"
+    return None
+
+
+# レート制限の枠を確保する（期限までに確保できなければ DeadlineExceeded）
+def _acquire(tokens, deadline):
+    remaining = deadline - time.monotonic()
+    wait = request_bucket.reserve(1, remaining)
+    if wait is None:
+        raise DeadlineExceeded("レート制限の待ち時間が期限を超えます")
+    token_wait = token_bucket.reserve(tokens, remaining - wait)
+    if token_wait is None:
+        request_bucket.refund(1)
+        raise DeadlineExceeded("レート制限の待ち時間が期限を超えます")
+    wait = max(wait, token_wait)
+    if wait > 0:
+        _count("throttled")
+        _count("throttle_seconds", wait)
+        time.sleep(wait)
+
+
+# chat.completions をストリーミングで呼び出し、届いた文章の断片を順に返す
+# info を渡すと、試行回数・最初の断片までの時間・トークン使用量を書き込む
+# completion_tokens は応答のトークン数の見積もり（レート制限用。省略時は COMPLETION_TOKENS_ESTIMATE）
+def stream_chat(client, messages, model=None, deadline=None, info=None, completion_tokens=None, **kwargs):
+    model = model or MODEL
+    deadline = time.monotonic() + (deadline or CALL_DEADLINE)
+    estimated = estimate_tokens(messages) + (completion_tokens or COMPLETION_TOKENS_ESTIMATE)
+    info = info if info is not None else {}
+    info.update(attempts=0, ttft=None, usage=None)
+    _count("calls")
+    attempt = 0
+    while True:
+        # ブレーカーを通るのは最初の試行だけ（half_open で1件だけ通されたときも、その呼び出しの再試行は続けられる）
+        if attempt == 0 and not breaker.ready():
+            _count("short_circuited")
+            _count("failed")
+            raise CircuitOpen("採点サービスが一時的に利用できません")
+        try:
+            _acquire(estimated, deadline)
+        except DeadlineExceeded:
+            _count("failed")
+            # 再試行の途中なら、それまでの試行が失敗しているので呼び出し全体の失敗として記録する
+            if attempt > 0:
+                breaker.record_failure()
+            raise
+        if attempt == 0 and not breaker.allow():
+            # レート制限を待っている間に他の呼び出しが失敗してブレーカーが開いた
+            request_bucket.refund(1)
+            token_bucket.refund(estimated)
+            _count("short_circuited")
+            _count("failed")
+            raise CircuitOpen("採点サービスが一時的に利用できません")
+        info["attempts"] += 1
+        started = time.monotonic()
+        yielded = False
+        try:
+            remaining = deadline - started
+            if remaining <= 0:
+                raise DeadlineExceeded("採点の期限を過ぎました")
+            response = client.with_options(timeout=min(READ_TIMEOUT, remaining)).chat.completions.create(
+                model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **kwargs
+            )
+            try:
+                for chunk in response:
+                    if time.monotonic() > deadline:
+                        raise DeadlineExceeded("採点の期限を過ぎました")
+                    if getattr(chunk, "usage", None):
+                        info["usage"] = chunk.usage.model_dump()
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if info["ttft"] is None:
+                            info["ttft"] = time.monotonic() - started
+                        yielded = True
+                        yield chunk.choices[0].delta.content
+            finally:
+                response.close()
+        except GeneratorExit:
+            # 呼び出し側が途中で読むのをやめた（応答は届いていたので成功として扱う）
+            breaker.record_success()
+            raise
+        except DeadlineExceeded:
+            _count("timeouts")
+            _count("failed")
+            breaker.record_failure()
+            raise
+        except Exception as e:
+            kind = _classify(e)
+            if kind is None:
+                # リクエストの内容が原因のエラー（400 など）は再試行しても変わらない（サービス自体は動いている）
+                breaker.record_success()
+                _count("failed")
+                raise
+            if kind != "retryable":
+                _count(kind)
+            delay = backoff_delay(attempt, _retry_after(e))
+            # 文章を一部返してしまった後は、やり直すと重複するので再試行しない
+            # 他の呼び出しの失敗でブレーカーが開いたら、再試行をやめて早く「後で採点」に回す
+            if (
+                kind == "auth_errors" or yielded or attempt >= MAX_RETRIES
+                or time.monotonic() + delay >= deadline or breaker.state == "open"
+            ):
+                _count("failed")
+                breaker.record_failure()
+                raise GradingUnavailable(f"採点に失敗しました（{attempt + 1}回試行）: {e}") from e
+            logger.info("grading call failed (%s), retrying in %.2fs", type(e).__name__, delay)
+            _count("retries")
+            attempt += 1
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        _count("succeeded")
+        if info["usage"]:
+            token_bucket.refund(max(0, estimated - info["usage"].get("total_tokens", estimated)))
+        return
+
+
+# 再試行・レート制限・ブレーカーの状況
+def metrics():
+    with _lock:
+        counters = dict(_counters)
+    counters["breaker_state"] = breaker.state
+    counters["consecutive_failures"] = breaker.consecutive_failures
+    counters["request_tokens_available"] = round(request_bucket.tokens, 1)
+    counters["tpm_tokens_available"] = round(token_bucket.tokens)
+    return counters
@@ -0,0 +1,385 @@
+
+# ローカル採点: OpenAI を使わず、CPU だけで自由記述の回答を採点する（インターネットに出られない拠点向け）
+# 文字 n-gram（2〜3文字）をハッシュで DIM 次元に写した TF-IDF ベクトルで、回答と模範解答のコサイン類似度を求める。
+# 模範解答のベクトルは事前に計算して .npy に保存し、メモリマップで読む（起動のたびに作り直さず、
+# 同じマシンの複数のプロセスで OS のページキャッシュを共有する。読むのは採点した問題の行だけ）。
+# 点数は類似度と「模範解答の要点（文）をどれだけ含むか」から出し、アドバイスは規則で組み立てる。
+# 返す文章は LLM と同じ「点数: xx点 / アドバイス:」の形式なので、採点結果の扱いは変わらない。
+#
+#   python local_grader.py build --db quiz_ver2.db    # 模範解答のベクトルを作り直す（問題を一括で取り込んだあとなど）
+#   python local_grader.py bench --db quiz_ver2.db    # 1コアでの採点速度と、LLM の点数との一致度を測る
+#
+# ベクトルが無ければ最初の採点のときに作る。作ったあとに追加・変更された問題は、その場で模範解答のベクトルを計算する。
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+import db
+import prescorer
+
+# ハッシュで写すベクトルの次元（2 のべき乗）。1問あたり DIM * 2 バイト（float16）
+DIM = int(os.getenv("LOCAL_GRADER_DIM", "2048"))
+# ベクトルを保存する場所（省略時は DB と同じディレクトリの <DB名>.grader/）
+VECTOR_DIR = os.getenv("LOCAL_GRADER_DIR", "")
+# 点数 = (SIM_WEIGHT * 類似度 + (1 - SIM_WEIGHT) * 要点の網羅率) を [ZERO, FULL] から 0〜100 点に伸ばしたもの
+SIM_WEIGHT = float(os.getenv("LOCAL_GRADER_SIM_WEIGHT", "0.5"))
+ZERO = float(os.getenv("LOCAL_GRADER_ZERO", "0.05"))
+FULL = float(os.getenv("LOCAL_GRADER_FULL", "0.75"))
+# 要点（模範解答の1文）の文字バイグラムのうち、これ以上の割合が回答にあれば「触れている」とみなす
+POINT_COVERED = 0.5
+# 要点とみなす文の最小の長さ（正規化後の文字数。あいさつなどの短い文は除く）
+POINT_MIN_CHARS = 8
+# アドバイスで挙げる、抜けている要点の数
+ADVICE_POINTS = 3
+# 模範解答から作った要点のキャッシュ（問題数）
+POINTS_CACHE_SIZE = 4096
+
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_models = {}
+_stats = {"graded": 0, "unindexed": 0, "builds": 0, "seconds": 0.0}
+
+
+def _count(key, amount=1):
+    with _lock:
+        _stats[key] += amount
+
+
+def _vector_dir(db_path):
+    return VECTOR_DIR or os.path.splitext(os.path.abspath(db_path))[0] + ".grader"
+
+
+# 文字 n-gram をハッシュした次元の番号と出現回数（Python の hash() はプロセスごとに変わるので crc32 を使う）
+def features(text):
+    text = prescorer.normalize(text)
+    grams = [text[i:i + n].encode() for n in prescorer.NGRAM_SIZES for i in range(len(text) - n + 1)]
+    if not grams:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    index = np.fromiter(map(zlib.crc32, grams), dtype=np.int64, count=len(grams)) & (DIM - 1)
+    index, counts = np.unique(index, return_counts=True)
+    return index, counts.astype(np.float32)
+
+
+def _checksum(text):
+    return zlib.crc32((text or "").encode())
+
+
+# 模範解答のベクトルを計算して保存する。保存先を差し替えるまで読み込み中のプロセスは古いファイルを使い続ける
+def build(db_path):
+    start = time.perf_counter()
+    with db.read(db_path) as conn:
+        rows = conn.execute("SELECT id, model_answer FROM questions ORDER BY id").fetchall()
+    parsed = [features(answer) for _, answer in rows]
+    df = np.zeros(DIM, dtype=np.float32)
+    for index, _ in parsed:
+        df[index] += 1
+    idf = (np.log((1 + len(rows)) / (1 + df)) + 1).astype(np.float32)
+    directory = _vector_dir(db_path)
+    os.makedirs(directory, exist_ok=True)
+    stamp = f"{time.time_ns()}-{os.getpid()}"
+    vectors_name = f"vectors-{stamp}.npy"
+    vectors = np.lib.format.open_memmap(
+        os.path.join(directory, vectors_name), mode="w+", dtype=np.float16, shape=(len(rows), DIM)
+    )
+    for i, (index, counts) in enumerate(parsed):
+        weights = counts * idf[index]
+        norm = np.sqrt(weights @ weights)
+        if norm:
+            vectors[i, index] = weights / norm
+    vectors.flush()
+    del vectors
+    # meta.npz を差し替えた時点で新しいベクトルに切り替わる
+    meta_tmp = os.path.join(directory, f"meta-{stamp}.npz")
+    np.savez(
+        meta_tmp, ids=np.array([row[0] for row in rows], dtype=np.int64),
+        checks=np.array([_checksum(row[1]) for row in rows], dtype=np.uint32),
+        idf=idf, vectors=np.array(vectors_name), dim=np.array(DIM),
+    )
+    os.replace(meta_tmp, os.path.join(directory, "meta.npz"))
+    for name in os.listdir(directory):
+        if name.startswith("vectors-") and name != vectors_name:
+            os.remove(os.path.join(directory, name))
+    _count("builds")
+    return {"questions": len(rows), "seconds": time.perf_counter() - start, "dir": directory}
+
+
+# 保存したベクトルで採点するモデル（meta.npz が差し替えられたら読み直す）
+class LocalModel:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.meta_path = os.path.join(_vector_dir(db_path), "meta.npz")
+        self.mtime = os.stat(self.meta_path).st_mtime_ns
+        with np.load(self.meta_path) as meta:
+            if int(meta["dim"]) != DIM:
+                raise ValueError(f"{self.meta_path} は DIM={int(meta['dim'])} で作られています（現在は {DIM}）")
+            self.ids = meta["ids"]
+            self.checks = meta["checks"]
+            self.idf = meta["idf"]
+            vectors_name = str(meta["vectors"])
+        self.vectors = np.load(os.path.join(os.path.dirname(self.meta_path), vectors_name), mmap_mode="r")
+        self.points = {}
+
+    def vector(self, text):
+        index, counts = features(text)
+        weights = counts * self.idf[index]
+        norm = np.sqrt(weights @ weights)
+        return index, (weights / norm if norm else weights)
+
+    # 模範解答のベクトルの、回答に出てくる次元だけを取り出す
+    # 保存後に追加・変更された問題は、その場で模範解答から計算する
+    def _model_weights(self, question_id, model_answer, index):
+        row = np.searchsorted(self.ids, question_id)
+        if row < len(self.ids) and self.ids[row] == question_id and self.checks[row] == _checksum(model_answer):
+            return self.vectors[row, index].astype(np.float32)
+        _count("unindexed")
+        dense = np.zeros(DIM, dtype=np.float32)
+        model_index, model_weights = self.vector(model_answer)
+        dense[model_index] = model_weights
+        return dense[index]
+
+    def similarity(self, question_id, model_answer, answer):
+        index, weights = self.vector(answer)
+        if not len(index):
+            return 0.0
+        return float(weights @ self._model_weights(question_id, model_answer, index))
+
+    # 模範解答の要点（文）とその文字バイグラム
+    def _points(self, question_id, model_answer):
+        key = (question_id, _checksum(model_answer))
+        points = self.points.get(key)
+        if points is None:
+            points = []
+            for sentence in re.split(r"[。\n！？!?]+", model_answer or ""):
+                normalized = prescorer.normalize(sentence)
+                if len(normalized) >= POINT_MIN_CHARS:
+                    points.append((sentence.strip(), {normalized[i:i + 2] for i in range(len(normalized) - 1)}))
+            if len(self.points) >= POINTS_CACHE_SIZE:
+                self.points.clear()
+            self.points[key] = points
+        return points
+
+    # 要点の網羅率（要点の長さで重み付け）と、触れていない要点
+    def coverage(self, question_id, model_answer, answer):
+        points = self._points(question_id, model_answer)
+        if not points:
+            return 1.0, []
+        normalized = prescorer.normalize(answer)
+        grams = {normalized[i:i + 2] for i in range(len(normalized) - 1)}
+        covered = total = 0
+        missing = []
+        for sentence, point_grams in points:
+            hit = len(point_grams & grams)
+            covered += hit
+            total += len(point_grams)
+            if hit < POINT_COVERED * len(point_grams):
+                missing.append(sentence)
+        return covered / total, missing
+
+    # 0〜100 点と、その内訳（類似度・要点の網羅率・触れていない要点）
+    def score(self, question_id, model_answer, answer):
+        if len(prescorer.normalize(answer)) < prescorer.MIN_CHARS:
+            return 0, {"similarity": 0.0, "coverage": 0.0, "missing": []}
+        similarity = self.similarity(question_id, model_answer, answer)
+        coverage, missing = self.coverage(question_id, model_answer, answer)
+        raw = SIM_WEIGHT * similarity + (1 - SIM_WEIGHT) * coverage
+        score = round(min(max((raw - ZERO) / (FULL - ZERO), 0.0), 1.0) * 100)
+        return score, {"similarity": similarity, "coverage": coverage, "missing": missing}
+
+    # LLM と同じ形式の「点数: xx点 / アドバイス:」を返す
+    def feedback(self, question_id, model_answer, answer):
+        start = time.perf_counter()
+        if len(prescorer.normalize(answer)) < prescorer.MIN_CHARS:
+            # 空欄・短すぎる回答は事前採点と同じ文面にする
+            text = prescorer.get_prescorer(self.db_path).prescore(answer, model_answer)
+        else:
+            score, detail = self.score(question_id, model_answer, answer)
+            text = f"点数: {score}点\nアドバイス: {advice(score, detail, answer, model_answer)}"
+        _count("graded")
+        _count("seconds", time.perf_counter() - start)
+        return text
+
+
+# 点数・触れていない要点・回答の長さから、アドバイスを組み立てる
+def advice(score, detail, answer, model_answer):
+    missing = [f"- {point[:40]}{'…' if len(point) > 40 else ''}" for point in detail["missing"][:ADVICE_POINTS]]
+    if score >= 80:
+        lines = ["模範解答の要点を押さえられています。"]
+        if missing:
+            lines.append("次の点にも触れると、より良い回答になります。")
+            lines.extend(missing)
+    elif score >= 50:
+        lines = ["要点の一部が抜けています。次の点を補いましょう。"]
+        lines.extend(missing)
+    else:
+        lines = [
+            "模範解答の要点がほとんど含まれていません。次の模範解答を読んで、ポイントを確認しましょう。",
+            f"模範解答: {model_answer}",
+        ]
+    answer_length = len(prescorer.normalize(answer))
+    model_length = len(prescorer.normalize(model_answer))
+    if score >= 50 and answer_length < model_length * 0.3:
+        lines.append("説明が短めです。理由や、お客さまへの次のご案内まで具体的に書きましょう。")
+    elif answer_length > model_length * 3:
+        lines.append("説明が長めです。お客さまに伝える要点を絞って、簡潔にまとめましょう。")
+    return "\n".join(lines)
+
+
+def _meta_mtime(db_path):
+    try:
+        return os.stat(os.path.join(_vector_dir(db_path), "meta.npz")).st_mtime_ns
+    except OSError:
+        return None
+
+
+# DB ごとのモデル（ベクトルが無ければ作る。作り直されていれば読み直す）
+def get_model(db_path):
+    with _lock:
+        model = _models.get(db_path)
+    if model is not None and model.mtime == _meta_mtime(db_path):
+        return model
+    # 読み込みと作成は1つずつ行う（同時に来た採点は待って、同じモデルを使う）
+    with _load_lock:
+        with _lock:
+            model = _models.get(db_path)
+        mtime = _meta_mtime(db_path)
+        if model is None or model.mtime != mtime:
+            if mtime is None:
+                build(db_path)
+            model = LocalModel(db_path)
+            with _lock:
+                _models[db_path] = model
+        return model
+
+
+def stats():
+    with _lock:
+        result = dict(_stats)
+    result["per_second"] = result["graded"] / result["seconds"] if result["seconds"] else 0.0
+    return result
+
+
+# ベンチマーク用の回答: 模範解答から出来の違う回答を作る（模範解答そのもの・前半だけ・文を抜いたもの・
+# 別の問題の模範解答・短い回答）
+def sample_answers(rows, per_question, rng):
+    samples = []
+    for question_id, model_answer in rows:
+        sentences = [s for s in re.split(r"(?<=[。\n])", model_answer) if s.strip()] or [model_answer]
+        other = rng.choice(rows)[1]
+        variants = [
+            model_answer,
+            "".join(sentences[:max(1, len(sentences) // 2)]),
+            "".join(rng.sample(sentences, max(1, len(sentences) - 1))),
+            "".join(s[:len(s) // 2] for s in sentences),
+            other,
+            "確認して折り返しご連絡します。",
+        ]
+        for _ in range(per_question):
+            samples.append((question_id, model_answer, rng.choice(variants)))
+    return samples
+
+
+# LLM で採点した点数と比べる（一致度）
+def agreement(pairs):
+    local = np.array([p[0] for p in pairs], dtype=np.float64)
+    llm = np.array([p[1] for p in pairs], dtype=np.float64)
+    result = {
+        "count": len(pairs),
+        "mae": float(np.abs(local - llm).mean()),
+        "within_10": float((np.abs(local - llm) <= 10).mean()),
+        "within_20": float((np.abs(local - llm) <= 20).mean()),
+        "band_agreement": float((np.digitize(local, [50, 80]) == np.digitize(llm, [50, 80])).mean()),
+        "pearson": 0.0,
+    }
+    if local.std() and llm.std():
+        result["pearson"] = float(np.corrcoef(local, llm)[0, 1])
+    return result
+
+
+# LLM で採点して、採点キャッシュに残す（キャッシュの履歴がベンチマークの正解になる）
+def _grade_with_llm(samples, questions):
+    import grading
+    import grading_cache
+    import grading_prompts
+    import llm_client
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    client = llm_client.create_client(lambda: os.environ["OPENAI_API_KEY"])
+    for question_id, model_answer, answer in samples:
+        if grading_cache.get(question_id, model_answer, grading_prompts.PROMPT_VERSION, answer) is not None:
+            continue
+        prompt = grading_prompts.single_prompt(questions[question_id], model_answer, answer)
+        feedback = "".join(llm_client.stream_chat(client, [{"role": "user", "content": prompt}]))
+        grading_cache.put(
+            question_id, model_answer, grading_prompts.PROMPT_VERSION, answer, grading.parse_score(feedback), feedback
+        )
+
+
+def bench(db_path, samples_per_question=50, llm_samples=0, seed=0, out=sys.stdout):
+    import grading_cache
+
+    rng = random.Random(seed)
+    model = get_model(db_path)
+    with db.read(db_path) as conn:
+        rows = conn.execute("SELECT id, model_answer, question_text FROM questions").fetchall()
+    if not rows:
+        print("自由記述の問題がありません。", file=out)
+        return
+    questions = {row[0]: row[2] for row in rows}
+    rows = [row[:2] for row in rows]
+
+    # 速度: 1スレッドで続けて採点する
+    samples = sample_answers(rows, samples_per_question, rng)
+    times = []
+    for question_id, model_answer, answer in samples:
+        start = time.perf_counter()
+        model.feedback(question_id, model_answer, answer)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    total = sum(times)
+    print(f"採点 {len(times)} 件: {len(times) / total:.0f} 件/秒（1スレッド）"
+          f"  p50 {times[len(times) // 2] * 1e6:.0f} µs  p99 {times[int(len(times) * 0.99)] * 1e6:.0f} µs", file=out)
+
+    # 一致度: 採点キャッシュに残っている LLM の点数と比べる
+    if llm_samples:
+        candidates = sample_answers(rows, -(-llm_samples // len(rows)), rng)
+        _grade_with_llm(rng.sample(candidates, min(llm_samples, len(candidates))), questions)
+    model_answers = dict(rows)
+    pairs = []
+    for question_id, answer, llm_score in grading_cache.history():
+        if question_id in model_answers and llm_score is not None:
+            pairs.append((model.score(question_id, model_answers[question_id], answer)[0], llm_score))
+    if not pairs:
+        print("LLM で採点された履歴がありません（--llm N で N 件を LLM に採点させてから比べられます）。", file=out)
+        return
+    result = agreement(pairs)
+    print(f"LLM との比較 {result['count']} 件: 平均絶対誤差 {result['mae']:.1f}点  相関係数 {result['pearson']:.3f}"
+          f"  ±10点以内 {result['within_10']:.0%}  ±20点以内 {result['within_20']:.0%}"
+          f"  帯（〜49 / 50〜79 / 80〜）の一致 {result['band_agreement']:.0%}", file=out)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ローカル採点（CPU のみ）の準備と計測")
+    parser.add_argument("command", choices=("build", "bench"))
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_ver2.db"))
+    parser.add_argument("--samples", type=int, default=50, help="速度の計測で1問あたりに採点する回答の数")
+    parser.add_argument("--llm", type=int, default=0, help="比較用に LLM（GRADING_BACKEND）で採点する回答の数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        result = build(args.db)
+        print(f"{result['questions']} 問のベクトルを作りました（{result['seconds']:.1f} 秒）: {result['dir']}")
+    else:
+        bench(args.db, args.samples, args.llm, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+
+# OpenAI 互換のローカルスタブサーバー（オフラインでの負荷試験用）
+# chat.completions（ストリーミング／非ストリーミング）だけを実装し、プロンプトの模範解答と
+# 生徒の回答の近さから「点数: xx点 / アドバイス: …」を返す（まとめ採点のプロンプトには JSON 配列を返す）。
+# 応答までの待ち時間の分布と、429（レート制限）・タイムアウト・500 を一定の確率で起こせるので、
+# 採点処理のスループットや再試行の挙動を、課金もネットワークも無しで確かめられる。
+#
+#   python openai_stub.py --port 8001 --latency lognormal:0.8,0.5 --rate-429 0.05
+#   GRADING_BACKEND=stub OPENAI_STUB_URL=http://127.0.0.1:8001/v1 streamlit run App_final.py
+#
+# 待ち時間の分布（--latency / STUB_LATENCY）:
+#   fixed:秒 / uniform:最小,最大 / lognormal:中央値,σ
+# GET /stats でリクエスト数やエラーを注入した回数などを JSON で返す。
+import argparse
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_OPTIONS = {
+    # 最初の1文字目を返すまでの待ち時間の分布
+    "latency": os.getenv("STUB_LATENCY", "lognormal:0.8,0.4"),
+    # ストリーミングで断片を送る間隔（秒）と、1断片の文字数
+    "chunk_delay": float(os.getenv("STUB_CHUNK_DELAY", "0.02")),
+    "chunk_chars": int(os.getenv("STUB_CHUNK_CHARS", "8")),
+    # 429 を返す確率と、そのときの Retry-After（秒）
+    "rate_429": float(os.getenv("STUB_RATE_429", "0")),
+    "retry_after": float(os.getenv("STUB_RETRY_AFTER", "1")),
+    # 応答せずに止まる確率と、止まっている時間（秒）。クライアント側のタイムアウトを起こす
+    "rate_timeout": float(os.getenv("STUB_RATE_TIMEOUT", "0")),
+    "timeout_seconds": float(os.getenv("STUB_TIMEOUT_SECONDS", "120")),
+    # 500 を返す確率
+    "rate_500": float(os.getenv("STUB_RATE_500", "0")),
+    "seed": None,
+}
+
+# App_final.py などの採点プロンプトから模範解答と生徒の回答を取り出す
+_PROMPT_PATTERN = re.compile(r"模範解答は、「(.*?)」ですが、\s*あなたの生徒が「(.*?)」と回答しました", re.S)
+# まとめ採点（grading_prompts.batch_prompt）の回答の一覧
+_BATCH_PATTERN = re.compile(r"<answers>\s*(\[.*\])\s*</answers>", re.S)
+
+_ADVICE = (
+    "模範解答の要点「{point}」が回答に含まれていません。お客様に確認する理由とあわせて伝えましょう。",
+    "結論を先に述べ、そのあとに「{point}」を具体的に説明すると伝わりやすくなります。",
+    "「{point}」について、お客様の立場でのメリットを一言添えましょう。",
+)
+
+
+def parse_latency(spec):
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"待ち時間の分布の指定が正しくありません: {spec!r}")
+
+
+def _bigrams(text):
+    text = re.sub(r"\s+", "", text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+# 模範解答の文字バイグラムのうち、回答に含まれている割合で採点する（少しだけばらつかせる）
+def score_answer(model_answer, user_answer, rng):
+    expected = _bigrams(model_answer)
+    recall = len(expected & _bigrams(user_answer)) / len(expected) if expected else 0.5
+    score = max(0, min(100, round(recall * 100 + rng.gauss(0, 5))))
+    sentences = [s for s in re.split(r"[。、\n]", model_answer) if s.strip()] or ["模範解答"]
+    missing = [s for s in sentences if s.strip() not in user_answer] or sentences
+    advice = "\n".join(
+        f"- {template.format(point=rng.choice(missing).strip()[:30])}"
+        for template in rng.sample(_ADVICE, 2)
+    )
+    return score, advice
+
+
+# プロンプトに合わせた応答を作る（まとめ採点なら JSON 配列、1件なら「点数: xx点」の文章）
+def grade(prompt, rng):
+    batch = _BATCH_PATTERN.search(prompt)
+    if batch is not None:
+        results = []
+        for item in json.loads(batch.group(1)):
+            score, advice = score_answer(item.get("model_answer", ""), item.get("answer", ""), rng)
+            results.append({"id": item.get("id"), "score": score, "advice": advice})
+        return json.dumps(results, ensure_ascii=False)
+    match = _PROMPT_PATTERN.search(prompt)
+    if match is None:
+        model_answer, user_answer = "", prompt
+    else:
+        model_answer, user_answer = match.group(1), match.group(2)
+    score, advice = score_answer(model_answer, user_answer, rng)
+    return f"点数: {score}点\nアドバイス:\n{advice}"
+
+
+def _tokens(text):
+    # 日本語はおおよそ1文字1トークン
+    return max(1, len(text))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.server.stats())
+        elif self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "gpt-4o-mini", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        server = self.server
+        fault, delay, rng = server.plan()
+        if fault == "429":
+            server.count("rate_limited")
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached (stub)", "type": "requests", "code": "rate_limit_exceeded"}},
+                {"Retry-After": f"{server.options['retry_after']:g}"},
+            )
+            return
+        if fault == "500":
+            server.count("server_errors")
+            self._send_json(500, {"error": {"message": "internal error (stub)", "type": "server_error"}})
+            return
+        if fault == "timeout":
+            server.count("timeouts")
+            time.sleep(server.options["timeout_seconds"])
+            self.close_connection = True
+            return
+
+        prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+        content = grade(prompt, rng)
+        model = body.get("model", "gpt-4o-mini")
+        usage = {
+            "prompt_tokens": _tokens(prompt),
+            "completion_tokens": _tokens(content),
+            "total_tokens": _tokens(prompt) + _tokens(content),
+        }
+        server.enter()
+        try:
+            time.sleep(delay)
+            if body.get("stream"):
+                self._stream(content, model, usage, (body.get("stream_options") or {}).get("include_usage"))
+            else:
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+        finally:
+            server.leave(usage)
+
+    def _stream(self, content, model, usage, include_usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        step = max(1, self.server.options["chunk_chars"])
+        for i in range(0, len(content), step):
+            if i:
+                time.sleep(self.server.options["chunk_delay"])
+            delta = {"content": content[i:i + step]}
+            if i == 0:
+                delta["role"] = "assistant"
+            self._event(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+        self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if include_usage:
+            self._event(dict(base, choices=[], usage=usage))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, **options):
+        unknown = set(options) - set(DEFAULT_OPTIONS)
+        if unknown:
+            raise TypeError(f"未知のオプション: {sorted(unknown)}")
+        self.options = dict(DEFAULT_OPTIONS, **options)
+        self._latency = parse_latency(self.options["latency"])
+        self._rng = random.Random(self.options["seed"])
+        self._lock = threading.Lock()
+        self.counters = {
+            "requests": 0, "completed": 0, "rate_limited": 0, "timeouts": 0, "server_errors": 0,
+            "in_flight": 0, "max_in_flight": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        }
+        self.started_at = time.time()
+        super().__init__((host, port), _Handler)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    # このリクエストで起こすこと（エラーの種類と待ち時間）を決める
+    def plan(self):
+        with self._lock:
+            self.counters["requests"] += 1
+            draw = self._rng.random()
+            delay = max(0.0, self._latency(self._rng))
+            rng = random.Random(self._rng.random())
+        options = self.options
+        if draw < options["rate_429"]:
+            return "429", delay, rng
+        draw -= options["rate_429"]
+        if draw < options["rate_timeout"]:
+            return "timeout", delay, rng
+        draw -= options["rate_timeout"]
+        if draw < options["rate_500"]:
+            return "500", delay, rng
+        return None, delay, rng
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def enter(self):
+        with self._lock:
+            self.counters["in_flight"] += 1
+            self.counters["max_in_flight"] = max(self.counters["max_in_flight"], self.counters["in_flight"])
+
+    def leave(self, usage):
+        with self._lock:
+            self.counters["in_flight"] -= 1
+            self.counters["completed"] += 1
+            self.counters["prompt_tokens"] += usage["prompt_tokens"]
+            self.counters["completion_tokens"] += usage["completion_tokens"]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        elapsed = time.time() - self.started_at
+        stats["uptime_s"] = elapsed
+        stats["completed_per_s"] = stats["completed"] / elapsed if elapsed else 0.0
+        stats["options"] = {k: v for k, v in self.options.items() if k != "seed"}
+        return stats
+
+
+# スタブをバックグラウンドのスレッドで起動する（port=0 なら空いているポートを使う）
+def start(host="127.0.0.1", port=0, **options):
+    server = StubServer(host, port, **options)
+    threading.Thread(target=server.serve_forever, name="openai-stub", daemon=True).start()
+    return server
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+# プロセス内で共有するスタブ（GRADING_BACKEND=stub で OPENAI_STUB_URL が無いときに使う）
+def default_server():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = start()
+        return _default
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI 互換のローカルスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default=DEFAULT_OPTIONS["latency"],
+                        help="待ち時間の分布（fixed:秒 / uniform:最小,最大 / lognormal:中央値,σ）")
+    parser.add_argument("--chunk-delay", type=float, default=DEFAULT_OPTIONS["chunk_delay"])
+    parser.add_argument("--chunk-chars", type=int, default=DEFAULT_OPTIONS["chunk_chars"])
+    parser.add_argument("--rate-429", type=float, default=DEFAULT_OPTIONS["rate_429"], help="429 を返す確率")
+    parser.add_argument("--retry-after", type=float, default=DEFAULT_OPTIONS["retry_after"])
+    parser.add_argument("--rate-timeout", type=float, default=DEFAULT_OPTIONS["rate_timeout"], help="応答しない確率")
+    parser.add_argument("--timeout-seconds", type=float, default=DEFAULT_OPTIONS["timeout_seconds"])
+    parser.add_argument("--rate-500", type=float, default=DEFAULT_OPTIONS["rate_500"], help="500 を返す確率")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    options = {k: v for k, v in vars(args).items() if k not in ("host", "port")}
+    server = StubServer(args.host, args.port, **options)
+    print(f"OpenAI stub: {server.url}  (stats: {server.url}/stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+
+# 画像の最適化: logo.png / FV.png を表示サイズに縮小し、WebP と PNG（フォールバック）を static/ に書き出す
+# 元画像を差し替えたらこのスクリプトを実行し、static/ の画像もコミットする。
+#   python optimize_images.py
+import os
+
+from PIL import Image
+
+import assets
+
+BASE_DIR = os.path.dirname(__file__)
+
+
+def optimize(name, width):
+    src = Image.open(os.path.join(BASE_DIR, f"{name}.png")).convert("RGB")
+    if src.width > width:
+        src = src.resize((width, round(src.height * width / src.width)), Image.LANCZOS)
+    os.makedirs(assets.STATIC_DIR, exist_ok=True)
+    webp_path = os.path.join(assets.STATIC_DIR, f"{name}.webp")
+    png_path = os.path.join(assets.STATIC_DIR, f"{name}.png")
+    src.save(webp_path, "WEBP", quality=85, method=6)
+    # PNG はフォールバック用なので 256 色に減色してサイズを抑える
+    src.quantize(256, method=Image.Quantize.MEDIANCUT).save(png_path, "PNG", optimize=True)
+    for path in (webp_path, png_path):
+        print(f"{path}: {src.width}x{src.height} {os.path.getsize(path) / 1024:.1f} KB")
+
+
+if __name__ == "__main__":
+    for name, width in assets.IMAGE_WIDTHS.items():
+        optimize(name, width)
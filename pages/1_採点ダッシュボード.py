@@ -0,0 +1,119 @@
+
+# 採点ダッシュボード: 自由記述の採点にかかった費用（トークン数）と待ち時間を問題ごとに確認する
+# 元データは grading_metrics テーブル（採点リクエストごとに記録される）。
+import sys
+import time
+
+import streamlit as st
+
+import app_config
+
+# exams.toml の [app] を環境変数に反映する（ほかのモジュールを import する前に）
+app_config.apply_app_settings()
+# 管理者だけが開ける（受講者には見せない）
+app_config.require_admin(st)
+
+import grading_cache
+import grading_metrics
+import grading_queue
+import grading_worker
+import import_timer
+import llm_client
+import session_packs
+import session_store
+
+# アプリと同じ DB（試験が複数あればサイドバーで選ぶ）
+DB_PATH = app_config.select_exam(st)["db_path"]
+
+st.title("採点ダッシュボード")
+# このプロセスの採点キャッシュ・出題セットの作り置き・途中経過の保存・採点キューの集計（起動してからの値）
+# 採点記録が無い期間を選んでも見られるように、期間の選択より前に出す
+with st.expander("キャッシュとキューの状況（このプロセス）"):
+    cache = grading_cache.stats()
+    col1, col2 = st.columns(2)
+    col1.metric("採点キャッシュのヒット率", f"{cache['hit_rate']:.0%}")
+    col2.metric("LLM を呼ばずに済んだ採点（ヒット / ミス）", f"{cache['hits']:,} / {cache['misses']:,}")
+    st.json({
+        "grading_cache": cache,
+        "session_packs": session_packs.stats(),
+        "session_store": session_store.stats(),
+        "grading_queue": grading_queue.stats(),
+        "grading_worker": grading_worker.stats(),
+    })
+    # ローカル採点は使ったプロセスだけ（このページのために numpy などを読み込まない）
+    if "local_grader" in sys.modules:
+        st.json({"local_grader": sys.modules["local_grader"].stats()})
+
+days = st.selectbox("期間", [1, 7, 30, 90], index=1, format_func=lambda d: f"直近 {d} 日")
+df = grading_metrics.load(DB_PATH, time.time() - days * 24 * 3600)
+if df.empty:
+    st.info("この期間の採点記録はありません。")
+    st.stop()
+
+df["cost_usd"] = (
+    df["prompt_tokens"].fillna(0) * grading_metrics.PRICE_INPUT_PER_M
+    + df["completion_tokens"].fillna(0) * grading_metrics.PRICE_OUTPUT_PER_M
+) / 1_000_000
+# 所要時間と TTFT はリクエスト単位（まとめ採点は回答ごとに同じ値が入っている）
+requests = df.drop_duplicates("request_id")
+
+col1, col2, col3, col4, col5 = st.columns(5)
+col1.metric("リクエスト数", f"{len(requests):,}")
+col2.metric("採点した回答", f"{len(df):,}")
+col3.metric("費用の見積もり", f"${df['cost_usd'].sum():.4f}")
+col4.metric("所要時間 p50 / p95", f"{requests['wall_ms'].median():.0f} / {requests['wall_ms'].quantile(0.95):.0f} ms")
+col5.metric("TTFT p50", f"{requests['ttft_ms'].median():.0f} ms" if requests["ttft_ms"].notna().any() else "-")
+status_counts = requests["status"].value_counts()
+st.caption(
+    " / ".join(f"{status}: {count}" for status, count in status_counts.items())
+    + f"　切り詰めた回答: {int(df['truncated'].sum())} 件"
+    + f"　（料金: 入力 ${grading_metrics.PRICE_INPUT_PER_M} / 出力 ${grading_metrics.PRICE_OUTPUT_PER_M} per 1M tokens）"
+)
+
+st.subheader("問題ごと")
+per_question = (
+    df.groupby(["question_id", "question_text"], dropna=False)
+    .agg(
+        回答数=("id", "count"),
+        プロンプト平均=("prompt_tokens", "mean"),
+        応答平均=("completion_tokens", "mean"),
+        費用USD=("cost_usd", "sum"),
+        所要時間p50_ms=("wall_ms", "median"),
+        所要時間p95_ms=("wall_ms", lambda s: s.quantile(0.95)),
+        TTFT_p50_ms=("ttft_ms", "median"),
+        切り詰め=("truncated", "sum"),
+    )
+    .reset_index()
+    .rename(columns={"question_id": "問題ID", "question_text": "問題"})
+    .sort_values("費用USD", ascending=False)
+)
+st.dataframe(per_question.round(1), hide_index=True)
+
+st.subheader("1件ずつの採点とまとめ採点")
+per_kind = requests.groupby("kind").agg(
+    リクエスト数=("request_id", "count"), 回答数=("items", "sum"), 所要時間p50_ms=("wall_ms", "median")
+)
+per_kind["費用USD"] = df.groupby("kind")["cost_usd"].sum()
+per_kind["回答あたり費用USD"] = per_kind["費用USD"] / per_kind["回答数"]
+st.dataframe(per_kind.round(5))
+
+st.subheader("日ごとの推移")
+df["day"] = df["created_at"].map(lambda t: time.strftime("%Y-%m-%d", time.localtime(t)))
+requests = requests.assign(day=requests["created_at"].map(lambda t: time.strftime("%Y-%m-%d", time.localtime(t))))
+daily_cost = df.groupby("day")["cost_usd"].sum()
+daily_p95 = requests.groupby("day")["wall_ms"].quantile(0.95)
+go = import_timer.lazy_import("plotly.graph_objects")
+fig = go.Figure()
+fig.add_bar(x=daily_cost.index, y=daily_cost.values, name="費用（USD）", marker_color="#FFB6C1")
+fig.add_scatter(x=daily_p95.index, y=daily_p95.values, name="所要時間 p95（ms）", yaxis="y2", line_color="#EF4123")
+fig.update_layout(
+    yaxis={"title": "USD"},
+    yaxis2={"title": "ms", "overlaying": "y", "side": "right"},
+    legend={"orientation": "h"},
+)
+st.plotly_chart(fig)
+
+# このプロセスの採点クライアントの状況（再試行・レート制限・ブレーカー）
+with st.expander("採点クライアントの状況（このプロセス）"):
+    st.json(llm_client.metrics())
+
@@ -0,0 +1,84 @@
+
+# 問題の検索と登録: 問題を作る人向けの画面
+# 問題文・選択肢・模範解答を全文検索し、新しい問題を登録する前に似た問題が無いかを確認する。
+# 検索には question_search の FTS5 索引（trigram）を使う。
+import time
+
+import streamlit as st
+
+import app_config
+
+# exams.toml の [app] を環境変数に反映する（ほかのモジュールを import する前に）
+app_config.apply_app_settings()
+# 管理者だけが開ける（受講者には見せない）
+app_config.require_admin(st)
+
+import import_questions
+import question_search
+
+# アプリと同じ DB（試験が複数あればサイドバーで選ぶ）
+DB_PATH = app_config.select_exam(st)["db_path"]
+
+TABLE_LABELS = {"questions": "自由記述", "quiz": "選択式"}
+COLUMN_LABELS = {
+    "question_text": "問題", "model_answer": "模範解答",
+    "question": "問題", "option1": "選択肢1", "option2": "選択肢2", "option3": "選択肢3",
+}
+
+st.title("問題の検索と登録")
+table = st.radio("問題の種類", list(TABLE_LABELS), format_func=TABLE_LABELS.get, horizontal=True)
+
+# --- 検索 ---
+st.subheader("検索")
+col1, col2 = st.columns([3, 1])
+text = col1.text_input("検索語（空白で区切ると、すべてを含む問題を探します）")
+order = col2.radio("並び順", ["new", "rank"], format_func={"new": "新しい順", "rank": "関連度順"}.get)
+if text.strip():
+    start = time.perf_counter()
+    results = question_search.search(DB_PATH, text, table, order=order)
+    elapsed = (time.perf_counter() - start) * 1000
+    st.caption(f"{len(results)} 件（最大 50 件） / {elapsed:.1f} ms")
+    if any(len(term) < 3 for term in text.split()):
+        st.caption("2文字以下の語は索引を使えないため、検索に時間がかかることがあります。")
+    for row in results:
+        with st.container(border=True):
+            st.markdown(f"**ID {row['id']}**")
+            for column, value in row["highlight"].items():
+                st.markdown(f"{COLUMN_LABELS[column]}: {value}")
+
+# --- 登録 ---
+st.subheader("問題を登録")
+with st.form("add_question", clear_on_submit=False):
+    if table == "questions":
+        record = {
+            "question_text": st.text_area("問題"),
+            "model_answer": st.text_area("模範解答"),
+        }
+    else:
+        record = {
+            "question": st.text_area("問題"),
+            "option1": st.text_input("選択肢1"),
+            "option2": st.text_input("選択肢2"),
+            "option3": st.text_input("選択肢3"),
+        }
+        record["answerIndex"] = st.selectbox("正解", [0, 1, 2], format_func=lambda i: f"選択肢{i + 1}")
+    force = st.checkbox("似た問題があっても登録する")
+    submitted = st.form_submit_button("登録")
+
+if submitted:
+    question_text = record[question_search.TEXT_COLUMNS[table]]
+    similar = question_search.similar_questions(DB_PATH, question_text, table) if question_text.strip() else []
+    if similar and not force:
+        st.warning("似た問題がすでに登録されています。内容を確認し、登録する場合は「似た問題があっても登録する」にチェックを入れてください。")
+        st.dataframe(
+            [{"ID": s["id"], "問題": s[question_search.TEXT_COLUMNS[table]], "類似度": round(s["similarity"], 2)}
+             for s in similar],
+            hide_index=True,
+        )
+    else:
+        try:
+            question_id = question_search.add_question(DB_PATH, table, record)
+        except import_questions.InvalidRow as e:
+            st.error(f"登録できませんでした: {e}")
+        else:
+            st.success(f"登録しました（ID {question_id}）")
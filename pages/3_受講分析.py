@@ -0,0 +1,143 @@
+
+# 受講分析: 営業所ごとの合格率・得点の分布・苦手な問題（正答率の低い問題と、よく選ばれる誤答）を確認する
+# 読むのは analytics の集計テーブルだけなので、解答ログの件数によらずすぐに表示できる。
+import datetime
+import time
+
+import streamlit as st
+
+import app_config
+
+# exams.toml の [app] を環境変数に反映する（ほかのモジュールを import する前に）
+app_config.apply_app_settings()
+# 管理者だけが開ける（受講者には見せない）
+app_config.require_admin(st)
+
+import analytics
+import import_timer
+
+# アプリと同じ DB（試験が複数あればサイドバーで選ぶ）
+EXAM = app_config.select_exam(st)
+DB_PATH = EXAM["db_path"]
+# 正答率を出すのに必要な最小の解答数（少ない問題は順位がぶれるので除く）
+MIN_ANSWERS = 5
+# 苦手な問題として表示する数
+WEAK_QUESTIONS = 10
+
+start = time.perf_counter()
+st.title("受講分析")
+tenants = analytics.tenants(DB_PATH)
+if not tenants:
+    st.info("まだ受講の記録がありません。")
+    st.stop()
+
+col1, col2 = st.columns(2)
+tenant = col1.selectbox(
+    "営業所", [None] + tenants, format_func=lambda t: "すべて" if t is None else (t or "（未入力）")
+)
+days = col2.selectbox("期間", [7, 30, 90, 365], index=1, format_func=lambda d: f"直近 {d} 日")
+since_day = (datetime.date.today() - datetime.timedelta(days=days - 1)).isoformat()
+go = import_timer.lazy_import("plotly.graph_objects")
+
+# --- 合格率と得点 ---
+daily = analytics.daily(DB_PATH, tenant, since_day)
+attempts = int(daily["attempts"].sum()) if not daily.empty else 0
+passed = int(daily["passed"].sum()) if not daily.empty else 0
+answers = int(daily["answers"].sum()) if not daily.empty else 0
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("受講数", f"{attempts:,}")
+col2.metric("合格率", f"{passed / attempts:.0%}" if attempts else "-")
+col3.metric("平均得点率", f"{daily['score_sum'].sum() / attempts:.1f}%" if attempts else "-")
+col4.metric("解答数", f"{answers:,}")
+
+if attempts:
+    st.subheader("日ごとの受講数と合格率")
+    fig = go.Figure()
+    fig.add_bar(x=daily["day"], y=daily["attempts"], name="受講数", marker_color="#A7C6FF")
+    fig.add_scatter(
+        x=daily["day"], y=daily["passed"] / daily["attempts"].where(daily["attempts"] > 0),
+        name="合格率", yaxis="y2", line_color="#EF4123",
+    )
+    fig.update_layout(
+        yaxis={"title": "受講数"},
+        yaxis2={"title": "合格率", "overlaying": "y", "side": "right", "tickformat": ".0%", "range": [0, 1]},
+        legend={"orientation": "h"},
+    )
+    st.plotly_chart(fig)
+
+st.subheader("得点の分布")
+col1, col2 = st.columns(2)
+# 総合得点は試験ごとに満点が違うので、満点に対する得点率（%）で数える
+for column, kind, title in ((col1, "total", "総合得点（満点に対する%）"), (col2, "free", "自由記述の点数")):
+    frame = analytics.scores(DB_PATH, tenant, since_day, kind)
+    if frame.empty:
+        column.caption(f"{title}: 記録がありません")
+        continue
+    fig = go.Figure()
+    # 棒は SCORE_BUCKET 点の幅で、下限から描く
+    fig.add_bar(
+        x=frame["bucket"], y=frame["count"], width=analytics.SCORE_BUCKET, offset=0, marker_color="#004098",
+        marker_line_color="white", marker_line_width=1,
+    )
+    if kind == "total":
+        # 選んでいる試験の合格点（得点率）
+        pass_line = analytics.percent(EXAM["pass_score"], EXAM["max_score"])
+        fig.add_vline(x=pass_line, line_dash="dash", line_color="#EF4123",
+                      annotation_text=f"合格点 {EXAM['pass_score']}/{EXAM['max_score']}（{pass_line}%）")
+    xaxis_title = "得点率（%）" if kind == "total" else "点"
+    fig.update_layout(title=title, xaxis={"title": xaxis_title, "range": [0, 105]}, yaxis={"title": "人数"})
+    column.plotly_chart(fig)
+
+# --- 問題ごと（期間によらず、これまでのすべての解答） ---
+st.subheader("苦手な問題（選択式）")
+st.caption(f"正答率の低い順。解答が {MIN_ANSWERS} 件未満の問題は除いています（期間によらず、これまでのすべての解答）。")
+questions = analytics.choice_questions(DB_PATH, tenant)
+if not questions.empty:
+    questions = questions[questions["answers"] >= MIN_ANSWERS].copy()
+if questions.empty:
+    st.caption("まだ十分な解答がありません。")
+else:
+    questions["正答率"] = questions["correct"] / questions["answers"]
+    weakest = questions.sort_values("正答率").head(WEAK_QUESTIONS)
+    # 選択肢ごとに選ばれた割合（正解は赤、誤答は青の濃淡）
+    labels = [f"#{qid}" for qid in weakest["question_id"]]
+    fig = go.Figure()
+    for i in range(3):
+        rates = weakest[f"pick{i + 1}"] / weakest["answers"]
+        colors = ["#EF4123" if answer == i else ("#004098", "#4974CE", "#A7C6FF")[i] for answer in weakest["answerIndex"]]
+        fig.add_bar(
+            y=labels, x=rates, orientation="h", name=f"選択肢{i + 1}", marker_color=colors,
+            customdata=weakest[f"option{i + 1}"], hovertemplate="%{customdata}<br>%{x:.0%}<extra></extra>",
+        )
+    fig.update_layout(
+        barmode="stack", xaxis={"tickformat": ".0%", "range": [0, 1]}, yaxis={"autorange": "reversed"},
+        legend={"orientation": "h"}, title="選択肢ごとに選ばれた割合（赤が正解）",
+    )
+    st.plotly_chart(fig)
+    st.dataframe(
+        weakest.assign(正解=lambda f: f["answerIndex"].map(lambda i: f"選択肢{int(i) + 1}" if i == i else "-"))[
+            ["question_id", "question", "answers", "正答率", "正解", "option1", "option2", "option3"]
+        ].rename(columns={"question_id": "ID", "question": "問題", "answers": "解答数",
+                          "option1": "選択肢1", "option2": "選択肢2", "option3": "選択肢3"}).round(3),
+        hide_index=True,
+    )
+
+    st.subheader("問題の難易度")
+    fig = go.Figure()
+    fig.add_histogram(x=questions["正答率"], nbinsx=20, marker_color="#004098")
+    fig.update_layout(xaxis={"title": "正答率", "tickformat": ".0%", "range": [0, 1]}, yaxis={"title": "問題数"})
+    st.plotly_chart(fig)
+
+st.subheader("自由記述の問題ごとの平均点")
+free = analytics.free_questions(DB_PATH, tenant)
+if free.empty:
+    st.caption("まだ解答がありません。")
+else:
+    free["平均点"] = free["score_sum"] / free["scored"].where(free["scored"] > 0)
+    st.dataframe(
+        free.sort_values("平均点")[["question_id", "question_text", "answers", "平均点"]]
+        .rename(columns={"question_id": "ID", "question_text": "問題", "answers": "解答数"}).round(1),
+        hide_index=True,
+    )
+
+st.caption(f"集計の読み込みと描画: {(time.perf_counter() - start) * 1000:.0f} ms")
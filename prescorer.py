@@ -0,0 +1,167 @@
+
+# ローカル事前採点: 明らかな回答は OpenAI を呼ばずにその場で点数を付ける
+# 模範解答コーパスから作った文字 n-gram の TF-IDF で回答と模範解答のコサイン類似度を求め、
+# 空欄・極端に短い回答・類似度が LOW 以下 / HIGH 以上の回答だけをローカルで採点する。
+# その間（判断が難しい回答）は None を返し、従来どおり LLM に採点させる。
+#
+# 使い方（較正レポート）: python prescorer.py [DBパス]
+#   採点キャッシュに残っている LLM の点数とローカルの点数を比較して表示する。
+import math
+import os
+import re
+import sys
+import threading
+import unicodedata
+from collections import Counter
+
+import question_bank
+
+# この類似度以上なら模範解答とほぼ同じとみなす
+HIGH_THRESHOLD = float(os.getenv("PRESCORE_HIGH", "0.85"))
+# この類似度以下なら模範解答と無関係とみなす
+# 言い換えた正しい回答でも 0.08 前後になる（quiz_ver2.db で 0.077〜0.231）ので、無関係な文章（0〜0.035）だけを拾う値にする
+LOW_THRESHOLD = float(os.getenv("PRESCORE_LOW", "0.04"))
+# これより短い回答（正規化後の文字数）は採点しない
+MIN_CHARS = int(os.getenv("PRESCORE_MIN_CHARS", "5"))
+# 使う文字 n-gram の長さ
+NGRAM_SIZES = (2, 3)
+
+_lock = threading.Lock()
+_cache = {}
+
+
+# 空白と記号を除いた正規化テキスト
+def normalize(text):
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    return re.sub(r"[\s、。,.・!?！？「」『』()（）]+", "", text)
+
+
+def ngrams(text):
+    text = normalize(text)
+    grams = Counter()
+    for n in NGRAM_SIZES:
+        grams.update(text[i:i + n] for i in range(len(text) - n + 1))
+    return grams
+
+
+# 模範解答コーパスから IDF を作って、文字列同士の類似度を計算する
+class Prescorer:
+    def __init__(self, corpus):
+        df = Counter()
+        for doc in corpus:
+            df.update(set(ngrams(doc)))
+        self.n_docs = len(corpus)
+        self.idf = {gram: math.log((1 + self.n_docs) / (1 + count)) + 1 for gram, count in df.items()}
+        # コーパスに無い n-gram の重み
+        self.default_idf = math.log(1 + self.n_docs) + 1
+
+    def vector(self, text):
+        vec = {gram: count * self.idf.get(gram, self.default_idf) for gram, count in ngrams(text).items()}
+        norm = math.sqrt(sum(w * w for w in vec.values()))
+        return {gram: w / norm for gram, w in vec.items()} if norm else {}
+
+    def similarity(self, answer, model_answer):
+        a, b = self.vector(answer), self.vector(model_answer)
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(w * b.get(gram, 0.0) for gram, w in a.items())
+
+    # 類似度から 0〜100 点に換算する（閾値に関係なく常に点数を返す。較正用）
+    def local_score(self, answer, model_answer):
+        if len(normalize(answer)) < MIN_CHARS:
+            return 0
+        return round(min(self.similarity(answer, model_answer), 1.0) * 100)
+
+    # 明らかな回答なら LLM と同じ形式の「点数: / アドバイス:」を返し、判断が難しければ None
+    def prescore(self, answer, model_answer):
+        length = len(normalize(answer))
+        if length == 0:
+            return "点数: 0点\nアドバイス: 回答が入力されていません。模範解答を参考に、要点を文章で書いてみましょう。"
+        if length < MIN_CHARS:
+            return (
+                "点数: 0点\nアドバイス: 回答が短すぎて採点できません。"
+                f"次の模範解答を参考に、要点を具体的に書いてみましょう。\n模範解答: {model_answer}"
+            )
+        similarity = self.similarity(answer, model_answer)
+        score = round(min(similarity, 1.0) * 100)
+        if similarity >= HIGH_THRESHOLD:
+            return f"点数: {score}点\nアドバイス: 模範解答の要点をほぼ押さえられています。この調子で、お客さまに説明できるよう自分の言葉でも整理しておきましょう。"
+        if similarity <= LOW_THRESHOLD:
+            return (
+                f"点数: {score}点\nアドバイス: 模範解答の要点がほとんど含まれていません。"
+                f"次の模範解答を読んで、ポイントを確認しましょう。\n模範解答: {model_answer}"
+            )
+        return None
+
+
+# 問題バンクの模範解答から作った Prescorer を返す（バンクが更新されたら作り直す）
+def get_prescorer(db_path):
+    bank = question_bank.get_bank(db_path)
+    with _lock:
+        cached = _cache.get(db_path)
+        if cached is None or cached[0] is not bank:
+            corpus = [row[2] for row in bank.free_rows or ()]
+            cached = (bank, Prescorer(corpus))
+            _cache[db_path] = cached
+        return cached[1]
+
+
+# 採点キャッシュに残っている LLM の点数とローカルの点数を比較する
+def calibration_report(db_path, cache_path=None):
+    import db
+    import grading_cache
+
+    prescorer = get_prescorer(db_path)
+    with db.read(db_path) as conn:
+        model_answers = dict(conn.execute("SELECT id, model_answer FROM questions"))
+    rows = grading_cache.history(cache_path or grading_cache.CACHE_PATH)
+
+    pairs = []
+    bands = {"low": [], "middle": [], "high": []}
+    for question_id, answer_text, llm_score in rows:
+        model_answer = model_answers.get(question_id)
+        if model_answer is None or llm_score is None:
+            continue
+        similarity = prescorer.similarity(answer_text, model_answer)
+        local = prescorer.local_score(answer_text, model_answer)
+        pairs.append((local, llm_score))
+        if len(normalize(answer_text)) < MIN_CHARS or similarity <= LOW_THRESHOLD:
+            bands["low"].append((local, llm_score))
+        elif similarity >= HIGH_THRESHOLD:
+            bands["high"].append((local, llm_score))
+        else:
+            bands["middle"].append((local, llm_score))
+
+    lines = [f"閾値: LOW={LOW_THRESHOLD} HIGH={HIGH_THRESHOLD} MIN_CHARS={MIN_CHARS}", f"比較件数: {len(pairs)}"]
+    if not pairs:
+        return "\n".join(lines + ["LLM で採点された履歴がありません。"])
+    mae = sum(abs(a - b) for a, b in pairs) / len(pairs)
+    lines.append(f"平均絶対誤差: {mae:.1f}点")
+    lines.append(f"相関係数: {_correlation(pairs):.3f}")
+    for name, items in bands.items():
+        if not items:
+            lines.append(f"{name:>6}: 0件")
+            continue
+        band_mae = sum(abs(a - b) for a, b in items) / len(items)
+        llm_mean = sum(b for _, b in items) / len(items)
+        lines.append(f"{name:>6}: {len(items)}件  LLM平均 {llm_mean:.1f}点  平均絶対誤差 {band_mae:.1f}点")
+    short_circuit = len(bands["low"]) + len(bands["high"])
+    lines.append(f"ローカルで確定できた割合: {short_circuit / len(pairs):.0%}")
+    return "\n".join(lines)
+
+
+def _correlation(pairs):
+    n = len(pairs)
+    mean_a = sum(a for a, _ in pairs) / n
+    mean_b = sum(b for _, b in pairs) / n
+    cov = sum((a - mean_a) * (b - mean_b) for a, b in pairs)
+    var_a = sum((a - mean_a) ** 2 for a, _ in pairs)
+    var_b = sum((b - mean_b) ** 2 for _, b in pairs)
+    if not var_a or not var_b:
+        return 0.0
+    return cov / math.sqrt(var_a * var_b)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "quiz_ver2.db")
+    print(calibration_report(path))
@@ -0,0 +1,230 @@
+
+# 問題バンク: プロセス全体で共有する読み取り専用の問題キャッシュ
+# セッションごとに SQLite へ接続して全件 SELECT する代わりに、
+# プロセス内で一度だけ読み込んだ問題を全セッションで使い回す。
+# 問題の追加・変更は bank_version 表の版数で検知する。版数は quiz / questions のトリガーだけが上げるので、
+# 同じ DB に書き込まれる解答や途中経過（attempts / sessions など）では読み直さない。
+import os
+import random
+import threading
+
+import db
+
+# id の範囲がこれを超えるテーブルはメモリに載せず、SQLite から k 件だけ抽出する
+BANK_MAX_ROWS = int(os.getenv("QUESTION_BANK_MAX_ROWS", "5000"))
+# 抽出で使う列（先頭は必ず id）
+QUIZ_COLUMNS = ("id", "question", "option1", "option2", "option3", "answerIndex")
+FREE_COLUMNS = ("id", "question_text", "model_answer")
+# id の欠番を引いたときに候補を引き直す最大回数
+SAMPLE_MAX_ROUNDS = 8
+
+# 版数を上げるトリガーを張るテーブルと、変わったら読み直す列
+VERSION_TABLES = {"quiz": QUIZ_COLUMNS[1:], "questions": FREE_COLUMNS[1:]}
+
+# DBパスごとのキャッシュと更新監視用の接続
+_banks = {}
+_watchers = {}
+_initialized = set()
+_lock = threading.Lock()
+
+
+# SELECT した行を画面で使う辞書に変換する
+def _quiz_dict(row):
+    return {"id": row[0], "question": row[1], "options": [row[2], row[3], row[4]], "answerIndex": row[5]}
+
+
+def _free_dict(row):
+    return {"id": row[0], "question_text": row[1], "model_answer": row[2]}
+
+
+# 読み込み済みの問題一式（行はタプルで保持してメモリを節約する）
+# 問題数が BANK_MAX_ROWS を超えるテーブルは None のままにして、都度 SQLite から抽出する
+# セッションは問題の ID だけを持ち、表示するときに id 引きの索引（quiz_by_id / free_by_id）から問題を引く。
+class QuestionBank:
+    def __init__(self, quiz_rows, free_rows, version):
+        # quiz_rows / free_rows: QUIZ_COLUMNS / FREE_COLUMNS の順のタプル
+        self.quiz_rows = quiz_rows
+        self.free_rows = free_rows
+        self.quiz_by_id = {row[0]: row for row in quiz_rows} if quiz_rows is not None else None
+        self.free_by_id = {row[0]: row for row in free_rows} if free_rows is not None else None
+        self.version = version
+
+    # 選択式問題を k 問ランダムに取り出す（SQLite には触れない）
+    def sample_quiz(self, k):
+        rows = random.sample(self.quiz_rows, min(k, len(self.quiz_rows)))
+        return [_quiz_dict(row) for row in rows]
+
+    # 自由記述問題を1問ランダムに取り出す
+    def choice_free(self):
+        if not self.free_rows:
+            return None
+        return _free_dict(random.choice(self.free_rows))
+
+
+# id INTEGER PRIMARY KEY を使って、テーブル全体を読まずに k 件を一様に抽出する
+# id の範囲から候補をランダムに引き、実在する行だけを採用する（欠番は棄却）。
+# 欠番が多くて集まらない場合だけ id 列のみを読んで残りを選ぶ。
+def sample_rows(conn, table, columns, k):
+    lo, hi = conn.execute(f"SELECT min(id), max(id) FROM {table}").fetchone()
+    if lo is None or k <= 0:
+        return []
+    select = f"SELECT {', '.join(columns)} FROM {table} WHERE id IN"
+    span = hi - lo + 1
+    found = {}
+    tried = set()
+    for _ in range(SAMPLE_MAX_ROUNDS):
+        need = k - len(found)
+        if need <= 0 or len(tried) >= span:
+            break
+        # 欠番を見込んで多めに候補を引く（range は実体化されないので O(k)）
+        candidates = [i for i in random.sample(range(lo, hi + 1), min(span, need * 2)) if i not in tried]
+        tried.update(candidates)
+        if not candidates:
+            continue
+        placeholders = ",".join("?" * len(candidates))
+        hits = conn.execute(f"{select} ({placeholders})", candidates).fetchall()
+        # 候補は一様に引いているので、多く当たった場合もランダムに間引けば一様性が保たれる
+        for row in random.sample(hits, min(need, len(hits))):
+            found[row[0]] = row
+    need = k - len(found)
+    if need > 0:
+        rest = [row[0] for row in conn.execute(f"SELECT id FROM {table}") if row[0] not in found]
+        picked = random.sample(rest, min(need, len(rest)))
+        if picked:
+            placeholders = ",".join("?" * len(picked))
+            for row in conn.execute(f"{select} ({placeholders})", picked):
+                found[row[0]] = row
+    rows = list(found.values())
+    random.shuffle(rows)
+    return rows
+
+
+def _version_schema(table, columns):
+    return f"""
+CREATE TRIGGER IF NOT EXISTS bank_version_{table}_ai AFTER INSERT ON {table} BEGIN
+    UPDATE bank_version SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS bank_version_{table}_ad AFTER DELETE ON {table} BEGIN
+    UPDATE bank_version SET version = version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS bank_version_{table}_au AFTER UPDATE OF {', '.join(columns)} ON {table} BEGIN
+    UPDATE bank_version SET version = version + 1;
+END;
+"""
+
+
+# 版数の表とトリガーが無ければ作る（import_questions.py や他のプロセスからの変更もトリガーで数える）
+def _ensure_version(db_path):
+    with _lock:
+        if db_path in _initialized:
+            return
+    with db.write(db_path) as conn:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS bank_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)"
+        )
+        conn.execute("INSERT OR IGNORE INTO bank_version (id, version) VALUES (1, 0)")
+        for table, columns in VERSION_TABLES.items():
+            if table in existing:
+                conn.executescript(_version_schema(table, columns))
+        conn.commit()
+    with _lock:
+        _initialized.add(db_path)
+
+
+# 問題の版数を取得する（1行を読むだけなので、呼ぶたびに確認しても軽い）
+def _version(db_path):
+    # プールの接続は他のスレッドが使っていることがあるので、ロックの中では専用の接続で見張る
+    conn = _watchers.get(db_path)
+    if conn is None:
+        conn = db.connect(db_path, readonly=True)
+        _watchers[db_path] = conn
+    return conn.execute("SELECT version FROM bank_version").fetchone()[0]
+
+
+# テーブルが小さければ全件をタプルで読み込む（大きければ None）
+def _load_table(conn, table, columns):
+    lo, hi = conn.execute(f"SELECT min(id), max(id) FROM {table}").fetchone()
+    if lo is not None and hi - lo + 1 > BANK_MAX_ROWS:
+        return None
+    return tuple(conn.execute(f"SELECT {', '.join(columns)} FROM {table}"))
+
+
+# SQLite から問題を読み込んでバンクを作る
+def _load(db_path, version):
+    with db.read(db_path) as conn:
+        quiz_rows = _load_table(conn, "quiz", QUIZ_COLUMNS)
+        free_rows = _load_table(conn, "questions", FREE_COLUMNS)
+    return QuestionBank(quiz_rows, free_rows, version)
+
+
+# 最新の問題バンクを返す（問題が追加・変更されていれば自動で読み直す）
+def get_bank(db_path):
+    _ensure_version(db_path)
+    with _lock:
+        version = _version(db_path)
+        bank = _banks.get(db_path)
+        if bank is None or bank.version != version:
+            bank = _load(db_path, version)
+            _banks[db_path] = bank
+        return bank
+
+
+# 大きなテーブルから k 件だけを SQLite で抽出する
+def _sample_from_db(db_path, table, columns, k):
+    with db.read(db_path) as conn:
+        return sample_rows(conn, table, columns, k)
+
+
+# 選択式問題を k 問ランダムに取得する
+def sample_quiz(db_path, k):
+    bank = get_bank(db_path)
+    if bank.quiz_rows is not None:
+        return bank.sample_quiz(k)
+    return [_quiz_dict(row) for row in _sample_from_db(db_path, "quiz", QUIZ_COLUMNS, k)]
+
+
+# 指定した id の選択式問題を取得する（id の順番を保つ、存在しない id は除く）
+def get_quiz_by_ids(db_path, ids):
+    if not ids:
+        return []
+    bank = get_bank(db_path)
+    if bank.quiz_by_id is not None:
+        rows = bank.quiz_by_id
+    else:
+        with db.read(db_path) as conn:
+            placeholders = ",".join("?" * len(ids))
+            rows = {
+                row[0]: row for row in conn.execute(
+                    f"SELECT {', '.join(QUIZ_COLUMNS)} FROM quiz WHERE id IN ({placeholders})", list(ids)
+                )
+            }
+    return [_quiz_dict(rows[i]) for i in ids if i in rows]
+
+
+# 指定した id の選択式問題を1問取得する（無ければ None）
+def get_quiz(db_path, question_id):
+    questions = get_quiz_by_ids(db_path, [question_id])
+    return questions[0] if questions else None
+
+
+# 指定した id の自由記述問題を取得する（無ければ None）
+def get_free(db_path, question_id):
+    bank = get_bank(db_path)
+    if bank.free_by_id is not None:
+        row = bank.free_by_id.get(question_id)
+    else:
+        with db.read(db_path) as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(FREE_COLUMNS)} FROM questions WHERE id = ?", (question_id,)
+            ).fetchone()
+    return _free_dict(row) if row is not None else None
+
+
+# 自由記述問題を1問ランダムに取得する
+def random_free_question(db_path):
+    bank = get_bank(db_path)
+    if bank.free_rows is not None:
+        return bank.choice_free()
+    rows = _sample_from_db(db_path, "questions", FREE_COLUMNS, 1)
+    return _free_dict(rows[0]) if rows else None
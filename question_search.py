@@ -0,0 +1,212 @@
+
+# 問題の全文検索: quiz（問題文・選択肢）と questions（問題文・模範解答）に SQLite FTS5 の索引を張る
+# 日本語は単語の区切りが無いので、3文字ずつに区切る trigram トークナイザを使う（部分一致で探せる）。
+# 索引は本体のテーブルを参照する external content 方式で、INSERT / UPDATE / DELETE のトリガーが
+# 1行ずつ更新する（一括取り込み import_questions.py や他のプロセスからの追加もそのまま反映される）。
+# 作り直し（rebuild）は索引を初めて作るときだけ。
+#
+#   python question_search.py --db quiz_ver2.db 給湯器 交換       # 検索（空白区切りは AND）
+#   python question_search.py --db quiz_ver2.db --similar "給湯器の交換にかかる時間は？"
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import db
+import import_questions
+
+# 索引を張るテーブル: テーブル名 → (索引のテーブル名, 索引に入れる列)
+FTS_TABLES = {
+    "quiz": ("quiz_fts", ("question", "option1", "option2", "option3")),
+    "questions": ("questions_fts", ("question_text", "model_answer")),
+}
+# 似た問題を探すときに比べる列（問題文）
+TEXT_COLUMNS = {"quiz": "question", "questions": "question_text"}
+# trigram の一致率（Jaccard 係数）がこれ以上なら「似た問題」とみなす
+SIMILAR_THRESHOLD = float(os.getenv("QUESTION_SIMILAR_THRESHOLD", "0.5"))
+# 似た問題の候補は「問題文から選んだ SIMILAR_GROUP_SIZE 個の trigram をすべて含む」という条件を
+# SIMILAR_GROUPS 通り OR でつないで索引から引く（似た文章ならどれかの組はまるごと含む）
+SIMILAR_GROUPS = 6
+SIMILAR_GROUP_SIZE = 4
+SIMILAR_CANDIDATES = 500
+
+_lock = threading.Lock()
+_initialized = set()
+
+
+def _schema(table):
+    fts, columns = FTS_TABLES[table]
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    return f"""
+CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN
+    INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});
+END;
+CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN
+    INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});
+END;
+CREATE TRIGGER {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN
+    INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});
+    INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});
+END;
+"""
+
+
+# 索引とトリガーが無ければ作る（既存の行はこのときだけまとめて索引に入れる）
+def ensure_index(db_path):
+    with _lock:
+        if db_path in _initialized:
+            return
+    with db.write(db_path) as conn:
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table, (fts, _) in FTS_TABLES.items():
+            if table in existing and fts not in existing:
+                conn.executescript(_schema(table))
+                conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+                conn.commit()
+    with _lock:
+        _initialized.add(db_path)
+
+
+# 検索語を FTS5 の MATCH 式にする（語ごとにフレーズとして囲み、AND でつなぐ）
+# trigram は3文字未満の語を索引で引けないので、そうした語は LIKE で絞り込む（索引を使わない走査になる）
+def _query(text):
+    terms = text.split()
+    phrases = ['"' + t.replace('"', '""') + '"' for t in terms if len(t) >= 3]
+    short = [t for t in terms if len(t) < 3]
+    return " AND ".join(phrases), short
+
+
+# 問題を検索する。table は "quiz" / "questions"、order は "new"（新しい順）/ "rank"（関連度順）
+# 関連度順は一致した行すべての点数を計算するので、よく出てくる語では遅くなる（10万問で数十〜百 ms）。
+# 新しい順は索引を rowid の降順にたどって limit 件で止まるので、語によらず数 ms で返る。
+# 一致した部分を ** で囲んだ列（highlight）も返す
+def search(db_path, text, table, limit=50, order="new"):
+    ensure_index(db_path)
+    fts, columns = FTS_TABLES[table]
+    match, short = _query(text)
+    if not match and not short:
+        return []
+    where, params = [], []
+    if match:
+        where.append(f"{fts} MATCH ?")
+        params.append(match)
+    for term in short:
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        where.append("(" + " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in columns) + ")")
+        params.extend([f"%{escaped}%"] * len(columns))
+    highlights = ", ".join(f"highlight({fts}, {i}, '**', '**')" for i in range(len(columns)))
+    sql = (
+        f"SELECT rowid, {', '.join(columns)}, {highlights} FROM {fts}"
+        f" WHERE {' AND '.join(where)} ORDER BY {'rank' if match and order == 'rank' else 'rowid DESC'} LIMIT ?"
+    )
+    with db.read(db_path) as conn:
+        rows = conn.execute(sql, params + [limit]).fetchall()
+    n = len(columns)
+    return [
+        dict(id=row[0], **dict(zip(columns, row[1:n + 1])), highlight=dict(zip(columns, row[n + 1:])))
+        for row in rows
+    ]
+
+
+def _normalize(text):
+    return "".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def trigrams(text):
+    text = _normalize(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# trigram の一致率（Jaccard 係数）
+def similarity(a, b):
+    ta, tb = trigrams(a), trigrams(b)
+    if not ta or not tb:
+        return 1.0 if _normalize(a) == _normalize(b) else 0.0
+    return len(ta & tb) / len(ta | tb)
+
+
+# 登録しようとしている問題文に似た問題を探す（似ている順）
+# 索引で候補を絞り込み、候補だけを Python で比べる。
+def similar_questions(db_path, text, table, threshold=SIMILAR_THRESHOLD, limit=5):
+    ensure_index(db_path)
+    fts, _ = FTS_TABLES[table]
+    column = TEXT_COLUMNS[table]
+    # 索引と同じく NFKC をかけない文字列から、出現順に trigram を取る
+    grams = list(dict.fromkeys(
+        text[i:i + 3] for i in range(len(text) - 2) if not any(ch.isspace() for ch in text[i:i + 3])
+    ))
+    if not grams:
+        return []
+    # 文章全体に散らばるよう、SIMILAR_GROUPS 個おきに trigram を取って組にする
+    size = max(1, min(SIMILAR_GROUP_SIZE, len(grams) // SIMILAR_GROUPS))
+    groups = [grams[i::SIMILAR_GROUPS][:size] for i in range(SIMILAR_GROUPS)]
+    match = " OR ".join(
+        "(" + " AND ".join('"' + t.replace('"', '""') + '"' for t in group) + ")" for group in groups if group
+    )
+    with db.read(db_path) as conn:
+        candidates = conn.execute(
+            f"SELECT rowid, {column} FROM {fts} WHERE {column} MATCH ? LIMIT ?", (match, SIMILAR_CANDIDATES)
+        ).fetchall()
+    scored = [
+        {"id": row[0], column: row[1], "similarity": similarity(text, row[1])}
+        for row in candidates
+    ]
+    scored = [s for s in scored if s["similarity"] >= threshold]
+    scored.sort(key=lambda s: s["similarity"], reverse=True)
+    return scored[:limit]
+
+
+# 問題を1件登録して ID を返す（検証と重複の判定は一括取り込みの import_questions と同じ）
+# 不正な内容や、まったく同じ問題が登録済みのときは import_questions.InvalidRow
+# 索引はトリガーで更新されるので、登録した問題はすぐに検索できる
+def add_question(db_path, table, record):
+    ensure_index(db_path)
+    values = import_questions.validate(table, record)
+    columns = import_questions.COLUMNS[table] + ("content_hash",)
+    with db.write(db_path) as conn:
+        if "content_hash" not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            import_questions.ensure_hash_column(conn, table)
+        try:
+            cursor = conn.execute(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values
+            )
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise import_questions.InvalidRow("同じ内容の問題がすでに登録されています")
+        conn.commit()
+    return cursor.lastrowid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="問題を全文検索する")
+    parser.add_argument("text", nargs="+", help="検索語（空白区切りは AND）")
+    parser.add_argument("--db", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "quiz_ver2.db"))
+    parser.add_argument("--table", choices=sorted(FTS_TABLES), default="questions")
+    parser.add_argument("--similar", action="store_true", help="検索語を問題文として、似た問題を探す")
+    parser.add_argument("--rank", action="store_true", help="関連度順に並べる（省略時は新しい順）")
+    args = parser.parse_args(argv)
+    text = " ".join(args.text)
+    try:
+        ensure_index(args.db)
+    except sqlite3.OperationalError as e:
+        parser.error(f"索引を作れませんでした（SQLite {sqlite3.sqlite_version}、FTS5 の trigram は 3.34 以降）: {e}")
+    start = time.perf_counter()
+    if args.similar:
+        results = similar_questions(args.db, text, args.table)
+    else:
+        results = search(args.db, text, args.table, order="rank" if args.rank else "new")
+    elapsed = (time.perf_counter() - start) * 1000
+    column = TEXT_COLUMNS[args.table]
+    for row in results:
+        extra = f"  ({row['similarity']:.2f})" if args.similar else ""
+        print(f"{row['id']:>7}  {row[column]}{extra}")
+    print(f"{len(results)} 件 / {elapsed:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
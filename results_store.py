@@ -0,0 +1,264 @@
+
+# 受講結果の保存: 受講（attempts）と解答（answers）を quiz / questions と同じ DB に記録する
+# 画面のスレッドはキューに積むだけで、書き込みは DB ごとに1本のバックグラウンドスレッドが
+# まとめて（1トランザクションで）行う。WAL モードなので書き込み中も問題の読み込みは止まらない。
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import adaptive
+import analytics
+import db
+
+logger = logging.getLogger(__name__)
+
+# 1回のトランザクションでまとめて書き込む最大件数
+BATCH_SIZE = 200
+# 最初の1件を受け取ってから、後続をまとめるために待つ最大時間（秒）
+BATCH_INTERVAL = 0.2
+# 書き込みに失敗したとき（他のレプリカが書き込み中で database is locked など）にやり直す回数と、最初の待ち時間（秒）
+# 待ち時間はやり直すたびに倍にする。まとめた書き込みがやり直しても失敗したら、1件ずつ書き込んで失敗した行だけを除く
+WRITE_RETRIES = 5
+RETRY_DELAY = 0.1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    trainee TEXT,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    quiz_score INTEGER,
+    free_score INTEGER,
+    total_score INTEGER,
+    max_score INTEGER,
+    passed INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_tenant_started ON attempts(tenant, started_at);
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY,
+    attempt_id TEXT NOT NULL REFERENCES attempts(id),
+    tenant TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    question_id INTEGER NOT NULL,
+    selected_index INTEGER,
+    correct INTEGER,
+    answer_text TEXT,
+    score INTEGER,
+    answered_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_answers_attempt ON answers(attempt_id);
+CREATE INDEX IF NOT EXISTS idx_answers_tenant_answered ON answers(tenant, answered_at);
+"""
+
+_SQL = {
+    "attempt": "INSERT OR IGNORE INTO attempts (id, tenant, trainee, started_at) VALUES (?, ?, ?, ?)",
+    "answer": (
+        "INSERT INTO answers (attempt_id, tenant, kind, question_id, selected_index, correct, answer_text, score, answered_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    ),
+    "finish": (
+        "UPDATE attempts SET finished_at = ?, quiz_score = ?, free_score = ?, total_score = ?, max_score = ?, passed = ?"
+        " WHERE id = ?"
+    ),
+}
+# 後から追加した attempts の列（既存の DB には _connect で追加する）
+_ADDED_COLUMNS = {"max_score": "INTEGER", "passed": "INTEGER"}
+
+_writers = {}
+_lock = threading.Lock()
+
+
+# DB 1つにつき1本の書き込みスレッド
+class _Writer:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.queue = queue.Queue()
+        self.stats = {
+            "queued": 0, "written": 0, "batches": 0, "errors": 0, "retries": 0, "dropped": 0, "restarts": 0,
+            "last_batch_ms": 0.0, "write_seconds": 0.0,
+        }
+        self.thread = None
+        self.start()
+
+    # 書き込みスレッドを起動する（止まっていたら積まれたままの分から再開する）
+    def start(self):
+        if self.thread is not None:
+            self.stats["restarts"] += 1
+        self.thread = threading.Thread(target=self._run, name="results-writer", daemon=True)
+        self.thread.start()
+
+    def _connect(self):
+        # 書き込みはこのスレッドだけが行うので、プールを使わず専用の接続を持つ
+        conn = db.connect(self.db_path)
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(attempts)")}
+        for column, kind in _ADDED_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE attempts ADD COLUMN {column} {kind}")
+        conn.commit()
+        conn.executescript(adaptive.SCHEMA)
+        conn.executescript(analytics.SCHEMA)
+        try:
+            analytics.backfill(conn)
+        except sqlite3.Error:
+            # 分析用の集計ができなくても、受講結果の記録は止めない
+            logger.exception("failed to backfill analytics rollups in %s", self.db_path)
+        return conn
+
+    # DB に接続できるまで待つ（その間に積まれた分はキューに残る）
+    def _connect_with_retry(self):
+        delay = RETRY_DELAY
+        while True:
+            try:
+                return self._connect()
+            except sqlite3.Error:
+                logger.exception("failed to open %s for results, retrying in %.1fs", self.db_path, delay)
+                self.stats["errors"] += 1
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _run(self):
+        conn = self._connect_with_retry()
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + BATCH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(conn, batch)
+            except Exception:
+                # 想定外のエラーでもスレッドは止めない（flush が戻れるように task_done は必ず呼ぶ）
+                logger.exception("results writer failed on %d rows in %s", len(batch), self.db_path)
+                self.stats["errors"] += 1
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    # 1トランザクションで書き込む
+    def _execute(self, conn, batch):
+        with conn:
+            # 受講の開始 → 解答 → 受講の終了の順に積まれているので、その順で実行する
+            for kind, params in batch:
+                # 受講の終了は、更新前の状態（終了済みかどうか）を見て分析用の集計テーブルに足し込む
+                if kind == "finish":
+                    analytics.update_finish(conn, params)
+                conn.execute(_SQL[kind], params)
+                if kind == "answer":
+                    analytics.update_answer(conn, params)
+                    # 選択式の解答は出題用の集計テーブル（難易度・習熟度）にも反映する
+                    if params[2] == "choice":
+                        self._update_stats(conn, params)
+
+    # ロックの競合などの失敗は待ち時間を倍にしながらやり直す（最後の失敗はそのまま送出する）
+    def _execute_with_retry(self, conn, batch):
+        delay = RETRY_DELAY
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                self._execute(conn, batch)
+                return
+            except sqlite3.OperationalError:
+                if attempt == WRITE_RETRIES:
+                    raise
+                self.stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def _write(self, conn, batch):
+        start = time.perf_counter()
+        dropped = 0
+        try:
+            self._execute_with_retry(conn, batch)
+        except sqlite3.Error:
+            # まとめては書き込めなかった: 1件ずつ書き込んで、失敗した行だけを除く（内容をログに残す）
+            logger.exception("failed to write %d result rows to %s, retrying row by row", len(batch), self.db_path)
+            self.stats["errors"] += 1
+            for row in batch:
+                try:
+                    self._execute_with_retry(conn, [row])
+                except sqlite3.Error:
+                    logger.exception("dropped a result row for %s: %r", self.db_path, row)
+                    dropped += 1
+        self.stats["dropped"] += dropped
+        self.stats["written"] += len(batch) - dropped
+        self.stats["batches"] += 1
+        elapsed = time.perf_counter() - start
+        self.stats["last_batch_ms"] = elapsed * 1000
+        self.stats["write_seconds"] += elapsed
+
+    def _update_stats(self, conn, params):
+        attempt_id, tenant, _, question_id, _, correct = params[:6]
+        row = conn.execute("SELECT trainee FROM attempts WHERE id = ?", (attempt_id,)).fetchone()
+        adaptive.update_stats(conn, tenant, row[0] if row else None, question_id, correct)
+
+    def put(self, kind, params):
+        self.stats["queued"] += 1
+        self.queue.put((kind, params))
+
+
+def _writer(db_path):
+    with _lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _Writer(db_path)
+            _writers[db_path] = writer
+        elif not writer.thread.is_alive():
+            # 書き込みスレッドが止まっていたら起動し直す（積まれた分は失われない）
+            logger.error("results writer for %s stopped, restarting", db_path)
+            writer.start()
+        return writer
+
+
+# 受講を開始する（ID はここで発行するので DB への書き込みを待たない）
+def start_attempt(db_path, tenant, trainee=None):
+    attempt_id = uuid.uuid4().hex
+    _writer(db_path).put("attempt", (attempt_id, tenant or "", trainee, time.time()))
+    return attempt_id
+
+
+# 解答を1件記録する（kind: "choice" = 選択式 / "free" = 自由記述）
+def record_answer(db_path, attempt_id, tenant, kind, question_id,
+                  selected_index=None, correct=None, answer_text=None, score=None):
+    _writer(db_path).put(
+        "answer",
+        (attempt_id, tenant or "", kind, question_id, selected_index,
+         None if correct is None else int(correct), answer_text, score, time.time()),
+    )
+
+
+# 受講を終了して得点を記録する（満点と合格点は試験ごとの設定。app_config の max_score / pass_score）
+def finish_attempt(db_path, attempt_id, quiz_score, free_score, max_score, pass_score):
+    total_score = quiz_score + free_score
+    _writer(db_path).put(
+        "finish",
+        (time.time(), quiz_score, free_score, total_score, max_score, int(total_score >= pass_score), attempt_id),
+    )
+
+
+# キューに積まれた分がすべて書き込まれるまで待つ
+def flush():
+    with _lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        if writer.thread.is_alive():
+            writer.queue.join()
+
+
+# 書き込みスレッドの状況（キューの長さ・書き込んだ件数・バッチ数など）
+def stats():
+    with _lock:
+        writers = dict(_writers)
+    return {path: dict(writer.stats, pending=writer.queue.qsize()) for path, writer in writers.items()}
+
+
+atexit.register(flush)
@@ -0,0 +1,131 @@
+
+# 出題セットの作り置き: 1回の受講で出す問題一式（選択式の問題＋自由記述1問の ID、出題順はシャッフル済み）を
+# バックグラウンドのスレッドがあらかじめ作って、DB と問題数ごとのリングバッファ（最大 PACK_BUFFER_SIZE 個）にためておく。
+# 「トレーニングを始める」を押したときは1つ取り出すだけなので、問題の抽出を待たずに始められる。
+# 取り出されるとスレッドが補充する。問題が追加・変更されたら作り置きは捨てて作り直す。
+# 作り置きを使うのは名前の無い受講者だけ（名前のある受講者は adaptive で習熟度に合わせてその場で選ぶ）。
+import collections
+import logging
+import os
+import threading
+import time
+
+import question_bank
+
+logger = logging.getLogger(__name__)
+
+# 作り置きしておく出題セットの数
+PACK_BUFFER_SIZE = int(os.getenv("SESSION_PACK_BUFFER", "16"))
+# 1セットの選択式問題の数（試験ごとの問題数は app_config の quiz_count）
+QUIZ_COUNT = 8
+# 問題の更新を確認する間隔（秒）
+REFRESH_INTERVAL = float(os.getenv("SESSION_PACK_REFRESH", "30"))
+# これより古い出題セットは使わない（秒）。問題の追加・変更は作り置きを捨てて反映するので、念のための上限
+PACK_MAX_AGE = float(os.getenv("SESSION_PACK_MAX_AGE", "600"))
+
+_producers = {}
+_lock = threading.Lock()
+
+
+# 出題セットを1つ作る（名前のない受講者向け: 能力も習熟度も無いので、選択式は一様にランダムに選ぶ）
+# 問題の中身は持たず ID だけを持つ（表示するときに question_bank から引く）
+def build_pack(db_path, quiz_count=QUIZ_COUNT):
+    free = question_bank.random_free_question(db_path)
+    return {
+        "quiz": tuple(q["id"] for q in question_bank.sample_quiz(db_path, quiz_count)),
+        "free": free["id"] if free is not None else None,
+        "created": time.time(),
+    }
+
+
+# DB と問題数の組み合わせ1つにつき1本の作り置きスレッド
+class _Producer:
+    def __init__(self, db_path, quiz_count):
+        self.db_path = db_path
+        self.quiz_count = quiz_count
+        self.packs = collections.deque(maxlen=PACK_BUFFER_SIZE)
+        self.cond = threading.Condition()
+        self.bank = None
+        self.stats = {"produced": 0, "served": 0, "misses": 0, "discarded": 0, "errors": 0, "last_build_ms": 0.0}
+        self.thread = threading.Thread(target=self._run, name="session-packs", daemon=True)
+        self.thread.start()
+
+    # 問題が変わっていたら作り置きを捨てる（問題バンクは問題が追加・変更されたときだけ読み直される）
+    def _check_bank(self):
+        bank = question_bank.get_bank(self.db_path)
+        previous, self.bank = self.bank, bank
+        if previous is not None and previous is not bank:
+            with self.cond:
+                self.stats["discarded"] += len(self.packs)
+                self.packs.clear()
+
+    def _fill(self):
+        while True:
+            with self.cond:
+                if len(self.packs) >= PACK_BUFFER_SIZE:
+                    return
+            start = time.perf_counter()
+            pack = build_pack(self.db_path, self.quiz_count)
+            with self.cond:
+                self.packs.append(pack)
+                self.stats["produced"] += 1
+                self.stats["last_build_ms"] = (time.perf_counter() - start) * 1000
+
+    def _run(self):
+        while True:
+            try:
+                self._check_bank()
+                self._fill()
+            except Exception:
+                logger.exception("failed to build session packs for %s", self.db_path)
+                self.stats["errors"] += 1
+            # 取り出されるか REFRESH_INTERVAL 秒たつまで待つ
+            with self.cond:
+                self.cond.wait(REFRESH_INTERVAL)
+
+    # 作り置きを1つ取り出す（無ければ None）
+    def pop(self):
+        with self.cond:
+            while self.packs:
+                pack = self.packs.popleft()
+                if time.time() - pack["created"] <= PACK_MAX_AGE:
+                    self.stats["served"] += 1
+                    self.cond.notify()
+                    return pack
+                self.stats["discarded"] += 1
+            self.stats["misses"] += 1
+            self.cond.notify()
+            return None
+
+
+def _producer(db_path, quiz_count):
+    key = (db_path, quiz_count)
+    with _lock:
+        producer = _producers.get(key)
+        if producer is None:
+            producer = _Producer(db_path, quiz_count)
+            _producers[key] = producer
+        return producer
+
+
+# 作り置きを始める（アプリの読み込み時に呼んでおけば、最初の受講者が来る前にたまる）
+def start(db_path, quiz_count=QUIZ_COUNT):
+    _producer(db_path, quiz_count)
+
+
+# 出題セットを1つ取り出す。作り置きが尽きていたらその場で作る
+def pop(db_path, quiz_count=QUIZ_COUNT):
+    pack = _producer(db_path, quiz_count).pop()
+    if pack is None:
+        pack = build_pack(db_path, quiz_count)
+    return pack
+
+
+# 作り置きの状況（たまっている数・作った数・取り出した数・作り置きが無かった回数など）
+def stats():
+    with _lock:
+        producers = dict(_producers)
+    return {
+        f"{path} ({count}問)": dict(producer.stats, ready=len(producer.packs))
+        for (path, count), producer in producers.items()
+    }
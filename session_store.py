@@ -0,0 +1,160 @@
+
+# 受講の途中経過の保存: ブラウザの再読み込みやアプリの再起動（別のレプリカへの切り替え）で
+# 受講が最初からやり直しにならないように、進み具合を quiz / questions と同じ DB に保存する。
+# 受講を始めたときに再開用のトークンを発行して URL（?resume=...）に載せ、解答や採点のたびに
+# 変わった列だけを UPDATE する。再接続したときはトークンで1行引くだけで元の状態に戻せる。
+# DB は WAL モードなので、同じボリュームを共有する複数のレプリカから読み書きできる
+# （SQLite のロックが効くファイルシステムであること。NFS などでは使えない）。
+import os
+import secrets
+import threading
+import time
+import uuid
+
+import db
+
+# 保存した途中経過の有効期限（秒）: 既定は1日
+RESUME_TTL = float(os.getenv("SESSION_RESUME_TTL", str(24 * 3600)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    attempt_id TEXT NOT NULL,
+    branch TEXT NOT NULL,
+    trainee TEXT,
+    quiz_ids TEXT NOT NULL,
+    free_question_id INTEGER,
+    current_question INTEGER NOT NULL DEFAULT 0,
+    correct_bits INTEGER NOT NULL DEFAULT 0,
+    answered INTEGER NOT NULL DEFAULT 0,
+    pending_grade INTEGER,
+    grading_job TEXT,
+    grading_answer TEXT,
+    openai_score INTEGER NOT NULL DEFAULT 0,
+    openai_done INTEGER NOT NULL DEFAULT 0,
+    feedback TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at);
+"""
+
+# 保存する session_state のキー（列名と同じ）
+FIELDS = (
+    "attempt_id", "branch", "trainee", "quiz_ids", "free_question_id", "current_question", "correct_bits",
+    "answered", "pending_grade", "grading_job", "grading_answer", "openai_score", "openai_done", "feedback",
+)
+_BOOLEANS = ("answered", "openai_done")
+
+# このプロセスの ID（採点ジョブの ID はプロセスごとの連番なので、どのプロセスのジョブかを区別する）
+INSTANCE = uuid.uuid4().hex
+
+_lock = threading.Lock()
+_initialized = set()
+_stats = {"created": 0, "saved": 0, "restored": 0, "expired": 0, "purged": 0, "last_load_ms": 0.0}
+
+
+def _count(key, amount=1):
+    with _lock:
+        _stats[key] += amount
+
+
+def _ensure_schema(db_path):
+    with _lock:
+        if db_path in _initialized:
+            return
+    with db.write(db_path) as conn:
+        conn.executescript(SCHEMA)
+        conn.commit()
+    with _lock:
+        _initialized.add(db_path)
+
+
+# session_state の値を列の値にする
+def _encode(key, value):
+    if key == "quiz_ids":
+        return ",".join(str(i) for i in value)
+    if key == "grading_job":
+        return f"{INSTANCE}:{value}" if value is not None else None
+    if key in _BOOLEANS:
+        return int(bool(value))
+    return value
+
+
+# 列の値を session_state の値に戻す
+# 採点ジョブは、同じプロセスで動いているものだけを返す（他のプロセスのジョブは引き継げない）
+def _decode(key, value):
+    if key == "quiz_ids":
+        return tuple(int(i) for i in value.split(",") if i)
+    if key == "grading_job":
+        instance, _, job_id = (value or "").partition(":")
+        return int(job_id) if instance == INSTANCE else None
+    if key in _BOOLEANS:
+        return bool(value)
+    return value
+
+
+# 受講の途中経過を保存し始めて、再開用のトークンを返す（期限切れの途中経過もここで消す）
+def create(db_path, state):
+    _ensure_schema(db_path)
+    token = secrets.token_urlsafe(16)
+    now = time.time()
+    with db.write(db_path) as conn:
+        purged = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (now - RESUME_TTL,)).rowcount
+        conn.execute(
+            f"INSERT INTO sessions (token, {', '.join(FIELDS)}, updated_at)"
+            f" VALUES (?, {', '.join('?' * len(FIELDS))}, ?)",
+            [token] + [_encode(key, state.get(key)) for key in FIELDS] + [now],
+        )
+        conn.commit()
+    _count("created")
+    _count("purged", purged)
+    return token
+
+
+# 変わった値だけを書き込む（changes: session_state のキー → 値）
+def save(db_path, token, changes):
+    if not token or not changes:
+        return
+    _ensure_schema(db_path)
+    keys = [key for key in changes if key in FIELDS]
+    with db.write(db_path) as conn:
+        conn.execute(
+            f"UPDATE sessions SET {', '.join(f'{key} = ?' for key in keys)}, updated_at = ? WHERE token = ?",
+            [_encode(key, changes[key]) for key in keys] + [time.time(), token],
+        )
+        conn.commit()
+    _count("saved")
+
+
+# 保存した途中経過を読み込む（無いか期限切れなら None）
+def load(db_path, token):
+    _ensure_schema(db_path)
+    start = time.perf_counter()
+    with db.read(db_path) as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(FIELDS)}, updated_at FROM sessions WHERE token = ?", (token,)
+        ).fetchone()
+    with _lock:
+        _stats["last_load_ms"] = (time.perf_counter() - start) * 1000
+    if row is None:
+        return None
+    if row[-1] < time.time() - RESUME_TTL:
+        _count("expired")
+        return None
+    _count("restored")
+    return {key: _decode(key, value) for key, value in zip(FIELDS, row)}
+
+
+# 受講を終えてトップページに戻るときに消す
+def delete(db_path, token):
+    if not token:
+        return
+    _ensure_schema(db_path)
+    with db.write(db_path) as conn:
+        conn.execute("DELETE FROM sessions WHERE token = ?", (token,))
+        conn.commit()
+
+
+def stats():
+    with _lock:
+        return dict(_stats)